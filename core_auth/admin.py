@@ -1,16 +1,24 @@
 from django.contrib import admin
 from .models import User, Role, BusinessElement, AccessRule
+from .pagination import EstimatedCountPaginator
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ['email', 'is_active', 'is_staff', 'is_superuser']
-    search_fields = ['email']
+    list_display = ['email', 'role', 'is_active', 'is_staff', 'is_superuser']
+    list_select_related = ['role']
+    # Точное совпадение без учета регистра использует индекс UPPER(email);
+    # поиск по подстроке читал бы всю таблицу.
+    search_fields = ['=email']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_filter = ['is_active', 'is_staff', 'is_superuser']
+    filter_horizontal = ['roles']
 
 @admin.register(Role)
 class RoleAdmin(admin.ModelAdmin):
     list_display = ['name', 'description']
     search_fields = ['name']
+    filter_horizontal = ['parents']
 
 @admin.register(BusinessElement)
 class BusinessElementAdmin(admin.ModelAdmin):
@@ -20,4 +28,5 @@ class BusinessElementAdmin(admin.ModelAdmin):
 @admin.register(AccessRule)
 class AccessRuleAdmin(admin.ModelAdmin):
     list_display = ['role', 'business_element', 'read_permission', 'create_permission', 'update_permission', 'delete_permission']
-    list_filter = ['role', 'business_element']
\ No newline at end of file
+    list_filter = ['role', 'business_element']
+    list_select_related = ['role', 'business_element']
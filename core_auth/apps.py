@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CoreAuthConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core_auth'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .keys import install_token_backend
+        install_token_backend()
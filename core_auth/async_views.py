@@ -0,0 +1,119 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+
+from .conf import auth_settings
+from .hashing import PoolSaturated, hashing_pool
+from .last_login import record_login
+from .metrics import login_seconds, timed_response
+from .models import User
+from .serializers import UserLoginSerializer, UserRegistrationSerializer
+from .tokens import RefreshToken
+
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+    return request.POST
+
+
+def _saturated_response():
+    response = JsonResponse(
+        {"error": "Too many concurrent password operations, retry later"},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+    response['Retry-After'] = str(auth_settings.PASSWORD_HASHING_RETRY_AFTER)
+    return response
+
+
+def _issue_tokens(user):
+    refresh = RefreshToken.for_user(user)
+    return str(refresh), str(refresh.access_token)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncUserRegistrationView(View):
+    """
+    Асинхронная регистрация для ASGI: хеширование пароля выполняется в пуле
+    процессов hashing_pool, а не в потоке обработки запросов.
+    """
+
+    async def post(self, request):
+        data = _request_data(request)
+        if data is None:
+            return JsonResponse({"detail": "JSON parse error"}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = UserRegistrationSerializer(data=data)
+        if not await sync_to_async(serializer.is_valid)():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        validated_data = dict(serializer.validated_data)
+        validated_data.pop('password2')
+        password = validated_data.pop('password')
+        try:
+            password_hash = await hashing_pool.make_password(password)
+        except PoolSaturated:
+            return _saturated_response()
+
+        user = await sync_to_async(User.objects.create_user_with_hash)(password_hash=password_hash, **validated_data)
+        refresh, access = await sync_to_async(_issue_tokens)(user)
+        return JsonResponse({
+            'user_id': user.pk,
+            'email': user.email,
+            'refresh': refresh,
+            'access': access,
+        }, status=status.HTTP_201_CREATED)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncUserLoginView(View):
+    """
+    Асинхронный вход для ASGI: проверка пароля выполняется в пуле процессов
+    hashing_pool. Повторяет поведение authenticate() с ModelBackend, включая
+    холостое хеширование для несуществующего email и пересчет устаревшего хеша.
+    """
+
+    @timed_response(login_seconds)
+    async def post(self, request):
+        data = _request_data(request)
+        if data is None:
+            return JsonResponse({"detail": "JSON parse error"}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = UserLoginSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        email = serializer.validated_data.get('email')
+        password = serializer.validated_data.get('password')
+
+        try:
+            user = await User.objects.aget(email=email)
+        except User.DoesNotExist:
+            user = None
+
+        try:
+            if user is None:
+                # Выравниваем время ответа с существующим пользователем.
+                await hashing_pool.make_password(password)
+                is_correct, must_update = False, False
+            else:
+                is_correct, must_update = await hashing_pool.verify_password(password, user.password)
+                if is_correct and must_update:
+                    user.password = await hashing_pool.make_password(password)
+                    await user.asave(update_fields=['password'])
+        except PoolSaturated:
+            return _saturated_response()
+
+        if not is_correct or not user.is_active:
+            return JsonResponse({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
+
+        await sync_to_async(record_login)(user)
+        refresh, access = await sync_to_async(_issue_tokens)(user)
+        return JsonResponse({"refresh": refresh, "access": access})
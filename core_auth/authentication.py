@@ -0,0 +1,126 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .invalidation import rbac_generation
+from .models import User
+from .tokens import (
+    ROLE_CLAIM, ROLE_VERSION_CLAIM, ROLES_CLAIM, STAFF_CLAIM, SUPERUSER_CLAIM, USER_CLAIMS, is_token_epoch_current,
+)
+from .user_state import user_state_cache
+
+
+class TokenUser:
+    """
+    Легковесный пользователь, собранный из claims access-токена.
+
+    Поля id, role_id, role_ids, is_superuser и is_staff берутся из токена. При обращении
+    к любому другому атрибуту (email, save(), _meta и т.д.) один раз загружается
+    полная модель User, и обращение передается ей.
+    """
+    __slots__ = ('id', 'role_id', 'role_ids', 'is_superuser', 'is_staff', 'token', '_user')
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, token, user_id):
+        object.__setattr__(self, 'token', token)
+        object.__setattr__(self, 'id', user_id)
+        object.__setattr__(self, 'role_id', token[ROLE_CLAIM])
+        # Токены, выпущенные до появления дополнительных ролей, несут только role.
+        role_ids = token.get(ROLES_CLAIM, [token[ROLE_CLAIM]] if token[ROLE_CLAIM] else [])
+        object.__setattr__(self, 'role_ids', tuple(role_ids))
+        object.__setattr__(self, 'is_superuser', token[SUPERUSER_CLAIM])
+        object.__setattr__(self, 'is_staff', token[STAFF_CLAIM])
+        object.__setattr__(self, '_user', None)
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def is_active(self):
+        # Неактивный пользователь не проходит аутентификацию, поэтому без
+        # загруженной модели значение заведомо True.
+        return self._user.is_active if self._user is not None else True
+
+    @property
+    def user(self):
+        """
+        Полная модель пользователя; загружается при первом обращении.
+        """
+        if self._user is None:
+            object.__setattr__(self, '_user', User.objects.get(pk=self.id))
+        return self._user
+
+    def __getattr__(self, name):
+        return getattr(self.user, name)
+
+    def __setattr__(self, name, value):
+        if name in TokenUser.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.user, name, value)
+
+    def __eq__(self, other):
+        return isinstance(other, (TokenUser, User)) and other.pk == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return f"TokenUser {self.id}"
+
+
+class TokenUserJWTAuthentication(JWTAuthentication):
+    """
+    JWT-аутентификация без запроса User на каждый вызов: request.user — это
+    TokenUser из claims. Активность пользователя сверяется через
+    user_state_cache, поэтому деактивация и отзыв токенов (User.revoke_tokens)
+    вступают в силу не позже чем через CORE_AUTH['TOKEN_USER_STATE_TTL']
+    секунд. Токены без полей пользователя (выпущенные до включения режима)
+    обрабатываются как в JWTAuthentication.
+    """
+
+    def check_token_epoch(self, validated_token, token_epoch):
+        if not is_token_epoch_current(validated_token, token_epoch):
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+
+    def get_user(self, validated_token):
+        if not all(claim in validated_token for claim in USER_CLAIMS):
+            user = super().get_user(validated_token)
+            self.check_token_epoch(validated_token, user.token_epoch)
+            return user
+
+        try:
+            user_id = User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        state = user_state_cache.get(user_id)
+        if state is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        is_active, token_epoch = state
+        if api_settings.CHECK_USER_IS_ACTIVE and not is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        self.check_token_epoch(validated_token, token_epoch)
+
+        return TokenUser(validated_token, user_id)
+
+
+class ClaimsJWTAuthentication(TokenUserJWTAuthentication):
+    """
+    Аутентификация по access-токену без загрузки пользователя из базы.
+
+    Токен должен нести права (CORE_AUTH['EMBED_PERMISSIONS_IN_TOKEN']) и
+    поколение RBAC не старше известного воркеру; иначе возвращается 401 и
+    клиент обновляет токен через token/refresh/, получая актуальные права.
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        version = validated_token.get(ROLE_VERSION_CLAIM)
+        if version is None or version < rbac_generation.current():
+            raise InvalidToken(_("Token permissions are outdated"))
+        return validated_token
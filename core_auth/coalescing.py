@@ -0,0 +1,117 @@
+import hashlib
+import threading
+import time
+from collections import deque
+
+from django.core.cache import caches
+
+from .conf import auth_settings
+from .metrics import cache_requests
+
+PENDING = 'pending'
+POLL_INTERVAL = 0.01
+
+_hits = cache_requests.labels('refresh_coalescing', 'hit')
+_misses = cache_requests.labels('refresh_coalescing', 'miss')
+
+
+class _Flight:
+    __slots__ = ('event', 'result')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class RefreshCoalescer:
+    """
+    Объединение одновременных обновлений одного refresh-токена.
+
+    Первый запрос с токеном выполняет обновление, остальные с побайтно тем
+    же токеном ждут его и получают ту же пару токенов; результат отдается
+    повторно еще REFRESH_COALESCING_WINDOW секунд. Внутри процесса запросы
+    ждут threading.Event, между процессами — запись в кеше Django
+    REFRESH_COALESCING_CACHE. Неудачное обновление не запоминается:
+    ожидающие выполняют его сами и получают ту же ошибку.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._expiry = deque()
+
+    def refresh(self, raw_token, perform):
+        window = auth_settings.REFRESH_COALESCING_WINDOW
+        if not window:
+            return perform()
+        key = 'core_auth:refresh:' + hashlib.blake2b(raw_token.encode(), digest_size=16).hexdigest()
+
+        with self._lock:
+            self._prune()
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            if flight.event.wait(window) and flight.result is not None:
+                _hits.inc()
+                return dict(flight.result)
+            return perform()
+
+        shared = caches[auth_settings.REFRESH_COALESCING_CACHE] if auth_settings.REFRESH_COALESCING_CACHE else None
+        claimed = False
+        try:
+            result = None
+            if shared is not None:
+                result, claimed = self._wait_shared(shared, key, window)
+            if result is None:
+                _misses.inc()
+                result = perform()
+                if shared is not None:
+                    shared.set(key, result, window)
+            else:
+                _hits.inc()
+            flight.result = result
+        except BaseException:
+            if claimed:
+                shared.delete(key)
+            with self._lock:
+                self._flights.pop(key, None)
+            raise
+        finally:
+            flight.event.set()
+        with self._lock:
+            self._expiry.append((time.monotonic() + window, key))
+        return dict(result)
+
+    def _wait_shared(self, shared, key, window):
+        """
+        Захватывает ключ в общем кеше или ждет результата другого процесса.
+        Возвращает (результат или None, захвачен ли ключ этим процессом).
+        """
+        deadline = time.monotonic() + window
+        while True:
+            if shared.add(key, PENDING, window):
+                return None, True
+            value = shared.get(key)
+            if isinstance(value, dict):
+                return value, False
+            if time.monotonic() >= deadline:
+                return None, False
+            time.sleep(POLL_INTERVAL)
+
+    def _prune(self):
+        now = time.monotonic()
+        while self._expiry and self._expiry[0][0] <= now:
+            _, key = self._expiry.popleft()
+            flight = self._flights.get(key)
+            if flight is not None and flight.event.is_set():
+                del self._flights[key]
+
+    def clear(self):
+        with self._lock:
+            self._flights.clear()
+            self._expiry.clear()
+
+
+refresh_coalescer = RefreshCoalescer()
@@ -0,0 +1,104 @@
+from django.conf import settings
+
+DEFAULTS = {
+    # Транспорт уведомлений об изменении RBAC-таблиц между воркерами.
+    'RBAC_NOTIFIER': {
+        'BACKEND': 'core_auth.notifiers.PostgresNotifier',
+        'OPTIONS': {},
+    },
+    # Как часто (в секундах) воркер сверяет поколение RBAC с базой на случай
+    # потерянного уведомления.
+    'RBAC_GENERATION_CHECK_INTERVAL': 5,
+    # Встраивать роль и битовые маски прав в токены (см. core_auth.tokens).
+    'EMBED_PERMISSIONS_IN_TOKEN': False,
+    # Сколько секунд TokenUserJWTAuthentication доверяет закешированному
+    # is_active пользователя; это верхняя граница задержки деактивации.
+    'TOKEN_USER_STATE_TTL': 30,
+    'TOKEN_USER_STATE_MAX_ENTRIES': 100000,
+    # Асинхронные login/register с хешированием паролей в пуле процессов
+    # (включается точкой входа ASGI).
+    'ASYNC_PASSWORD_VIEWS': False,
+    'PASSWORD_HASHING_POOL_SIZE': 2,
+    'PASSWORD_HASHING_QUEUE_DEPTH': 32,
+    'PASSWORD_HASHING_RETRY_AFTER': 1,
+    # Рабочие параметры хешеров core_auth.hashers; подбираются командой
+    # calibrate_hashers. None — значение Django по умолчанию.
+    'PASSWORD_HASHER_PARAMS': {},
+    # Запись last_login при входе: 'deferred' — через буфер
+    # core_auth.last_login.LastLoginRecorder, 'sync' — сразу, отдельным
+    # UPDATE в запросе входа.
+    'LAST_LOGIN_RECORDER': 'deferred',
+    'LAST_LOGIN_FLUSH_INTERVAL': 5,
+    'LAST_LOGIN_FLUSH_SIZE': 500,
+    # Хранилище отозванных refresh-токенов (см. core_auth.revocation).
+    'REVOCATION_BACKEND': {
+        'BACKEND': 'core_auth.revocation.DatabaseRevocationBackend',
+        'OPTIONS': {},
+    },
+    # Профилирование запросов (core_auth.middleware.custom_middleware):
+    # доля профилируемых запросов, допустимая доля накладных расходов
+    # и вывод заголовка Server-Timing.
+    'PROFILING_SAMPLE_RATE': 0.0,
+    'PROFILING_OVERHEAD_BUDGET': 0.02,
+    'PROFILING_SERVER_TIMING': True,
+    # Каталог для агрегации метрик нескольких процессов (core_auth.metrics);
+    # None — /metrics отдает значения только текущего процесса.
+    'METRICS_DIR': None,
+    'METRICS_FLUSH_INTERVAL': 5,
+    # Интроспекция токенов (core_auth.introspection): время жизни и размер
+    # кеша результатов, максимум токенов в одном запросе.
+    'INTROSPECTION_CACHE_TTL': 60,
+    'INTROSPECTION_CACHE_MAX_ENTRIES': 100000,
+    'INTROSPECTION_BATCH_LIMIT': 100,
+    # Асимметричные ключи подписи токенов (core_auth.keys): список словарей
+    # {'KID', 'ALGORITHM' (RS256/ES256/EdDSA), 'PRIVATE_KEY[_FILE]' или
+    # 'PUBLIC_KEY[_FILE]'}; подписывает первый ключ с закрытой частью.
+    # Пустой список — HS256 по SIMPLE_JWT.
+    'SIGNING_KEYS': [],
+    'JWKS_MAX_AGE': 300,
+    # Объединение одновременных обновлений одного refresh-токена
+    # (core_auth.coalescing): сколько секунд повторный запрос получает ту же
+    # пару токенов (0 — выключено) и алиас кеша Django для объединения
+    # между процессами (None — только внутри процесса).
+    'REFRESH_COALESCING_WINDOW': 0,
+    'REFRESH_COALESCING_CACHE': None,
+    # Реплики для чтения (core_auth.routers.ReplicaRouter): алиасы
+    # DATABASES; после записи чтения клиента REPLICA_STICKY_SECONDS секунд
+    # идут в основную базу (cookie и, при заданном алиасе кеша Django,
+    # отметка по id пользователя).
+    'DATABASE_REPLICAS': [],
+    'REPLICA_STICKY_SECONDS': 5,
+    'REPLICA_STICKY_CACHE': None,
+    # Максимум правил в одном запросе access-rules/bulk/.
+    'ACCESS_RULE_BULK_LIMIT': 10000,
+    # Размер страницы админских API (?page_size= не больше ADMIN_MAX_PAGE_SIZE).
+    'ADMIN_PAGE_SIZE': 100,
+    'ADMIN_MAX_PAGE_SIZE': 1000,
+    # С какого числа строк в списках Django admin берется оценка из статистики
+    # Postgres вместо COUNT(*).
+    'ESTIMATED_COUNT_THRESHOLD': 100000,
+    # Массовое создание пользователей: максимум строк в запросе
+    # admin/users/bulk/ (пачка должна хешироваться быстрее таймаута воркера,
+    # большие импорты — командой provision_users), процессы пула хеширования
+    # на воркер (0 или 1 — в текущем процессе) и размер пачки, с которого
+    # хеширование уходит в пул.
+    'USER_PROVISIONING_LIMIT': 100,
+    'PROVISIONING_HASHING_WORKERS': 2,
+    'PROVISIONING_POOL_MIN_BATCH': 16,
+}
+
+
+class AuthSettings:
+    """
+    Настройки core_auth из словаря settings.CORE_AUTH со значениями по умолчанию.
+    Значения читаются при каждом обращении, поэтому override_settings работает
+    без дополнительных сигналов.
+    """
+
+    def __getattr__(self, name):
+        if name not in DEFAULTS:
+            raise AttributeError(f"Invalid core_auth setting: '{name}'")
+        return getattr(settings, 'CORE_AUTH', {}).get(name, DEFAULTS[name])
+
+
+auth_settings = AuthSettings()
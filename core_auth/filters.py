@@ -0,0 +1,61 @@
+from rest_framework.filters import BaseFilterBackend
+
+from .permission_cache import all_bit_for_method, bits_for_method, permission_matrix, user_roles
+from .tokens import SUPERUSER_CLAIM, token_permissions
+
+
+def request_permission_bits(request, element_name):
+    """
+    Биты прав пользователя запроса на бизнес-элемент: из claims токена, если
+    права встроены в него и не устарели (см. token_permissions), иначе из
+    матрицы прав.
+    """
+    permissions = token_permissions(request.auth)
+    if permissions is not None:
+        return permissions.get(element_name, 0)
+    roles = user_roles(request.user)
+    if not roles:
+        return 0
+    return permission_matrix.lookup(roles, element_name) or 0
+
+
+def is_superuser(request):
+    if token_permissions(request.auth) is not None:
+        return bool(request.auth.get(SUPERUSER_CLAIM))
+    return request.user.is_superuser
+
+
+class BusinessElementScopeFilter(BaseFilterBackend):
+    """
+    Ограничивает queryset записями, доступными по правилу роли для
+    business_element_name view: все строки при праве *_all для метода
+    запроса (read_all, update_all, delete_all), только свои — при базовом
+    праве, ни одной — без прав. Принадлежность задает поле view.owner_field
+    (путь до пользователя, по умолчанию 'owner'). Условие уходит в SQL,
+    поэтому список и поиск объекта не проверяют строки по одной.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if not request.user.is_authenticated:
+            return queryset.none()
+        if is_superuser(request):
+            return queryset
+        bits = request_permission_bits(request, view.business_element_name)
+        all_bit = all_bit_for_method(request.method)
+        if all_bit and bits & all_bit:
+            return queryset
+        if bits & bits_for_method(request.method):
+            return queryset.filter(**{getattr(view, 'owner_field', 'owner'): request.user.pk})
+        return queryset.none()
+
+
+class BusinessElementScopeMixin:
+    """
+    Примесь для GenericAPIView и ViewSet: применяет BusinessElementScopeFilter
+    до остальных фильтров, в том числе в get_object().
+    """
+    owner_field = 'owner'
+
+    def filter_queryset(self, queryset):
+        queryset = BusinessElementScopeFilter().filter_queryset(self.request, queryset, self)
+        return super().filter_queryset(queryset)
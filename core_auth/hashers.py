@@ -0,0 +1,78 @@
+from contextvars import ContextVar
+
+from django.contrib.auth import hashers
+
+from .conf import auth_settings
+from .metrics import password_hash_seconds
+
+# verify() большинства хешеров вызывает encode(): время учитывается один раз.
+_measuring = ContextVar('core_auth_hasher_measuring', default=False)
+
+
+def _param(name, default):
+    value = auth_settings.PASSWORD_HASHER_PARAMS.get(name)
+    return default if value is None else value
+
+
+class MeasuredHasherMixin:
+    """
+    Записывает время encode() и verify() в метрику core_auth_password_hash_seconds.
+    """
+
+    def _measure(self, operation, func, *args, **kwargs):
+        if _measuring.get():
+            return func(*args, **kwargs)
+        token = _measuring.set(True)
+        try:
+            with password_hash_seconds.labels(self.algorithm, operation).time():
+                return func(*args, **kwargs)
+        finally:
+            _measuring.reset(token)
+
+    def encode(self, password, salt, *args, **kwargs):
+        return self._measure('encode', super().encode, password, salt, *args, **kwargs)
+
+    def verify(self, password, encoded):
+        return self._measure('verify', super().verify, password, encoded)
+
+
+class PBKDF2PasswordHasher(MeasuredHasherMixin, hashers.PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 с числом итераций из
+    CORE_AUTH['PASSWORD_HASHER_PARAMS']['pbkdf2_iterations'].
+    """
+
+    @property
+    def iterations(self):
+        return _param('pbkdf2_iterations', hashers.PBKDF2PasswordHasher.iterations)
+
+
+class BCryptSHA256PasswordHasher(MeasuredHasherMixin, hashers.BCryptSHA256PasswordHasher):
+    """
+    bcrypt-SHA256 с числом раундов из
+    CORE_AUTH['PASSWORD_HASHER_PARAMS']['bcrypt_rounds'].
+    """
+
+    @property
+    def rounds(self):
+        return _param('bcrypt_rounds', hashers.BCryptSHA256PasswordHasher.rounds)
+
+
+class Argon2PasswordHasher(MeasuredHasherMixin, hashers.Argon2PasswordHasher):
+    """
+    Argon2id с параметрами argon2_time_cost, argon2_memory_cost и
+    argon2_parallelism из CORE_AUTH['PASSWORD_HASHER_PARAMS'].
+    Требует пакет argon2-cffi.
+    """
+
+    @property
+    def time_cost(self):
+        return _param('argon2_time_cost', hashers.Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return _param('argon2_memory_cost', hashers.Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return _param('argon2_parallelism', hashers.Argon2PasswordHasher.parallelism)
@@ -0,0 +1,201 @@
+import asyncio
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import hashers
+
+from .conf import auth_settings
+from .metrics import password_pool_seconds
+
+
+class PoolSaturated(Exception):
+    """
+    Пул хеширования паролей заполнен: запрос нужно отклонить с 503.
+    """
+
+
+def _init_worker(settings_module):
+    if settings_module:
+        os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    import django
+    django.setup()
+
+
+def _make_password(raw_password):
+    return hashers.make_password(raw_password)
+
+
+def _verify_password(raw_password, encoded):
+    return hashers.verify_password(raw_password, encoded)
+
+
+class PasswordHashingPool:
+    """
+    Ограниченный пул процессов для хеширования и проверки паролей.
+
+    Хеширование занимает сотни миллисекунд CPU под GIL, поэтому асинхронные
+    представления выносят его в отдельные процессы. Одновременно выполняется
+    не больше PASSWORD_HASHING_POOL_SIZE задач и ждет не больше
+    PASSWORD_HASHING_QUEUE_DEPTH; сверх этого бросается PoolSaturated.
+    При PASSWORD_HASHING_POOL_SIZE = 0 задачи выполняются в потоках
+    (удобно для тестов).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._in_flight = 0
+
+    @property
+    def capacity(self):
+        return max(auth_settings.PASSWORD_HASHING_POOL_SIZE, 1) + auth_settings.PASSWORD_HASHING_QUEUE_DEPTH
+
+    def _get_executor(self):
+        size = auth_settings.PASSWORD_HASHING_POOL_SIZE
+        if not size:
+            return None
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=size,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_init_worker,
+                        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE'),),
+                    )
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, func, *args):
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                raise PoolSaturated()
+            self._in_flight += 1
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                return await sync_to_async(func, thread_sensitive=False)(*args)
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(executor, func, *args)
+            except BrokenProcessPool:
+                # Процесс пула умер (OOM killer, сигнал), и executor больше не
+                # принимает задач: заменяем его новым и повторяем задачу один раз.
+                self._discard(executor)
+                return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    async def make_password(self, raw_password):
+        with password_pool_seconds.labels('encode').time():
+            return await self.run(_make_password, raw_password)
+
+    async def verify_password(self, raw_password, encoded):
+        """
+        Возвращает пару (пароль верен, хеш нужно пересчитать).
+        """
+        with password_pool_seconds.labels('verify').time():
+            return await self.run(_verify_password, raw_password, encoded)
+
+    def shutdown(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+hashing_pool = PasswordHashingPool()
+atexit.register(hashing_pool.shutdown)
+
+
+class BatchPasswordHasher:
+    """
+    Хеширование пачек паролей для массового создания пользователей в
+    отдельном пуле процессов, чтобы не занимать очередь hashing_pool, через
+    который идут login/ и register/.
+
+    Пул живет все время процесса (provisioning_hasher) или блока with
+    (команда provision_users) и создается при первой пачке не меньше
+    PROVISIONING_POOL_MIN_BATCH паролей; меньшие пачки и workers < 2 —
+    в текущем процессе. Одновременно хешируется одна пачка: следующая
+    получает PoolSaturated, а не встает в очередь за ней.
+    """
+
+    def __init__(self, workers=None):
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+
+    @property
+    def workers(self):
+        if self._workers is not None:
+            return self._workers
+        return auth_settings.PROVISIONING_HASHING_WORKERS
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def make_passwords(self, raw_passwords):
+        """
+        Возвращает хеши в порядке паролей; None дает неиспользуемый пароль.
+        """
+        raw_passwords = list(raw_passwords)
+        hashed = [hashers.make_password(None) if raw is None else None for raw in raw_passwords]
+        pending = [i for i, raw in enumerate(raw_passwords) if raw is not None]
+        if not pending:
+            return hashed
+        values = [raw_passwords[i] for i in pending]
+        if not self._busy.acquire(blocking=False):
+            raise PoolSaturated()
+        try:
+            with password_pool_seconds.labels('encode_batch').time():
+                workers = self.workers
+                if workers < 2 or len(values) < auth_settings.PROVISIONING_POOL_MIN_BATCH:
+                    results = map(_make_password, values)
+                else:
+                    chunksize = max(1, len(values) // (workers * 4))
+                    results = self._get_executor(workers).map(_make_password, values, chunksize=chunksize)
+                for i, encoded in zip(pending, results):
+                    hashed[i] = encoded
+        finally:
+            self._busy.release()
+        return hashed
+
+    def _get_executor(self, workers):
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_init_worker,
+                        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE'),),
+                    )
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+
+
+provisioning_hasher = BatchPasswordHasher()
+atexit.register(provisioning_hasher.shutdown)
@@ -0,0 +1,178 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
+
+from .conf import auth_settings
+from .invalidation import rbac_generation
+from .metrics import cache_requests
+from .models import User
+from .permission_cache import permission_matrix, role_key
+from .revocation import get_revocation_backend
+from .tokens import ROLE_CLAIM, ROLES_CLAIM, STAFF_CLAIM, SUPERUSER_CLAIM, USER_CLAIMS, is_token_epoch_current
+from .user_state import user_state_cache
+
+INACTIVE = {'active': False}
+
+_hits = cache_requests.labels('introspection', 'hit')
+_misses = cache_requests.labels('introspection', 'miss')
+
+
+def _digest(raw_token):
+    return hashlib.blake2b(raw_token.encode(), digest_size=16).digest()
+
+
+def _unverified_jti(raw_token):
+    try:
+        return jwt.decode(raw_token, options={'verify_signature': False}).get(api_settings.JTI_CLAIM)
+    except jwt.InvalidTokenError:
+        return None
+
+
+class IntrospectionCache:
+    """
+    LRU-кеш результатов интроспекции в памяти процесса, ключ — jti.
+
+    Запись хранит хеш исходного токена и используется только для побайтно
+    того же токена, поэтому проверка подписи при попадании не нужна. Отзыв
+    токена, увеличение token_epoch, деактивация пользователя и смена
+    поколения RBAC проверяются при каждом обращении по кешам в памяти;
+    запись живет не дольше INTROSPECTION_CACHE_TTL секунд и exp токена.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, jti, digest):
+        with self._lock:
+            entry = self._entries.get(jti)
+            if entry is None or entry['digest'] != digest:
+                return None
+            if time.monotonic() - entry['cached_at'] >= auth_settings.INTROSPECTION_CACHE_TTL or entry['exp'] <= time.time():
+                del self._entries[jti]
+                return None
+            self._entries.move_to_end(jti)
+            return entry
+
+    def put(self, jti, entry):
+        with self._lock:
+            self._entries[jti] = entry
+            self._entries.move_to_end(jti)
+            while len(self._entries) > auth_settings.INTROSPECTION_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def discard(self, jti):
+        with self._lock:
+            self._entries.pop(jti, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+introspection_cache = IntrospectionCache()
+
+
+def _verify(raw_token):
+    """
+    Проверяет подпись и срок токена и возвращает запись для кеша или None.
+    """
+    try:
+        token = UntypedToken(raw_token)
+    except TokenError:
+        return None
+    payload = token.payload
+    try:
+        user_id = User._meta.pk.to_python(payload[api_settings.USER_ID_CLAIM])
+    except (KeyError, ValueError):
+        return None
+
+    if all(claim in payload for claim in USER_CLAIMS):
+        role_id, is_superuser, is_staff = payload[ROLE_CLAIM], payload[SUPERUSER_CLAIM], payload[STAFF_CLAIM]
+        role_ids = payload.get(ROLES_CLAIM, [role_id] if role_id else [])
+    else:
+        # Токен выпущен без полей пользователя: берем их из базы.
+        user = User.objects.filter(pk=user_id).only('role_id', 'is_superuser', 'is_staff').first()
+        if user is None:
+            return None
+        role_id, is_superuser, is_staff, role_ids = user.role_id, user.is_superuser, user.is_staff, user.role_ids
+
+    return {
+        'digest': _digest(raw_token),
+        'cached_at': time.monotonic(),
+        'exp': payload['exp'],
+        'payload': payload,
+        'user_id': user_id,
+        'role_id': role_id,
+        'role_ids': list(role_ids),
+        'is_superuser': is_superuser,
+        'is_staff': is_staff,
+        'permissions': None,
+    }
+
+
+def _is_active(entry):
+    payload = entry['payload']
+    if payload.get(api_settings.TOKEN_TYPE_CLAIM) == 'refresh':
+        if get_revocation_backend().is_revoked(payload[api_settings.JTI_CLAIM]):
+            return False
+    state = user_state_cache.get(entry['user_id'])
+    if state is None:
+        return False
+    is_active, token_epoch = state
+    if api_settings.CHECK_USER_IS_ACTIVE and not is_active:
+        return False
+    return is_token_epoch_current(payload, token_epoch)
+
+
+def introspect(raw_token):
+    """
+    Возвращает ответ интроспекции (RFC 7662) для одного токена:
+    {'active': False} для недействительного токена, иначе поля токена,
+    пользователя, роль и битовые маски прав по бизнес-элементам.
+    """
+    if not isinstance(raw_token, str) or not raw_token:
+        return dict(INACTIVE)
+    jti = _unverified_jti(raw_token)
+    if jti is None:
+        return dict(INACTIVE)
+
+    entry = introspection_cache.get(jti, _digest(raw_token))
+    if entry is None:
+        _misses.inc()
+        entry = _verify(raw_token)
+        if entry is None:
+            return dict(INACTIVE)
+        introspection_cache.put(jti, entry)
+    else:
+        _hits.inc()
+
+    if not _is_active(entry):
+        return dict(INACTIVE)
+
+    permissions = entry['permissions']
+    if permissions is None or permissions[0] < rbac_generation.current():
+        generation, perm = permission_matrix.role_permissions(role_key(entry['role_ids']))
+        permissions = entry['permissions'] = (generation, {} if entry['is_superuser'] else perm)
+
+    payload = entry['payload']
+    return {
+        'active': True,
+        'token_type': payload.get(api_settings.TOKEN_TYPE_CLAIM),
+        'jti': jti,
+        'exp': payload['exp'],
+        'iat': payload.get('iat'),
+        'sub': str(entry['user_id']),
+        'user_id': entry['user_id'],
+        'role': entry['role_id'],
+        'roles': entry['role_ids'],
+        'is_superuser': entry['is_superuser'],
+        'is_staff': entry['is_staff'],
+        'perm': permissions[1],
+    }
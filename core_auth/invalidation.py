@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from .conf import auth_settings
+from .models import RBACGeneration
+from .routers import use_primary
+
+RBAC_CHANNEL = 'core_auth_rbac'
+
+_notifier = None
+_notifier_pid = None
+_notifier_lock = threading.Lock()
+_listening = False
+
+
+def get_notifier():
+    """
+    Возвращает экземпляр транспорта из настройки CORE_AUTH['RBAC_NOTIFIER'].
+    После fork создается новый экземпляр, так как потоки родителя не наследуются.
+    """
+    global _notifier, _notifier_pid
+    if _notifier is None or _notifier_pid != os.getpid():
+        with _notifier_lock:
+            if _notifier is None or _notifier_pid != os.getpid():
+                config = auth_settings.RBAC_NOTIFIER
+                _notifier = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+                _notifier_pid = os.getpid()
+    return _notifier
+
+
+def _reset_notifier(setting, **kwargs):
+    global _notifier
+    if setting != 'CORE_AUTH':
+        return
+    if _notifier is not None:
+        _notifier.close()
+        _notifier = None
+    rbac_generation.reset()
+
+
+setting_changed.connect(_reset_notifier)
+
+
+def read_rbac_generation():
+    """
+    Читает текущее поколение RBAC-таблиц из базы.
+    """
+    with use_primary():
+        version = RBACGeneration.objects.filter(pk=RBACGeneration.SINGLETON_ID).values_list('version', flat=True).first()
+    return version or 0
+
+
+def bump_rbac_generation():
+    """
+    Увеличивает поколение RBAC-таблиц и после коммита рассылает его воркерам.
+    """
+    updated = RBACGeneration.objects.filter(pk=RBACGeneration.SINGLETON_ID).update(version=F('version') + 1)
+    if not updated:
+        RBACGeneration.objects.get_or_create(pk=RBACGeneration.SINGLETON_ID, defaults={'version': 1})
+    version = read_rbac_generation()
+
+    def publish():
+        rbac_generation.observe(version)
+        get_notifier().publish(RBAC_CHANNEL, str(version))
+
+    transaction.on_commit(publish)
+    return version
+
+
+class GenerationTracker:
+    """
+    Последнее известное воркеру поколение RBAC-таблиц.
+
+    Значение обновляется уведомлениями от транспорта, а не чаще раза в
+    RBAC_GENERATION_CHECK_INTERVAL секунд сверяется с базой на случай
+    потерянного уведомления. current() не обращается к базе между сверками.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listener_pid = None
+        self.reset()
+
+    def reset(self):
+        self.value = 0
+        self._checked_at = 0.0
+        self._listener_pid = None
+
+    def observe(self, version):
+        if version is None:
+            # Транспорт мог потерять сообщения: сверимся с базой при следующем обращении.
+            self._checked_at = 0.0
+            return
+        version = int(version)
+        with self._lock:
+            if version > self.value:
+                self.value = version
+
+    def current(self):
+        if _listening and self._listener_pid != os.getpid():
+            self._start_listener()
+        if time.monotonic() - self._checked_at >= auth_settings.RBAC_GENERATION_CHECK_INTERVAL:
+            self.sync()
+        return self.value
+
+    def sync(self):
+        """
+        Сверяет поколение с базой и возвращает актуальное значение.
+        """
+        self._checked_at = time.monotonic()
+        self.observe(read_rbac_generation())
+        return self.value
+
+    def _start_listener(self):
+        with self._lock:
+            # После fork поток слушателя родителя не наследуется, поэтому
+            # подписываемся заново в каждом процессе.
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+        get_notifier().subscribe(RBAC_CHANNEL, self.observe)
+
+
+rbac_generation = GenerationTracker()
+
+
+def enable_listener(enabled=True):
+    """
+    Включает подписку на уведомления между воркерами. Вызывается точками
+    входа сервера (wsgi/asgi); в тестах и management-командах воркер
+    обходится периодической сверкой с базой.
+    """
+    global _listening
+    _listening = enabled
+
+
+def listener_enabled():
+    return _listening
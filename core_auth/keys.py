@@ -0,0 +1,204 @@
+import hashlib
+import json
+import threading
+
+import jwt
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.translation import gettext_lazy as _
+from jwt import ExpiredSignatureError, InvalidAlgorithmError, InvalidTokenError
+from jwt.algorithms import has_crypto
+from rest_framework_simplejwt import state
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenBackendError, TokenBackendExpiredToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .conf import auth_settings
+
+ASYMMETRIC_ALGORITHMS = ('RS256', 'ES256', 'EdDSA')
+
+
+class SigningKey:
+    """
+    Ключ из CORE_AUTH['SIGNING_KEYS'] с разобранными объектами ключей и JWK.
+    """
+
+    def __init__(self, kid, algorithm, private_key, public_key):
+        self.kid = kid
+        self.algorithm = algorithm
+        self.private_key = private_key
+        self.public_key = public_key
+        jwk = json.loads(jwt.PyJWS().get_algorithm_by_name(algorithm).to_jwk(public_key))
+        self.jwk = {**jwk, 'kid': kid, 'alg': algorithm, 'use': 'sig'}
+
+
+def _read_pem(config, name):
+    if config.get(name):
+        return config[name]
+    path = config.get(f'{name}_FILE')
+    if path:
+        with open(path) as f:
+            return f.read()
+    return None
+
+
+class KeyRing:
+    """
+    Набор ключей подписи токенов. Первый ключ с закрытой частью подписывает
+    новые токены; все ключи (в том числе выведенные, только с PUBLIC_KEY)
+    принимаются при проверке по kid и публикуются в JWKS. PEM разбираются
+    один раз при создании набора.
+    """
+
+    def __init__(self, configs):
+        if not has_crypto:
+            raise ImproperlyConfigured(
+                "CORE_AUTH['SIGNING_KEYS'] requires the 'cryptography' package (pip install cryptography)."
+            )
+        self.keys = {}
+        self.active = None
+        for config in configs:
+            kid, algorithm = config['KID'], config['ALGORITHM']
+            if algorithm not in ASYMMETRIC_ALGORITHMS:
+                raise ImproperlyConfigured(f'Unsupported signing algorithm {algorithm!r} for key {kid!r}.')
+            if kid in self.keys:
+                raise ImproperlyConfigured(f'Duplicate signing key id {kid!r}.')
+            prepare = jwt.PyJWS().get_algorithm_by_name(algorithm).prepare_key
+            private_pem = _read_pem(config, 'PRIVATE_KEY')
+            private_key = prepare(private_pem) if private_pem else None
+            if private_key is not None:
+                public_key = private_key.public_key()
+            else:
+                public_pem = _read_pem(config, 'PUBLIC_KEY')
+                if not public_pem:
+                    raise ImproperlyConfigured(f'Signing key {kid!r} has neither PRIVATE_KEY nor PUBLIC_KEY.')
+                public_key = prepare(public_pem)
+            key = self.keys[kid] = SigningKey(kid, algorithm, private_key, public_key)
+            if self.active is None and private_key is not None:
+                self.active = key
+        if self.active is None:
+            raise ImproperlyConfigured("CORE_AUTH['SIGNING_KEYS'] has no key with PRIVATE_KEY.")
+
+        self.jwks = json.dumps({'keys': [key.jwk for key in self.keys.values()]}, sort_keys=True).encode()
+        self.etag = f'"{hashlib.sha256(self.jwks).hexdigest()[:32]}"'
+
+
+_key_ring = None
+_key_ring_lock = threading.Lock()
+
+
+def get_key_ring():
+    """
+    Возвращает KeyRing из CORE_AUTH['SIGNING_KEYS'] или None, если ключи
+    не заданы и токены подписываются HS256 по SIMPLE_JWT.
+    """
+    global _key_ring
+    configs = auth_settings.SIGNING_KEYS
+    if not configs:
+        return None
+    if _key_ring is None:
+        with _key_ring_lock:
+            if _key_ring is None:
+                _key_ring = KeyRing(configs)
+    return _key_ring
+
+
+def _reset_key_ring(setting, **kwargs):
+    global _key_ring
+    if setting == 'CORE_AUTH':
+        _key_ring = None
+
+
+setting_changed.connect(_reset_key_ring)
+
+
+class KeyRingTokenBackend(TokenBackend):
+    """
+    Бэкенд токенов SimpleJWT с ключами из KeyRing: подпись активным ключом
+    с заголовком kid, проверка ключом из заголовка. Без SIGNING_KEYS
+    работает как стандартный TokenBackend.
+    """
+
+    def encode(self, payload):
+        key_ring = get_key_ring()
+        if key_ring is None:
+            return super().encode(payload)
+        jwt_payload = payload.copy()
+        if self.audience is not None:
+            jwt_payload['aud'] = self.audience
+        if self.issuer is not None:
+            jwt_payload['iss'] = self.issuer
+        key = key_ring.active
+        return jwt.encode(
+            jwt_payload,
+            key.private_key,
+            algorithm=key.algorithm,
+            headers={'kid': key.kid},
+            json_encoder=self.json_encoder,
+        )
+
+    def decode(self, token, verify=True):
+        key_ring = get_key_ring()
+        if key_ring is None:
+            return super().decode(token, verify)
+        try:
+            key = key_ring.keys.get(jwt.get_unverified_header(token).get('kid'))
+            if key is None and verify:
+                raise TokenBackendError(_('Token is invalid'))
+            return jwt.decode(
+                token,
+                key.public_key if key else None,
+                algorithms=[key.algorithm] if key else list(ASYMMETRIC_ALGORITHMS),
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.get_leeway(),
+                options={
+                    'verify_aud': self.audience is not None,
+                    'verify_signature': verify,
+                },
+            )
+        except InvalidAlgorithmError as e:
+            raise TokenBackendError(_('Invalid algorithm specified')) from e
+        except ExpiredSignatureError as e:
+            raise TokenBackendExpiredToken(_('Token is expired')) from e
+        except InvalidTokenError as e:
+            raise TokenBackendError(_('Token is invalid')) from e
+
+
+def install_token_backend():
+    """
+    Подменяет общий бэкенд SimpleJWT (rest_framework_simplejwt.state),
+    через который работают все классы токенов.
+    """
+    state.token_backend = KeyRingTokenBackend(
+        api_settings.ALGORITHM,
+        api_settings.SIGNING_KEY,
+        api_settings.VERIFYING_KEY,
+        api_settings.AUDIENCE,
+        api_settings.ISSUER,
+        api_settings.JWK_URL,
+        api_settings.LEEWAY,
+        api_settings.JSON_ENCODER,
+    )
+    # Ключи разбираются при старте, а не на первом запросе.
+    get_key_ring()
+
+
+def jwks_view(request):
+    """
+    Публичные ключи подписи в формате JWKS. Документ собирается один раз
+    вместе с KeyRing и отдается с ETag.
+    """
+    key_ring = get_key_ring()
+    if key_ring is None:
+        body, etag = b'{"keys": []}', '"empty"'
+    else:
+        body, etag = key_ring.jwks, key_ring.etag
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = f'public, max-age={auth_settings.JWKS_MAX_AGE}'
+    return response
@@ -0,0 +1,132 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.contrib.auth.models import update_last_login
+from django.db import close_old_connections, connection
+from django.db.models import Case, Value, When
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .conf import auth_settings
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+
+class LastLoginRecorder:
+    """
+    Буфер отметок last_login в памяти процесса.
+
+    Для каждого пользователя хранится только самая новая отметка; буфер
+    сбрасывается одним массовым UPDATE раз в LAST_LOGIN_FLUSH_INTERVAL секунд
+    фоновым потоком, при накоплении LAST_LOGIN_FLUSH_SIZE записей и при
+    завершении процесса.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffer = {}
+        self._thread = None
+        self._thread_pid = None
+        self._wakeup = threading.Event()
+
+    def record(self, user_id, when):
+        with self._lock:
+            previous = self._buffer.get(user_id)
+            if previous is None or when > previous:
+                self._buffer[user_id] = when
+            size = len(self._buffer)
+        if auth_settings.LAST_LOGIN_FLUSH_INTERVAL:
+            self._ensure_thread()
+            if size >= auth_settings.LAST_LOGIN_FLUSH_SIZE:
+                self._wakeup.set()
+        elif size >= auth_settings.LAST_LOGIN_FLUSH_SIZE:
+            self.flush()
+
+    def pending(self):
+        return len(self._buffer)
+
+    def flush(self):
+        """
+        Записывает накопленные отметки в базу и возвращает их количество.
+        При ошибке отметки возвращаются в буфер.
+        """
+        with self._lock:
+            items, self._buffer = self._buffer, {}
+        if not items:
+            return 0
+        try:
+            rows = sorted(items.items())
+            chunk_size = auth_settings.LAST_LOGIN_FLUSH_SIZE
+            for start in range(0, len(rows), chunk_size):
+                self._write(rows[start:start + chunk_size])
+        except Exception:
+            with self._lock:
+                for user_id, when in items.items():
+                    current = self._buffer.get(user_id)
+                    if current is None or when > current:
+                        self._buffer[user_id] = when
+            raise
+        return len(items)
+
+    def _write(self, rows):
+        if connection.vendor == 'postgresql':
+            table = connection.ops.quote_name(User._meta.db_table)
+            values = ', '.join(['(%s, %s::timestamptz)'] * len(rows))
+            params = [value for row in rows for value in row]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {table} AS u SET last_login = v.last_login '
+                    f'FROM (VALUES {values}) AS v(id, last_login) '
+                    f'WHERE u.id = v.id AND (u.last_login IS NULL OR u.last_login < v.last_login)',
+                    params,
+                )
+        else:
+            User.objects.filter(pk__in=[user_id for user_id, _ in rows]).update(
+                last_login=Case(*[When(pk=user_id, then=Value(when)) for user_id, when in rows])
+            )
+
+    def _ensure_thread(self):
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='core-auth-last-login', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(auth_settings.LAST_LOGIN_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush last_login timestamps')
+
+    def shutdown(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed to flush last_login timestamps on shutdown')
+
+
+last_login_recorder = LastLoginRecorder()
+atexit.register(last_login_recorder.shutdown)
+
+
+def record_login(user):
+    """
+    Отмечает вход пользователя, если SIMPLE_JWT['UPDATE_LAST_LOGIN'] включен:
+    сразу (LAST_LOGIN_RECORDER = 'sync') или через буфер ('deferred').
+    """
+    if not api_settings.UPDATE_LAST_LOGIN:
+        return
+    if auth_settings.LAST_LOGIN_RECORDER == 'deferred':
+        last_login_recorder.record(user.pk, timezone.now())
+    else:
+        update_last_login(None, user)
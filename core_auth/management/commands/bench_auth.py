@@ -0,0 +1,210 @@
+import json
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from core_auth.models import AccessRule, BusinessElement, Role, User
+
+from .calibrate_hashers import percentile
+
+PASSWORD = 'bench-password-123'
+SCENARIOS = ('register', 'login', 'refresh', 'profile', 'test-resource')
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the auth API endpoints in-process and reports throughput, latency percentiles and queries per request.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Client threads per scenario.')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per scenario.')
+        parser.add_argument(
+            '--scenarios', default=','.join(SCENARIOS),
+            help=f'Comma-separated scenarios: {", ".join(SCENARIOS)}.',
+        )
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        parser.add_argument('--baseline', help='Compare with a previous JSON report.')
+        parser.add_argument(
+            '--max-regression', type=float, default=20.0,
+            help='Fail if p95 latency grows by more than this percentage against the baseline.',
+        )
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',')]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive.')
+
+        self.host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS and settings.ALLOWED_HOSTS[0] != '*' else 'localhost'
+        self.run_id = uuid.uuid4().hex[:8]
+        self.counter = iter(range(10 ** 9))
+        self.counter_lock = threading.Lock()
+        self.setup_fixtures()
+        try:
+            results = {}
+            for name in scenarios:
+                self.run_scenario(name, options['warmup'], options['concurrency'])
+                results[name] = self.run_scenario(name, options['requests'], options['concurrency'])
+        finally:
+            self.cleanup()
+
+        report = {
+            'meta': {
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'timestamp': int(time.time()),
+            },
+            'scenarios': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:14} {result['throughput']:8.1f} req/s  p50 {result['p50_ms']:7.2f} ms  "
+                f"p95 {result['p95_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms  "
+                f"{result['queries_per_request']:5.2f} queries  {result['errors']} errors"
+            )
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['max_regression'])
+
+    def setup_fixtures(self):
+        """
+        Создает роль с правом чтения test_resource и пользователя, от имени
+        которого выполняются login/refresh/profile/test-resource.
+        """
+        self.role = Role.objects.create(name=f'bench-{self.run_id}')
+        self.element, self.element_created = BusinessElement.objects.get_or_create(name='test_resource')
+        AccessRule.objects.create(role=self.role, business_element=self.element, read_permission=True)
+        self.email = f'bench-{self.run_id}@example.com'
+        User.objects.create_user(self.email, PASSWORD, role=self.role)
+        response = self.client().post(reverse('login'), {'email': self.email, 'password': PASSWORD}, content_type='application/json')
+        if response.status_code != 200:
+            raise CommandError(f'Benchmark user could not log in: {response.status_code}')
+        self.access = response.json()['access']
+        self.refresh = response.json()['refresh']
+
+    def cleanup(self):
+        users = User.objects.filter(email__startswith=f'bench-{self.run_id}')
+        OutstandingToken.objects.filter(user__in=users).delete()
+        users.delete()
+        self.role.delete()
+        if self.element_created:
+            self.element.delete()
+
+    def client(self):
+        return Client(HTTP_HOST=self.host)
+
+    def next_number(self):
+        with self.counter_lock:
+            return next(self.counter)
+
+    def request(self, name, client, state):
+        if name == 'register':
+            number = self.next_number()
+            return client.post(reverse('register'), {
+                'email': f'bench-{self.run_id}-{number}@example.com',
+                'password': PASSWORD,
+                'password2': PASSWORD,
+                'first_name': 'Bench',
+                'last_name': 'User',
+            }, content_type='application/json'), 201
+        if name == 'login':
+            return client.post(reverse('login'), {'email': self.email, 'password': PASSWORD}, content_type='application/json'), 200
+        if name == 'refresh':
+            response = client.post(reverse('token_refresh'), {'refresh': state['refresh']}, content_type='application/json')
+            if response.status_code == 200 and 'refresh' in response.json():
+                state['refresh'] = response.json()['refresh']
+            return response, 200
+        path = reverse('profile') if name == 'profile' else reverse('test-resource')
+        return client.get(path, HTTP_AUTHORIZATION=f'Bearer {self.access}'), 200
+
+    def worker(self, name, count):
+        client = self.client()
+        state = {'refresh': self.refresh}
+        if name == 'refresh':
+            # При ROTATE_REFRESH_TOKENS каждому потоку нужен свой refresh-токен.
+            response = client.post(reverse('login'), {'email': self.email, 'password': PASSWORD}, content_type='application/json')
+            state['refresh'] = response.json()['refresh']
+        timings, errors = [], 0
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            for _ in range(count):
+                started = time.perf_counter()
+                response, expected = self.request(name, client, state)
+                timings.append(time.perf_counter() - started)
+                errors += response.status_code != expected
+        return timings, counter.count, errors
+
+    def thread_worker(self, name, count):
+        try:
+            return self.worker(name, count)
+        finally:
+            connection.close()
+
+    def run_scenario(self, name, requests, concurrency):
+        if not requests:
+            return None
+        shares = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+        started = time.perf_counter()
+        if concurrency == 1:
+            outcomes = [self.worker(name, requests)]
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                outcomes = list(executor.map(lambda count: self.thread_worker(name, count), [share for share in shares if share]))
+        elapsed = time.perf_counter() - started
+
+        timings = [timing for outcome in outcomes for timing in outcome[0]]
+        return {
+            'requests': len(timings),
+            'errors': sum(outcome[2] for outcome in outcomes),
+            'seconds': round(elapsed, 3),
+            'throughput': round(len(timings) / elapsed, 2),
+            'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+            'p50_ms': round(percentile(timings, 50) * 1000, 3),
+            'p95_ms': round(percentile(timings, 95) * 1000, 3),
+            'p99_ms': round(percentile(timings, 99) * 1000, 3),
+            'queries_per_request': round(sum(outcome[1] for outcome in outcomes) / len(timings), 2),
+        }
+
+    def compare(self, results, baseline_path, max_regression):
+        with open(baseline_path) as f:
+            baseline = json.load(f)['scenarios']
+        regressions = []
+        for name, result in results.items():
+            previous = baseline.get(name)
+            if not previous:
+                continue
+            change = (result['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] * 100 if previous['p95_ms'] else 0.0
+            self.stdout.write(
+                f"{name:14} p95 {previous['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms ({change:+.1f}%), "
+                f"queries {previous['queries_per_request']:.2f} -> {result['queries_per_request']:.2f}"
+            )
+            if change > max_regression or result['queries_per_request'] > previous['queries_per_request']:
+                regressions.append(name)
+        if regressions:
+            raise CommandError(f'Regressions against {baseline_path}: {", ".join(regressions)}')
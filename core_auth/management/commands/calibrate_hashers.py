@@ -0,0 +1,126 @@
+import json
+import math
+import time
+
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand, CommandError
+
+PASSWORD = 'calibration-password'
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = max(0, math.ceil(len(ordered) * pct / 100) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the available password hashers and recommends work factors for a target verify latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=50.0, help='Target verify latency in milliseconds.')
+        parser.add_argument('--percentile', type=float, default=95.0, help='Latency percentile to compare with the target.')
+        parser.add_argument('--samples', type=int, default=20, help='Verifications per measured work factor.')
+        parser.add_argument(
+            '--algorithms', default='pbkdf2_sha256,bcrypt_sha256,argon2',
+            help='Comma-separated hashers to benchmark.',
+        )
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        self.target = options['target_ms'] / 1000
+        self.percentile = options['percentile']
+        self.samples = options['samples']
+        if self.samples < 1:
+            raise CommandError('--samples must be positive.')
+
+        calibrators = {
+            'pbkdf2_sha256': self.calibrate_pbkdf2,
+            'bcrypt_sha256': self.calibrate_bcrypt,
+            'argon2': self.calibrate_argon2,
+        }
+        results = {}
+        for algorithm in options['algorithms'].split(','):
+            algorithm = algorithm.strip()
+            if algorithm not in calibrators:
+                raise CommandError(f'Unknown algorithm: {algorithm}')
+            try:
+                results[algorithm] = calibrators[algorithm]()
+            except ValueError as e:
+                # Библиотека хешера не установлена (bcrypt, argon2-cffi).
+                results[algorithm] = {'available': False, 'error': str(e)}
+
+        params = {}
+        for result in results.values():
+            params.update(result.get('params', {}))
+
+        if options['json']:
+            self.stdout.write(json.dumps({'target_ms': options['target_ms'], 'results': results, 'params': params}, indent=2))
+            return
+
+        for algorithm, result in results.items():
+            if not result['available']:
+                self.stdout.write(f"{algorithm}: unavailable ({result['error']})")
+                continue
+            self.stdout.write(
+                f"{algorithm}: {result['params']} -> p{self.percentile:g} {result['latency_ms']:.1f} ms"
+            )
+        self.stdout.write(self.style.SUCCESS(f"CORE_AUTH['PASSWORD_HASHER_PARAMS'] = {params!r}"))
+
+    def measure(self, hasher):
+        """
+        Возвращает перцентиль времени проверки пароля (в секундах).
+        """
+        encoded = hasher.encode(PASSWORD, hasher.salt())
+        timings = []
+        for _ in range(self.samples):
+            start = time.perf_counter()
+            hasher.verify(PASSWORD, encoded)
+            timings.append(time.perf_counter() - start)
+        return percentile(timings, self.percentile)
+
+    def make_hasher(self, base, **attrs):
+        return type(f'Calibrated{base.__name__}', (base,), attrs)()
+
+    def result(self, params, latency):
+        return {'available': True, 'params': params, 'latency_ms': round(latency * 1000, 2)}
+
+    def calibrate_pbkdf2(self):
+        # Время PBKDF2 линейно по числу итераций: оцениваем по пробному
+        # замеру и уточняем одним повторным.
+        iterations = 100_000
+        for _ in range(2):
+            latency = self.measure(self.make_hasher(hashers.PBKDF2PasswordHasher, iterations=iterations))
+            iterations = max(1000, int(iterations * self.target / latency) // 1000 * 1000)
+        latency = self.measure(self.make_hasher(hashers.PBKDF2PasswordHasher, iterations=iterations))
+        return self.result({'pbkdf2_iterations': iterations}, latency)
+
+    def largest_within_target(self, base, attr, values):
+        """
+        Перебирает возрастающие значения параметра и возвращает наибольшее,
+        при котором задержка не превышает цель (или наименьшее, если цель
+        недостижима), вместе с его задержкой.
+        """
+        best = None
+        for value in values:
+            latency = self.measure(self.make_hasher(base, **{attr: value}))
+            if best is not None and latency > self.target:
+                break
+            best = (value, latency)
+        return best
+
+    def calibrate_bcrypt(self):
+        # Каждый раунд bcrypt удваивает время.
+        hashers.BCryptSHA256PasswordHasher()._load_library()
+        rounds, latency = self.largest_within_target(hashers.BCryptSHA256PasswordHasher, 'rounds', range(4, 20))
+        return self.result({'bcrypt_rounds': rounds}, latency)
+
+    def calibrate_argon2(self):
+        # Память фиксирована значением Django, подбирается time_cost.
+        hashers.Argon2PasswordHasher()._load_library()
+        time_cost, latency = self.largest_within_target(hashers.Argon2PasswordHasher, 'time_cost', range(1, 33))
+        return self.result({
+            'argon2_time_cost': time_cost,
+            'argon2_memory_cost': hashers.Argon2PasswordHasher.memory_cost,
+            'argon2_parallelism': hashers.Argon2PasswordHasher.parallelism,
+        }, latency)
@@ -0,0 +1,153 @@
+import csv
+import io
+import random
+import string
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core_auth.invalidation import bump_rbac_generation
+from core_auth.models import AccessRule, BusinessElement, Role, User
+from core_auth.permission_cache import PERMISSION_FIELDS, permission_matrix
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates a reproducible synthetic dataset of users, roles, business elements and access rules '
+        'for load testing. Users are loaded with COPY on PostgreSQL and bulk_create elsewhere.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000, help='Number of users.')
+        parser.add_argument('--roles', type=int, default=20, help='Number of roles.')
+        parser.add_argument('--elements', type=int, default=50, help='Number of business elements.')
+        parser.add_argument(
+            '--density', type=float, default=0.3,
+            help='Share of role/element pairs that get an access rule (0..1).',
+        )
+        parser.add_argument(
+            '--permission-probability', type=float, default=0.5,
+            help='Probability of each permission flag in a generated rule.',
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Random seed.')
+        parser.add_argument('--chunk-size', type=int, default=50000, help='Rows per COPY or bulk_create batch.')
+        parser.add_argument('--prefix', default='load', help='Prefix of generated emails and names.')
+        parser.add_argument('--password', default='password123', help='Password of every generated user.')
+        parser.add_argument('--no-copy', action='store_true', help='Use bulk_create even on PostgreSQL.')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['density'] <= 1:
+            raise CommandError('--density must be between 0 and 1.')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+        self.prefix = options['prefix']
+        if Role.objects.filter(name__startswith=f'{self.prefix}-role-').exists():
+            raise CommandError(f'Dataset with prefix "{self.prefix}" already exists; choose another --prefix.')
+
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.verbosity = options['verbosity']
+
+        started = time.monotonic()
+        roles, rules = self.generate_rbac(options)
+        self.stdout.write(f'Created {len(roles)} roles, {options["elements"]} elements and {rules} access rules')
+
+        # Один хеш на всех пользователей: хеширование миллиона паролей заняло бы часы.
+        salt = ''.join(self.rng.choices(string.ascii_letters + string.digits, k=22))
+        password_hash = make_password(options['password'], salt)
+        use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        users_started = time.monotonic()
+        self.generate_users(options['users'], [role.pk for role in roles], password_hash, use_copy)
+        elapsed = time.monotonic() - users_started
+        self.stdout.write(
+            f'Created {options["users"]} users in {elapsed:.1f}s '
+            f'({options["users"] / elapsed if elapsed else 0:.0f} rows/s, {"COPY" if use_copy else "bulk_create"})'
+        )
+
+        # bulk_create не отправляет сигналы: сбрасываем кеш прав вручную.
+        permission_matrix.invalidate()
+        bump_rbac_generation()
+        self.stdout.write(self.style.SUCCESS(f'Dataset generated in {time.monotonic() - started:.1f}s'))
+
+    def generate_rbac(self, options):
+        with transaction.atomic():
+            roles = Role.objects.bulk_create(
+                [Role(name=f'{self.prefix}-role-{i}') for i in range(options['roles'])],
+                batch_size=self.chunk_size,
+            )
+            elements = BusinessElement.objects.bulk_create(
+                [BusinessElement(name=f'{self.prefix}-element-{i}') for i in range(options['elements'])],
+                batch_size=self.chunk_size,
+            )
+            rules = []
+            for role in roles:
+                for element in elements:
+                    if self.rng.random() >= options['density']:
+                        continue
+                    flags = {
+                        field: self.rng.random() < options['permission_probability']
+                        for field, _ in PERMISSION_FIELDS
+                    }
+                    rules.append(AccessRule(role=role, business_element=element, **flags))
+            AccessRule.objects.bulk_create(rules, batch_size=self.chunk_size)
+        return roles, len(rules)
+
+    def user_rows(self, count, role_ids, password_hash):
+        """
+        Возвращает значения полей пользователей в порядке колонок COPY.
+        """
+        date_joined = timezone.now()
+        for i in range(count):
+            email = f'{self.prefix}-{i}@example.com'
+            yield {
+                'email': email,
+                'username': email,
+                'password': password_hash,
+                'first_name': f'User{i}',
+                'last_name': self.prefix.capitalize(),
+                'role_id': self.rng.choice(role_ids) if role_ids else None,
+                'is_active': True,
+                'is_staff': False,
+                'is_superuser': False,
+                'date_joined': date_joined,
+                'last_login': None,
+                'token_epoch': 0,
+            }
+
+    def generate_users(self, count, role_ids, password_hash, use_copy):
+        rows = self.user_rows(count, role_ids, password_hash)
+        written = 0
+        while written < count:
+            chunk = [next(rows) for _ in range(min(self.chunk_size, count - written))]
+            if use_copy:
+                self.copy_users(chunk)
+            else:
+                User.objects.bulk_create([User(**row) for row in chunk])
+            written += len(chunk)
+            if self.verbosity > 1:
+                self.stdout.write(f'{written}/{count} users')
+
+    def copy_users(self, chunk):
+        columns = list(chunk[0])
+        # csv пишет None пустым полем (NULL в COPY), а True/False Postgres
+        # принимает как boolean.
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(row.values() for row in chunk)
+        buffer.seek(0)
+        sql = (
+            f'COPY {connection.ops.quote_name(User._meta.db_table)} '
+            f'({", ".join(connection.ops.quote_name(User._meta.get_field(name).column) for name in columns)}) '
+            f'FROM STDIN WITH (FORMAT csv)'
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):
+                # psycopg2
+                raw.copy_expert(sql, buffer)
+            else:
+                # psycopg 3
+                with raw.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
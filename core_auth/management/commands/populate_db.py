@@ -16,4 +16,8 @@ class Command(BaseCommand):
         AccessRule.objects.get_or_create(role=dev_role, business_element=code_be, read_permission=True, update_permission=True)
         AccessRule.objects.get_or_create(role=qa_role, business_element=tests_be, read_permission=True)
 
+        # Роль без собственных правил: права наследуются от Developer и QA.
+        lead_role, _ = Role.objects.get_or_create(name='Team Lead', description='Inherits Developer and QA access.')
+        lead_role.parents.add(dev_role, qa_role)
+
         self.stdout.write(self.style.SUCCESS('Successfully populated database with demo data.'))
\ No newline at end of file
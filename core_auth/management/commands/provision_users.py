@@ -0,0 +1,83 @@
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core_auth.hashing import BatchPasswordHasher
+from core_auth.provisioning import BATCH_SIZE, provision_users
+
+
+def _csv_rows(f):
+    # Пустые ячейки — отсутствующие значения, roles — id через ';'.
+    for row in csv.DictReader(f):
+        row = {key: value for key, value in row.items() if value not in ('', None)}
+        if 'roles' in row:
+            row['roles'] = [role for role in row['roles'].split(';') if role]
+        yield row
+
+
+def _ndjson_rows(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates users in bulk from a CSV or NDJSON file (email, first_name, last_name, password, role, roles, '
+        'is_active). Passwords are hashed in a process pool; invalid rows are reported and skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, '-' for stdin.")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Input format (default: by file extension).')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows validated and inserted at once.')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Password hashing processes (default: number of CPUs).',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        path = options['path']
+        kind = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        f = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+        try:
+            self.provision(_csv_rows(f) if kind == 'csv' else _ndjson_rows(f), options)
+        except (ValueError, csv.Error) as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+    def provision(self, rows, options):
+        started = time.monotonic()
+        created = failed = offset = 0
+        with BatchPasswordHasher(options['workers']) as hasher:
+            while True:
+                chunk = list(itertools.islice(rows, options['batch_size']))
+                if not chunk:
+                    break
+                result = provision_users(chunk, hasher=hasher, batch_size=options['batch_size'])
+                created += len(result['created'])
+                failed += len(result['errors'])
+                for error in result['errors']:
+                    self.stderr.write(f'row {offset + error["index"] + 1}: {json.dumps(error["errors"])}')
+                offset += len(chunk)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{offset} rows processed')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Created {created} users, {failed} rows failed in {elapsed:.1f}s '
+            f'({offset / elapsed if elapsed else 0:.0f} rows/s)'
+        )
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} rows were skipped'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All rows provisioned'))
@@ -0,0 +1,166 @@
+import re
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+PARTITION_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes expired outstanding and blacklisted tokens in small batches. '
+        'Expired partitions of a partitioned token table are dropped instead.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Tokens deleted per transaction.')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Pause between batches in seconds.')
+        parser.add_argument('--max-seconds', type=float, default=0, help='Stop after this many seconds (0 - no limit).')
+        parser.add_argument('--grace', type=int, default=0, help='Keep tokens for this many seconds after expiry.')
+        parser.add_argument('--after-id', type=int, default=0, help='Resume from the last id reported by a previous run.')
+        parser.add_argument(
+            '--create-partitions', type=int, default=0, metavar='MONTHS',
+            help='Create monthly partitions for this many months ahead (partitioned layout only).',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        self.outstanding = connection.ops.quote_name(OutstandingToken._meta.db_table)
+        self.blacklisted = connection.ops.quote_name(BlacklistedToken._meta.db_table)
+        cutoff = timezone.now() - timedelta(seconds=options['grace'])
+        self.cutoff = connection.ops.adapt_datetimefield_value(cutoff)
+        deadline = time.monotonic() + options['max_seconds'] if options['max_seconds'] else None
+
+        partitions = self.partitions()
+        if partitions is None:
+            if options['create_partitions']:
+                raise CommandError(f'{OutstandingToken._meta.db_table} is not a partitioned table.')
+        else:
+            self.drop_expired_partitions(partitions, cutoff)
+            if options['create_partitions']:
+                self.create_partitions(partitions, options['create_partitions'])
+
+        started = time.monotonic()
+        deleted, last_id = 0, options['after_id']
+        while deadline is None or time.monotonic() < deadline:
+            count, last_id = self.delete_batch(last_id, options['batch_size'])
+            if not count:
+                break
+            deleted += count
+            if options['verbosity'] > 1:
+                self.stdout.write(f'deleted {deleted} tokens, last id {last_id}')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        elapsed = time.monotonic() - started
+        remaining = self.remaining(last_id)
+        self.stdout.write(
+            f'Deleted {deleted} expired tokens in {elapsed:.1f}s ({deleted / elapsed if elapsed else 0:.0f} rows/s), '
+            f'remaining backlog: {remaining}, last id: {last_id}'
+        )
+        if remaining:
+            self.stdout.write(f'Resume with --after-id {last_id}')
+
+    def delete_batch(self, after_id, batch_size):
+        """
+        Удаляет до batch_size истекших токенов с id больше after_id одной
+        короткой транзакцией. Возвращает число удаленных токенов и последний id.
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id FROM {self.outstanding} WHERE id > %s AND expires_at < %s ORDER BY id LIMIT %s',
+                [after_id, self.cutoff, batch_size],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                return 0, after_id
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(f'DELETE FROM {self.blacklisted} WHERE token_id IN ({placeholders})', ids)
+            cursor.execute(f'DELETE FROM {self.outstanding} WHERE id IN ({placeholders})', ids)
+        return len(ids), ids[-1]
+
+    def remaining(self, after_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {self.outstanding} WHERE id > %s AND expires_at < %s',
+                [after_id, self.cutoff],
+            )
+            return cursor.fetchone()[0]
+
+    def partitions(self):
+        """
+        Возвращает разделы таблицы OutstandingToken, секционированной
+        по RANGE (expires_at), как список (имя, начало, конец), или None,
+        если таблица обычная.
+        """
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) '
+                'FROM pg_partitioned_table pt '
+                'LEFT JOIN pg_inherits i ON i.inhparent = pt.partrelid '
+                'LEFT JOIN pg_class child ON child.oid = i.inhrelid '
+                'WHERE pt.partrelid = to_regclass(%s)',
+                [OutstandingToken._meta.db_table],
+            )
+            rows = cursor.fetchall()
+        if not rows:
+            return None
+        partitions = []
+        for name, bound in rows:
+            match = PARTITION_BOUND.search(bound or '')
+            if match:
+                start, end = (datetime.fromisoformat(value) for value in match.groups())
+                partitions.append((name, start, end))
+        return sorted(partitions, key=lambda partition: partition[1])
+
+    def drop_expired_partitions(self, partitions, cutoff):
+        """
+        Отсоединяет и удаляет разделы, все токены которых истекли. Записи
+        черного списка, ссылающиеся на токены раздела, удаляются заранее.
+        """
+        for name, start, end in partitions:
+            if timezone.is_naive(end):
+                end = timezone.make_aware(end, timezone.get_default_timezone())
+            if end > cutoff:
+                continue
+            table = connection.ops.quote_name(name)
+            started = time.monotonic()
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f'SELECT COUNT(*) FROM {table}')
+                rows = cursor.fetchone()[0]
+                cursor.execute(
+                    f'DELETE FROM {self.blacklisted} WHERE token_id IN (SELECT id FROM {table})'
+                )
+                cursor.execute(f'ALTER TABLE {self.outstanding} DETACH PARTITION {table}')
+                cursor.execute(f'DROP TABLE {table}')
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'Dropped partition {name} with {rows} tokens in {elapsed:.1f}s '
+                f'({rows / elapsed if elapsed else 0:.0f} rows/s)'
+            )
+
+    def create_partitions(self, partitions, months):
+        """
+        Создает недостающие месячные разделы на months месяцев вперед.
+        """
+        start = timezone.now().date().replace(day=1)
+        existing = {partition[1].date() for partition in partitions}
+        with connection.cursor() as cursor:
+            for _ in range(months + 1):
+                end = (start + timedelta(days=32)).replace(day=1)
+                if start not in existing:
+                    name = f'{OutstandingToken._meta.db_table}_p{start:%Y%m}'
+                    cursor.execute(
+                        f'CREATE TABLE IF NOT EXISTS {connection.ops.quote_name(name)} '
+                        f'PARTITION OF {self.outstanding} FOR VALUES FROM (%s) TO (%s)',
+                        [start.isoformat(), end.isoformat()],
+                    )
+                    self.stdout.write(f'Created partition {name}')
+                start = end
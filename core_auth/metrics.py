@@ -0,0 +1,451 @@
+import asyncio
+import functools
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.db import connections
+from django.http import HttpResponse
+
+from .conf import auth_settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Счетчики и гистограммы завершившихся процессов (Registry.mark_process_dead).
+ARCHIVE_FILE = 'archive.json'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    """
+    Метрика с фиксированным набором меток. Значения хранятся в словаре
+    по кортежу значений меток; обновление — одно короткое взятие блокировки.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        self._children = {}
+        registry.register(self)
+
+    def labels(self, *values):
+        """
+        Возвращает метрику с заданными значениями меток; результат можно
+        сохранить и переиспользовать.
+        """
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}')
+            child = self._children.setdefault(values, _LabeledMetric(self, values))
+        return child
+
+    def snapshot(self):
+        with self._lock:
+            return {key: list(value) for key, value in self._values.items()}
+
+
+class _LabeledMetric:
+    __slots__ = ('metric', 'key')
+
+    def __init__(self, metric, key):
+        self.metric = metric
+        self.key = key
+
+    def inc(self, amount=1):
+        self.metric._update(self.key, amount)
+
+    def observe(self, value):
+        self.metric._update(self.key, value)
+
+    def time(self):
+        return self.metric._timer(self.key)
+
+    def set(self, value):
+        self.metric._update(self.key, value)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def _update(self, key, amount):
+        with self._lock:
+            value = self._values.get(key)
+            if value is None:
+                self._values[key] = [amount]
+            else:
+                value[0] += amount
+        registry.touch()
+
+    def inc(self, amount=1):
+        self._update((), amount)
+
+
+class Gauge(Metric):
+    """
+    Текущее значение. При агрегации нескольких процессов значения
+    суммируются.
+    """
+    type = 'gauge'
+
+    def _update(self, key, value):
+        with self._lock:
+            self._values[key] = [value]
+        registry.touch()
+
+    def set(self, value):
+        self._update((), value)
+
+
+class Histogram(Metric):
+    """
+    Гистограмма: значения хранятся как счетчики по корзинам (без
+    накопления), сумма и количество наблюдений.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _update(self, key, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 3)
+            counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+        registry.touch()
+
+    @contextmanager
+    def _timer(self, key):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._update(key, time.perf_counter() - started)
+
+    def observe(self, value):
+        self._update((), value)
+
+    def time(self):
+        return self._timer(())
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(directory, path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _file_pid(path):
+    # metrics-<pid>-<suffix>.json
+    try:
+        return int(os.path.basename(path).split('-')[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def _pid_alive(pid):
+    if pid is None:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Registry:
+    """
+    Реестр метрик процесса.
+
+    При заданном CORE_AUTH['METRICS_DIR'] каждый процесс раз в
+    METRICS_FLUSH_INTERVAL секунд фоновым потоком сохраняет свои значения
+    в отдельный файл каталога, а /metrics суммирует файлы всех процессов.
+    Запись метрики при этом не обращается к диску.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+        self._path = None
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Duplicate metric: {metric.name}')
+        self.metrics[metric.name] = metric
+
+    def touch(self):
+        if self._flusher_pid != os.getpid():
+            self._start_flusher()
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            self._path = None
+            if auth_settings.METRICS_DIR:
+                threading.Thread(target=self._run, name='core-auth-metrics', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(auth_settings.METRICS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to write metrics file')
+
+    def add_collector(self, collector):
+        """
+        Регистрирует функцию, которая обновляет метрики перед каждым снятием
+        значений (для данных, которые удобнее читать, чем отслеживать).
+        """
+        self.collectors.append(collector)
+
+    def collect(self):
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception('Metrics collector %r failed', collector)
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def flush(self, directory=None):
+        """
+        Атомарно записывает значения процесса в его файл в каталоге метрик.
+        """
+        directory = directory or auth_settings.METRICS_DIR
+        if self._path is None or os.path.dirname(self._path) != directory:
+            self._path = os.path.join(directory, f'metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+        data = {name: [[list(key), value] for key, value in values.items()] for name, values in self.collect().items()}
+        _write_json(directory, self._path, data)
+
+    def collect_all(self, directory=None):
+        """
+        Суммирует значения всех процессов из каталога метрик; без каталога
+        возвращает значения текущего процесса. Счетчики и гистограммы
+        завершившихся процессов берутся из архива, gauge — только от живых
+        процессов.
+        """
+        directory = directory or auth_settings.METRICS_DIR
+        if not directory:
+            return self.collect()
+        self.flush(directory)
+        merged = {name: {} for name in self.metrics}
+        archive = _read_json(os.path.join(directory, ARCHIVE_FILE)) or {}
+        absorbed = set(archive.get('absorbed', ()))
+        self._merge(merged, archive.get('metrics', {}), gauges=False)
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            if os.path.basename(path) in absorbed:
+                continue
+            data = _read_json(path)
+            if data is not None:
+                self._merge(merged, data, gauges=_pid_alive(_file_pid(path)))
+        return merged
+
+    def mark_process_dead(self, pid, directory=None):
+        """
+        Переносит счетчики и гистограммы завершившегося процесса в архив
+        каталога метрик и удаляет его файл, чтобы число файлов (и стоимость
+        /metrics) не росло при перезапуске воркеров. Вызывается из хука
+        gunicorn child_exit в мастер-процессе.
+        """
+        directory = directory or auth_settings.METRICS_DIR
+        if not directory:
+            return
+        paths = glob.glob(os.path.join(directory, f'metrics-{pid}-*.json'))
+        if not paths:
+            return
+        archive_path = os.path.join(directory, ARCHIVE_FILE)
+        archive = _read_json(archive_path) or {}
+        metrics = {name: {} for name in self.metrics}
+        self._merge(metrics, archive.get('metrics', {}), gauges=False)
+        for path in paths:
+            data = _read_json(path)
+            if data is not None:
+                self._merge(metrics, data, gauges=False)
+        # Файл помечается поглощенным до удаления: /metrics между записью
+        # архива и удалением файла не посчитает значения дважды.
+        absorbed = [name for name in archive.get('absorbed', ()) if os.path.exists(os.path.join(directory, name))]
+        _write_json(directory, archive_path, {
+            'absorbed': absorbed + [os.path.basename(path) for path in paths],
+            'metrics': {name: [[list(key), value] for key, value in values.items()] for name, values in metrics.items()},
+        })
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _merge(self, merged, data, gauges):
+        for name, samples in data.items():
+            if name not in merged or (not gauges and self.metrics[name].type == 'gauge'):
+                continue
+            for key, value in samples:
+                current = merged[name].setdefault(tuple(key), [0] * len(value))
+                for i, item in enumerate(value):
+                    current[i] += item
+
+    def render(self, values):
+        """
+        Формирует текст в формате экспозиции Prometheus.
+        """
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            for key, value in sorted(values.get(name, {}).items()):
+                labels = list(zip(metric.labelnames, key))
+                if metric.type in ('counter', 'gauge'):
+                    lines.append(f'{name}{_format_labels(labels)} {value[0]}')
+                    continue
+                cumulative = 0
+                for bound, count in zip((*metric.buckets, '+Inf'), value[:-2]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels([*labels, ("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {value[-2]}')
+                lines.append(f'{name}_count{_format_labels(labels)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+registry = Registry()
+
+
+def metrics_view(request):
+    """
+    Отдает метрики всех процессов в формате Prometheus.
+    """
+    return HttpResponse(registry.render(registry.collect_all()), content_type=CONTENT_TYPE)
+
+
+def timed_response(histogram):
+    """
+    Декоратор метода представления: наблюдает длительность в гистограмме
+    с меткой status (код ответа). Поддерживает синхронные и async-методы.
+    """
+    def decorator(method):
+        if asyncio.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(self, request, *args, **kwargs):
+                started = time.perf_counter()
+                response = await method(self, request, *args, **kwargs)
+                histogram.labels(response.status_code).observe(time.perf_counter() - started)
+                return response
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            started = time.perf_counter()
+            response = method(self, request, *args, **kwargs)
+            histogram.labels(response.status_code).observe(time.perf_counter() - started)
+            return response
+        return wrapper
+    return decorator
+
+
+login_seconds = Histogram('core_auth_login_seconds', 'Login request latency.', ['status'])
+password_hash_seconds = Histogram(
+    'core_auth_password_hash_seconds', 'Password hashing and verification time.', ['algorithm', 'operation'],
+)
+password_pool_seconds = Histogram(
+    'core_auth_password_pool_seconds', 'Password hashing pool task time including queueing.', ['operation'],
+)
+token_issue_seconds = Histogram('core_auth_token_issue_seconds', 'Token pair issue latency.')
+token_refresh_seconds = Histogram('core_auth_token_refresh_seconds', 'Token refresh latency.')
+permission_checks = Counter(
+    'core_auth_permission_checks_total', 'Business element permission checks.', ['element', 'result'],
+)
+cache_requests = Counter('core_auth_cache_requests_total', 'In-process cache lookups.', ['cache', 'result'])
+db_pool_connections = Gauge(
+    'core_auth_db_pool_connections', 'Database pool connections by state.', ['database', 'state'],
+)
+db_pool_waiting = Gauge('core_auth_db_pool_waiting', 'Requests waiting for a pooled connection.', ['database'])
+db_pool_wait_seconds = Counter(
+    'core_auth_db_pool_wait_seconds_total', 'Time spent waiting for a pooled connection.', ['database'],
+)
+db_pool_timeouts = Counter(
+    'core_auth_db_pool_timeouts_total', 'Requests that timed out waiting for a pooled connection.', ['database'],
+)
+db_pool_connections_lost = Counter(
+    'core_auth_db_pool_connections_lost_total', 'Pooled connections found broken by health checks.', ['database'],
+)
+
+_pool_totals = {}
+_pool_lock = threading.Lock()
+
+
+def collect_pool_metrics():
+    """
+    Снимает статистику пулов соединений psycopg (DATABASES[...]['OPTIONS']['pool']).
+    Накопительные значения пула переводятся в приращения счетчиков.
+    """
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is None:
+            continue
+        with _pool_lock:
+            _observe_pool(alias, pool.get_stats())
+
+
+def _observe_pool(alias, stats):
+    db_pool_connections.labels(alias, 'size').set(stats.get('pool_size', 0))
+    db_pool_connections.labels(alias, 'available').set(stats.get('pool_available', 0))
+    db_pool_connections.labels(alias, 'max').set(stats.get('pool_max', 0))
+    db_pool_waiting.labels(alias).set(stats.get('requests_waiting', 0))
+    totals = {
+        db_pool_wait_seconds: stats.get('requests_wait_ms', 0) / 1000,
+        db_pool_timeouts: stats.get('requests_errors', 0),
+        db_pool_connections_lost: stats.get('connections_lost', 0),
+    }
+    previous = _pool_totals.setdefault(alias, {})
+    for metric, total in totals.items():
+        # Пул пересоздан (например, после fork) — счет начинается заново.
+        delta = total - previous.get(metric, 0) if total >= previous.get(metric, 0) else total
+        if delta:
+            metric.labels(alias).inc(delta)
+        previous[metric] = total
+
+
+registry.add_collector(collect_pool_metrics)
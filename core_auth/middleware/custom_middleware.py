@@ -0,0 +1,345 @@
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+import jwt
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.cache import caches
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.settings import api_settings
+
+from ..conf import auth_settings
+from ..routers import RoutingState, routing
+
+logger = logging.getLogger('core_auth.profiling')
+
+PHASES = ('auth', 'perm', 'view', 'render')
+
+
+class RequestProfile:
+    """
+    Замеры одного запроса: длительности фаз и запросы к базе.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.view_started = None
+        self.view_finished = None
+        self.render_finished = None
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.db_threads = set()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - started
+
+    def db_wrappers(self):
+        """
+        Подключает счетчик запросов к соединениям текущего потока. Соединения
+        Django свои у каждого потока, а под ASGI синхронная view выполняется
+        не в потоке middleware, поэтому счетчик ставится в каждом потоке
+        запроса, но не больше одного раза.
+        """
+        stack = ExitStack()
+        thread = threading.get_ident()
+        if thread in self.db_threads:
+            return stack
+        self.db_threads.add(thread)
+        stack.callback(self.db_threads.discard, thread)
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self.db_wrapper))
+        return stack
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.db_queries += 1
+
+    def finish(self):
+        """
+        Возвращает итоговые длительности в миллисекундах. Время view не
+        включает проверки аутентификации и прав, но включает запросы к базе.
+        """
+        finished = time.perf_counter()
+        if self.view_started is not None:
+            view_finished = self.view_finished or finished
+            self.phases['view'] = view_finished - self.view_started - self.phases['auth'] - self.phases['perm']
+            if self.view_finished is not None:
+                self.phases['render'] = (self.render_finished or finished) - self.view_finished
+        timings = {name: round(value * 1000, 3) for name, value in self.phases.items()}
+        timings['db'] = round(self.db_time * 1000, 3)
+        timings['total'] = round((finished - self.started) * 1000, 3)
+        return timings
+
+
+class OverheadBudget:
+    """
+    Доля времени запросов, потраченная на профилирование, с экспоненциальным
+    затуханием. Пока доля выше PROFILING_OVERHEAD_BUDGET, новые запросы
+    не профилируются.
+    """
+    DECAY = 0.99
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._overhead = 0.0
+        self._wall = 0.0
+
+    def allows(self):
+        return self._overhead <= auth_settings.PROFILING_OVERHEAD_BUDGET * self._wall
+
+    def add(self, wall, overhead=0.0):
+        with self._lock:
+            self._overhead = self._overhead * self.DECAY + overhead
+            self._wall = self._wall * self.DECAY + wall
+
+
+class ProfilingMixin:
+    """
+    Примесь для APIView: выделяет в профиле запроса время аутентификации
+    и проверки прав и считает запросы к базе в потоке view. Без
+    ProfilingMiddleware ничего не делает.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        profile = getattr(request, 'core_auth_profile', None)
+        if profile is None:
+            return super().dispatch(request, *args, **kwargs)
+        with profile.db_wrappers():
+            return super().dispatch(request, *args, **kwargs)
+
+    def perform_authentication(self, request):
+        profile = getattr(request, 'core_auth_profile', None)
+        if profile is None:
+            return super().perform_authentication(request)
+        with profile.phase('auth'):
+            return super().perform_authentication(request)
+
+    def check_permissions(self, request):
+        profile = getattr(request, 'core_auth_profile', None)
+        if profile is None:
+            return super().check_permissions(request)
+        with profile.phase('perm'):
+            return super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        profile = getattr(request, 'core_auth_profile', None)
+        if profile is None:
+            return super().check_object_permissions(request, obj)
+        with profile.phase('perm'):
+            return super().check_object_permissions(request, obj)
+
+
+class ProfilingMiddleware:
+    """
+    Профилирование запросов: время аутентификации, проверки прав, view
+    и рендеринга ответа, число и время запросов к базе.
+
+    Профилируется доля PROFILING_SAMPLE_RATE запросов, пока накладные
+    расходы укладываются в PROFILING_OVERHEAD_BUDGET. Результат пишется
+    в заголовок Server-Timing (PROFILING_SERVER_TIMING) и строкой JSON
+    в логгер core_auth.profiling.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.budget = OverheadBudget()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not auth_settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        profile = self.start(request)
+        if profile is None:
+            response = self.get_response(request)
+            self.budget.add(time.perf_counter() - started)
+            return response
+        with profile.db_wrappers():
+            overhead = time.perf_counter() - started
+            response = self.get_response(request)
+        return self.finish(request, response, profile, started, overhead)
+
+    async def __acall__(self, request):
+        if not auth_settings.PROFILING_SAMPLE_RATE:
+            return await self.get_response(request)
+
+        started = time.perf_counter()
+        profile = self.start(request)
+        if profile is None:
+            response = await self.get_response(request)
+            self.budget.add(time.perf_counter() - started)
+            return response
+        with profile.db_wrappers():
+            overhead = time.perf_counter() - started
+            response = await self.get_response(request)
+        return self.finish(request, response, profile, started, overhead)
+
+    def start(self, request):
+        """
+        Возвращает профиль, если запрос попал в выборку и бюджет позволяет.
+        """
+        if random.random() >= auth_settings.PROFILING_SAMPLE_RATE or not self.budget.allows():
+            return None
+        profile = RequestProfile()
+        request.core_auth_profile = profile
+        return profile
+
+    def finish(self, request, response, profile, started, overhead):
+        finishing = time.perf_counter()
+        timings = profile.finish()
+        if auth_settings.PROFILING_SERVER_TIMING:
+            response['Server-Timing'] = ', '.join(
+                f'{name};dur={value}' + (f';desc="{profile.db_queries} queries"' if name == 'db' else '')
+                for name, value in timings.items()
+            )
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'db_queries': profile.db_queries,
+            **{f'{name}_ms': value for name, value in timings.items()},
+        }))
+        finished = time.perf_counter()
+        self.budget.add(finished - started, overhead + finished - finishing)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, 'core_auth_profile', None)
+        if profile is not None:
+            profile.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        profile = getattr(request, 'core_auth_profile', None)
+        if profile is not None:
+            profile.view_finished = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: setattr(profile, 'render_finished', time.perf_counter()))
+        return response
+
+
+PRIMARY_COOKIE = 'core_auth_primary'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Закрепление чтений за основной базой для read-your-writes при
+    CORE_AUTH['DATABASE_REPLICAS'].
+
+    Небезопасные методы целиком выполняются на основной базе. После запроса
+    с записью клиент на REPLICA_STICKY_SECONDS получает cookie, а при
+    заданном REPLICA_STICKY_CACHE отметка сохраняется и по id пользователя
+    (для клиентов без cookie): его запросы в это время читают с основной базы.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not auth_settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        state = RoutingState(primary=request.method not in SAFE_METHODS or self.is_sticky(request))
+        with routing(state):
+            response = self.get_response(request)
+        if state.wrote:
+            self.set_cookie(response)
+            cache = self.sticky_cache()
+            user = getattr(request, 'user', None)
+            user_id = user.pk if user is not None and user.is_authenticated else self.token_user_id(request)
+            if cache is not None and user_id is not None:
+                cache.set(self.cache_key(user_id), True, auth_settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        if not auth_settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        state = RoutingState(primary=request.method not in SAFE_METHODS or await self.ais_sticky(request))
+        with routing(state):
+            response = await self.get_response(request)
+        if state.wrote:
+            self.set_cookie(response)
+            cache = self.sticky_cache()
+            auser = getattr(request, 'auser', None)
+            user = await auser() if auser is not None else None
+            user_id = user.pk if user is not None and user.is_authenticated else self.token_user_id(request)
+            if cache is not None and user_id is not None:
+                await cache.aset(self.cache_key(user_id), True, auth_settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    @staticmethod
+    def set_cookie(response):
+        response.set_cookie(
+            PRIMARY_COOKIE, '1', max_age=auth_settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax',
+        )
+
+    def is_sticky(self, request):
+        if request.COOKIES.get(PRIMARY_COOKIE):
+            return True
+        cache = self.sticky_cache()
+        if cache is None:
+            return False
+        user_id = self.token_user_id(request)
+        return user_id is not None and bool(cache.get(self.cache_key(user_id)))
+
+    async def ais_sticky(self, request):
+        if request.COOKIES.get(PRIMARY_COOKIE):
+            return True
+        cache = self.sticky_cache()
+        if cache is None:
+            return False
+        user_id = self.token_user_id(request)
+        return user_id is not None and bool(await cache.aget(self.cache_key(user_id)))
+
+    def sticky_cache(self):
+        alias = auth_settings.REPLICA_STICKY_CACHE
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def cache_key(user_id):
+        return f'core_auth:primary:{user_id}'
+
+    @staticmethod
+    def token_user_id(request):
+        """
+        id пользователя из Bearer-токена без проверки подписи: используется
+        только для выбора базы, поддельный токен лишь отправит чтения в
+        основную базу.
+        """
+        header = request.headers.get('Authorization', '')
+        if not header.startswith('Bearer '):
+            return None
+        try:
+            payload = jwt.decode(header[7:], options={'verify_signature': False})
+        except jwt.InvalidTokenError:
+            return None
+        return payload.get(api_settings.USER_ID_CLAIM)
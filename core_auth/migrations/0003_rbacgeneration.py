@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:46
+
+from django.db import migrations, models
+
+
+def create_singleton(apps, schema_editor):
+    RBACGeneration = apps.get_model('core_auth', 'RBACGeneration')
+    RBACGeneration.objects.get_or_create(pk=1, defaults={'version': 0})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_auth', '0002_alter_user_managers_user_role'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RBACGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_singleton, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:48
+
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import connection, migrations, models
+
+index = models.Index(django.db.models.functions.text.Upper('email'), name='core_auth_user_email_upper')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не блокирует запись в таблицу пользователей,
+    # но не может выполняться в транзакции.
+    atomic = False
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core_auth', '0005_role_hierarchy_user_roles'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(model_name='user', index=index)
+        if connection.vendor == 'postgresql'
+        else migrations.AddIndex(model_name='user', index=index),
+    ]
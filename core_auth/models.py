@@ -1,19 +1,38 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Upper
+from django.db.models.expressions import Combinable
 from django.contrib.auth.models import AbstractUser, BaseUserManager
+from django.utils.functional import cached_property
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         """
         Создает и сохраняет пользователя с указанным email и паролем.
         """
-        if not email:
-            raise ValueError('The Email field must be set')
-        email = self.normalize_email(email)
-        user = self.model(email=email, username=email, **extra_fields)
+        user = self.build_user(email, **extra_fields)
         user.set_password(password)
         user.save(using=self._db)
         return user
 
+    def create_user_with_hash(self, email, password_hash, **extra_fields):
+        """
+        Создает пользователя с уже вычисленным хешем пароля.
+        """
+        user = self.build_user(email, **extra_fields)
+        user.password = password_hash
+        user.save(using=self._db)
+        return user
+
+    def build_user(self, email, **extra_fields):
+        """
+        Возвращает несохраненного пользователя с нормализованным email.
+        """
+        if not email:
+            raise ValueError('The Email field must be set')
+        email = self.normalize_email(email)
+        return self.model(email=email, username=email, **extra_fields)
+
     def create_superuser(self, email, password=None, **extra_fields):
         """
         Создает и сохраняет суперпользователя.
@@ -34,6 +53,8 @@ class Role(models.Model):
     """
     name = models.CharField(max_length=50, unique=True)
     description = models.CharField(max_length=255, blank=True)
+    # Роль наследует правила всех родительских ролей (транзитивно).
+    parents = models.ManyToManyField('self', symmetrical=False, blank=True, related_name='children')
 
     def __str__(self):
         return self.name
@@ -53,15 +74,58 @@ class User(AbstractUser):
         blank=True, 
         related_name='users'
     )
+    # Дополнительные роли: права пользователя — объединение прав role и roles.
+    roles = models.ManyToManyField(Role, blank=True, related_name='members')
+    # Поколение токенов пользователя: записывается в каждый токен, увеличение
+    # отзывает все ранее выданные токены.
+    token_epoch = models.PositiveIntegerField(default=0)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
+    class Meta(AbstractUser.Meta):
+        # Для поиска по email без учета регистра (email__iexact, поиск в admin).
+        indexes = [models.Index(Upper('email'), name='core_auth_user_email_upper')]
+
 
     objects = CustomUserManager()
     def __str__(self):
         return self.email
 
+    def save(self, *args, **kwargs):
+        # Смена пароля (set_password + save) отзывает все выданные токены.
+        # Пересчет хеша при входе сбрасывает _password и сюда не попадает.
+        if self.pk is not None and self._password is not None:
+            self.token_epoch = F('token_epoch') + 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'token_epoch'}
+        super().save(*args, **kwargs)
+        self.__dict__.pop('role_ids', None)
+        if isinstance(self.token_epoch, Combinable):
+            self.refresh_from_db(fields=['token_epoch'])
+
+    def get_role_ids(self):
+        """
+        Запрашивает отсортированный кортеж id всех ролей пользователя:
+        основной и дополнительных.
+        """
+        ids = {self.role_id} if self.role_id else set()
+        if self.pk is not None:
+            ids.update(self.roles.values_list('pk', flat=True))
+        return tuple(sorted(ids))
+
+    @cached_property
+    def role_ids(self):
+        return self.get_role_ids()
+
+    def revoke_tokens(self, update_fields=()):
+        """
+        Отзывает все токены пользователя одним увеличением token_epoch.
+        Поля из update_fields сохраняются тем же UPDATE.
+        """
+        self.token_epoch = F('token_epoch') + 1
+        self.save(update_fields=['token_epoch', *update_fields])
+
 class BusinessElement(models.Model):
     """
     Модель для описания объектов приложения (ресурсов).
@@ -91,4 +155,17 @@ class AccessRule(models.Model):
         unique_together = ('role', 'business_element')
         
     def __str__(self):
-        return f"{self.role.name} - {self.business_element.name}"
\ No newline at end of file
+        return f"{self.role.name} - {self.business_element.name}"
+
+class RBACGeneration(models.Model):
+    """
+    Счетчик версий таблиц Role, BusinessElement и AccessRule (одна строка).
+    Увеличивается при каждом их изменении; воркеры сравнивают его со своим
+    кешем прав.
+    """
+    SINGLETON_ID = 1
+
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"RBAC generation {self.version}"
@@ -0,0 +1,211 @@
+import logging
+import os
+import select
+import threading
+import time
+from collections import defaultdict
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class BaseNotifier:
+    """
+    Транспорт уведомлений между воркерами.
+
+    publish() отправляет строку payload в канал, subscribe() регистрирует
+    callback(payload). Если транспорт мог потерять сообщения (например, после
+    переподключения), подписчики получают payload=None и должны пересинхронизироваться.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self._callbacks = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, payload):
+        raise NotImplementedError
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._callbacks[channel].append(callback)
+
+    def close(self):
+        pass
+
+    def _dispatch(self, channel, payload):
+        for callback in list(self._callbacks.get(channel, ())):
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception('Notifier callback for channel %s failed', channel)
+
+    def _dispatch_resync(self):
+        for channel in list(self._callbacks):
+            self._dispatch(channel, None)
+
+
+class LocMemNotifier(BaseNotifier):
+    """
+    Доставляет уведомления синхронно в пределах процесса. Подходит для тестов
+    и однопроцессного запуска.
+    """
+
+    def publish(self, channel, payload):
+        self._dispatch(channel, payload)
+
+
+class FileNotifier(BaseNotifier):
+    """
+    Уведомления через файлы в общем каталоге (OPTIONS['PATH']): по одному
+    append-only файлу на канал. Подписчики опрашивают файлы в фоновом потоке
+    раз в OPTIONS['POLL_INTERVAL'] секунд. Подходит для тестов и нескольких
+    процессов на одной машине.
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.path = options.get('PATH')
+        if not self.path:
+            raise ImproperlyConfigured('FileNotifier requires OPTIONS["PATH"].')
+        self.poll_interval = options.get('POLL_INTERVAL', 0.5)
+        os.makedirs(self.path, exist_ok=True)
+        self._offsets = {}
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def _channel_path(self, channel):
+        return os.path.join(self.path, channel)
+
+    def publish(self, channel, payload):
+        data = (payload.replace('\n', ' ') + '\n').encode()
+        fd = os.open(self._channel_path(channel), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def subscribe(self, channel, callback):
+        super().subscribe(channel, callback)
+        with self._lock:
+            if channel not in self._offsets:
+                try:
+                    self._offsets[channel] = os.path.getsize(self._channel_path(channel))
+                except FileNotFoundError:
+                    self._offsets[channel] = 0
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='core-auth-file-notifier', daemon=True)
+                self._thread.start()
+
+    def poll(self):
+        """
+        Читает новые строки из файлов каналов и раздает их подписчикам.
+        """
+        for channel, offset in list(self._offsets.items()):
+            try:
+                with open(self._channel_path(channel), 'rb') as f:
+                    f.seek(offset)
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            # Незавершенную строку дочитаем при следующем опросе.
+            complete = data[:data.rfind(b'\n') + 1]
+            self._offsets[channel] = offset + len(complete)
+            for line in complete.decode().splitlines():
+                self._dispatch(channel, line)
+
+    def _run(self):
+        while not self._stopped.wait(self.poll_interval):
+            self.poll()
+
+    def close(self):
+        self._stopped.set()
+
+
+class PostgresNotifier(BaseNotifier):
+    """
+    Уведомления через Postgres LISTEN/NOTIFY.
+
+    publish() выполняет pg_notify на соединении Django (OPTIONS['DATABASE'],
+    по умолчанию 'default'), поэтому внутри транзакции уведомление уходит только
+    после коммита. Подписка слушает каналы на отдельном соединении в фоновом
+    потоке и переподключается при обрыве.
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.alias = options.get('DATABASE', 'default')
+        self.reconnect_delay = options.get('RECONNECT_DELAY', 1.0)
+        self._thread = None
+        self._stopped = threading.Event()
+        self._pending_listen = set()
+
+    def publish(self, channel, payload):
+        connection = connections[self.alias]
+        if connection.vendor != 'postgresql':
+            raise ImproperlyConfigured('PostgresNotifier requires a PostgreSQL database.')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [channel, payload])
+
+    def subscribe(self, channel, callback):
+        super().subscribe(channel, callback)
+        with self._lock:
+            self._pending_listen.add(channel)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='core-auth-pg-notifier', daemon=True)
+                self._thread.start()
+
+    def _connect(self):
+        wrapper = connections[self.alias]
+        conn = wrapper.Database.connect(**wrapper.get_connection_params())
+        conn.autocommit = True
+        return conn
+
+    def _listen(self, conn, channels):
+        with conn.cursor() as cursor:
+            for channel in channels:
+                cursor.execute('LISTEN "%s"' % channel.replace('"', '""'))
+
+    def _run(self):
+        conn = None
+        while not self._stopped.is_set():
+            try:
+                if conn is None:
+                    conn = self._connect()
+                    with self._lock:
+                        self._pending_listen.update(self._callbacks)
+                    # Пока соединения не было, уведомления могли потеряться.
+                    self._dispatch_resync()
+                with self._lock:
+                    channels, self._pending_listen = self._pending_listen, set()
+                if channels:
+                    self._listen(conn, channels)
+                for channel, payload in self._wait(conn):
+                    self._dispatch(channel, payload)
+            except Exception:
+                logger.exception('Postgres notification listener failed, reconnecting')
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                conn = None
+                time.sleep(self.reconnect_delay)
+
+    def _wait(self, conn, timeout=5.0):
+        if hasattr(conn, 'poll'):
+            # psycopg2
+            if select.select([conn], [], [], timeout) != ([], [], []):
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    yield notify.channel, notify.payload
+        else:
+            # psycopg 3
+            for notify in conn.notifies(timeout=timeout):
+                yield notify.channel, notify.payload
+
+    def close(self):
+        self._stopped.set()
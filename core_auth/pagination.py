@@ -0,0 +1,55 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination
+
+from .conf import auth_settings
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация по первичному ключу для админских API:
+    страница — это WHERE id > курсор ORDER BY id LIMIT n, без OFFSET и
+    COUNT(*), поэтому стоимость не зависит от номера страницы и размера
+    таблицы.
+    """
+    ordering = 'pk'
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        self.page_size = auth_settings.ADMIN_PAGE_SIZE
+        self.max_page_size = auth_settings.ADMIN_MAX_PAGE_SIZE
+        return super().get_page_size(request)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator для списков Django admin по большим таблицам: для
+    неотфильтрованного списка на Postgres число строк берется из статистики
+    планировщика (pg_class.reltuples) вместо COUNT(*) по всей таблице.
+    Малые таблицы, таблицы без статистики и отфильтрованные списки считаются
+    точно.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = self._estimate(self.object_list)
+            if estimate is not None and estimate >= auth_settings.ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+    @staticmethod
+    def _estimate(queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+        # reltuples = -1: таблица еще ни разу не анализировалась.
+        return row[0] if row and row[0] >= 0 else None
@@ -0,0 +1,246 @@
+import threading
+
+from rest_framework import permissions
+
+from .invalidation import rbac_generation
+from .metrics import cache_requests
+from .models import AccessRule, BusinessElement, Role, User
+from .routers import use_primary
+from .user_state import user_state_cache
+
+READ = 1 << 0
+CREATE = 1 << 1
+UPDATE = 1 << 2
+DELETE = 1 << 3
+READ_ALL = 1 << 4
+UPDATE_ALL = 1 << 5
+DELETE_ALL = 1 << 6
+
+ALL_PERMISSIONS = READ | CREATE | UPDATE | DELETE | READ_ALL | UPDATE_ALL | DELETE_ALL
+
+PERMISSION_FIELDS = (
+    ('read_permission', READ),
+    ('create_permission', CREATE),
+    ('update_permission', UPDATE),
+    ('delete_permission', DELETE),
+    ('read_all_permission', READ_ALL),
+    ('update_all_permission', UPDATE_ALL),
+    ('delete_all_permission', DELETE_ALL),
+)
+
+# Имена действий для API: read, create, ..., delete_all.
+ACTIONS = {field.removesuffix('_permission'): flag for field, flag in PERMISSION_FIELDS}
+
+# Право на все записи включает право на свои.
+IMPLIED = {READ_ALL: READ, UPDATE_ALL: UPDATE, DELETE_ALL: DELETE}
+
+
+def rule_to_bits(rule):
+    """
+    Упаковывает флаги AccessRule (объект или словарь значений) в битовую маску.
+    Флаги *_all добавляют и соответствующее базовое право.
+    """
+    if not isinstance(rule, dict):
+        rule = {field: getattr(rule, field) for field, _ in PERMISSION_FIELDS}
+    bits = 0
+    for field, flag in PERMISSION_FIELDS:
+        if rule.get(field):
+            bits |= flag | IMPLIED.get(flag, 0)
+    return bits
+
+
+def bits_for_method(method):
+    """
+    Возвращает бит, необходимый для HTTP-метода, или 0 для неизвестных методов.
+    """
+    if method in permissions.SAFE_METHODS:
+        return READ
+    if method == 'POST':
+        return CREATE
+    if method in ('PUT', 'PATCH'):
+        return UPDATE
+    if method == 'DELETE':
+        return DELETE
+    return 0
+
+
+def all_bit_for_method(method):
+    """
+    Возвращает бит *_all, который дает доступ к чужим записям для HTTP-метода,
+    или 0, если у метода нет такого права.
+    """
+    if method in permissions.SAFE_METHODS:
+        return READ_ALL
+    if method in ('PUT', 'PATCH'):
+        return UPDATE_ALL
+    if method == 'DELETE':
+        return DELETE_ALL
+    return 0
+
+
+def _merge(rules, other):
+    for name, bits in other.items():
+        rules[name] = rules.get(name, 0) | bits
+
+
+def role_key(roles):
+    """
+    Приводит роль пользователя к ключу матрицы: id роли, None или
+    отсортированный кортеж id, если ролей несколько.
+    """
+    if roles is None or isinstance(roles, int):
+        return roles
+    roles = tuple(roles)
+    if len(roles) == 1:
+        return roles[0]
+    return roles or None
+
+
+def user_roles(user):
+    """
+    Ключ ролей пользователя для матрицы: все роли TokenUser (из токена) или
+    User (через user_state_cache), None для анонимного пользователя.
+    """
+    if isinstance(user, User):
+        return role_key(user_state_cache.role_ids(user))
+    return role_key(getattr(user, 'role_ids', None))
+
+
+class PermissionMatrix:
+    """
+    Скомпилированная в памяти процесса матрица (role_id, element_name) -> биты прав.
+
+    Строится лениво при первом обращении и сбрасывается сигналами при изменении
+    Role, BusinessElement и AccessRule, поэтому проверка прав стоит одного
+    обращения к словарю. Наследование ролей (Role.parents) раскрывается при
+    построении: биты роли уже включают правила всех ее предков. Права набора
+    ролей пользователя объединяются один раз и запоминаются до следующей
+    сборки. Изменения, сделанные другими воркерами, отслеживаются по поколению
+    RBAC-таблиц (core_auth.invalidation).
+    """
+    # Верхняя граница числа запомненных наборов ролей.
+    MAX_ROLE_SETS = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+
+    def _build(self):
+        # Поколение фиксируется до чтения правил: изменение, пришедшее во время
+        # построения, приведет к повторной сборке.
+        with use_primary():
+            generation = rbac_generation.sync()
+            elements = frozenset(BusinessElement.objects.values_list('name', flat=True))
+            own = {}
+            fields = [field for field, _ in PERMISSION_FIELDS]
+            for row in AccessRule.objects.values('role_id', 'business_element__name', *fields):
+                own.setdefault(row['role_id'], {})[row['business_element__name']] = rule_to_bits(row)
+            parents = {}
+            for role_id, parent_id in Role.parents.through.objects.values_list('from_role_id', 'to_role_id'):
+                parents.setdefault(role_id, []).append(parent_id)
+
+        by_role = {}
+        for role_id in own.keys() | parents.keys():
+            rules = {}
+            # Обход предков с множеством посещенных: цикл в иерархии не
+            # зацикливает сборку, роли цикла получают общие права.
+            seen, stack = {role_id}, [role_id]
+            while stack:
+                current = stack.pop()
+                _merge(rules, own.get(current, {}))
+                for parent_id in parents.get(current, ()):
+                    if parent_id not in seen:
+                        seen.add(parent_id)
+                        stack.append(parent_id)
+            if rules:
+                by_role[role_id] = rules
+        return generation, by_role, elements, {}
+
+    def _compiled(self):
+        state = self._state
+        if state is not None and state[0] >= rbac_generation.current():
+            self.hits += 1
+            _matrix_hits.inc()
+            return state
+        with self._lock:
+            self.misses += 1
+            _matrix_misses.inc()
+            if self._state is not None and self._state[0] >= rbac_generation.value:
+                return self._state
+            epoch = self._epoch
+            state = self._build()
+            self.rebuilds += 1
+            # Если матрицу сбросили во время построения, результат уже мог
+            # устареть: отдаем его текущему запросу, но не кешируем.
+            if epoch == self._epoch:
+                self._state = state
+            return state
+
+    def _rules(self, state, roles):
+        _, by_role, _, role_sets = state
+        key = role_key(roles)
+        if not isinstance(key, tuple):
+            return by_role.get(key, {})
+        rules = role_sets.get(key)
+        if rules is None:
+            rules = {}
+            for role_id in key:
+                _merge(rules, by_role.get(role_id, {}))
+            if len(role_sets) < self.MAX_ROLE_SETS:
+                role_sets[key] = rules
+        return rules
+
+    def lookup(self, roles, element_name):
+        """
+        Возвращает биты прав роли (или набора ролей, см. role_key) на
+        бизнес-элемент: 0, если правила нет, и None, если такого
+        бизнес-элемента не существует.
+        """
+        state = self._compiled()
+        if element_name not in state[2]:
+            return None
+        return self._rules(state, roles).get(element_name, 0)
+
+    def has_element(self, element_name):
+        """
+        Проверяет, что бизнес-элемент существует.
+        """
+        return element_name in self._compiled()[2]
+
+    def role_permissions(self, roles):
+        """
+        Возвращает поколение матрицы и словарь element_name -> биты для роли
+        или набора ролей (только элементы с ненулевыми правами).
+        """
+        state = self._compiled()
+        return state[0], {name: bits for name, bits in self._rules(state, roles).items() if bits}
+
+    def role_rules(self, roles):
+        """
+        Возвращает словарь element_name -> биты для роли или набора ролей
+        и множество всех бизнес-элементов из одного снимка матрицы.
+        """
+        state = self._compiled()
+        return self._rules(state, roles), state[2]
+
+    def invalidate(self):
+        self._epoch += 1
+        self._state = None
+
+    def stats(self):
+        return {
+            'generation': rbac_generation.value,
+            'hits': self.hits,
+            'misses': self.misses,
+            'rebuilds': self.rebuilds,
+        }
+
+
+_matrix_hits = cache_requests.labels('permission_matrix', 'hit')
+_matrix_misses = cache_requests.labels('permission_matrix', 'miss')
+
+permission_matrix = PermissionMatrix()
@@ -1,10 +1,12 @@
 from rest_framework import permissions
-from .models import AccessRule, BusinessElement
+from .metrics import permission_checks
+from .permission_cache import bits_for_method, permission_matrix, user_roles
+from .tokens import SUPERUSER_CLAIM, token_permissions
 
 class HasAccessToBusinessElement(permissions.BasePermission):
     """
     Кастомный класс, который проверяет права доступа пользователя к определенному
-    бизнес-элементу.
+    бизнес-элементу. Права берутся из скомпилированной матрицы permission_matrix.
     """
     message = "У вас нет прав для выполнения этого действия."
 
@@ -13,30 +15,46 @@ class HasAccessToBusinessElement(permissions.BasePermission):
             return False
 
         business_element_name = view.business_element_name
-        
-        try:
-            business_element = BusinessElement.objects.get(name=business_element_name)
-        except BusinessElement.DoesNotExist:
+        roles = user_roles(request.user)
+
+        bits = permission_matrix.lookup(roles, business_element_name)
+        if bits is None:
+            permission_checks.labels(business_element_name, 'missing').inc()
             return False
         if request.user.is_superuser:
-            return True
-        if not hasattr(request.user, 'role') or not request.user.role:
+            allowed = True
+        elif not roles:
+            allowed = False
+        else:
+            required = bits_for_method(request.method)
+            allowed = bool(required and bits & required)
+        permission_checks.labels(business_element_name, 'allow' if allowed else 'deny').inc()
+        return allowed
+
+
+class HasTokenAccessToBusinessElement(HasAccessToBusinessElement):
+    """
+    Проверяет права по битовым маскам из claims access-токена без обращения
+    к базе. Для токенов без прав (режим встраивания выключен) или с правами
+    из устаревшего поколения RBAC используется обычная проверка
+    HasAccessToBusinessElement.
+    """
+
+    def has_permission(self, request, view):
+        permissions = token_permissions(request.auth)
+        if permissions is None:
+            return super().has_permission(request, view)
+        if not request.user.is_authenticated:
             return False
-        try:
-            access_rule = AccessRule.objects.get(role=request.user.role, business_element=business_element)
-        except AccessRule.DoesNotExist:
+        business_element_name = view.business_element_name
+        if not permission_matrix.has_element(business_element_name):
+            permission_checks.labels(business_element_name, 'missing').inc()
             return False
-
-        if request.method in permissions.SAFE_METHODS:
-            return access_rule.read_permission
-        
-        if request.method == 'POST':
-            return access_rule.create_permission
-            
-        if request.method in ['PUT', 'PATCH']:
-            return access_rule.update_permission
-            
-        if request.method == 'DELETE':
-            return access_rule.delete_permission
-            
-        return False
\ No newline at end of file
+        if request.auth.get(SUPERUSER_CLAIM):
+            allowed = True
+        else:
+            bits = permissions.get(business_element_name, 0)
+            required = bits_for_method(request.method)
+            allowed = bool(required and bits & required)
+        permission_checks.labels(business_element_name, 'allow' if allowed else 'deny').inc()
+        return allowed
@@ -0,0 +1,128 @@
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Upper
+
+from .hashing import provisioning_hasher
+from .models import Role, User
+from .serializers import UserProvisionItemSerializer
+
+BATCH_SIZE = 1000
+EMAIL_EXISTS = 'user with this email already exists.'
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def provision_users(rows, hasher=None, batch_size=BATCH_SIZE):
+    """
+    Массовое создание пользователей из списка словарей (поля
+    UserProvisionItemSerializer).
+
+    Строки проверяются по отдельности, email и роли — одним запросом на
+    пачку, пароли хешируются в пуле процессов hasher (по умолчанию общий
+    provisioning_hasher; если он занят другой пачкой, до записи в базу
+    бросается PoolSaturated), вставка — bulk_create по batch_size строк.
+    Ошибочная строка не прерывает остальные. Возвращает
+    {'created': [{'index', 'id', 'email'}], 'errors': [{'index', 'errors'}]},
+    index — номер строки во входных данных.
+    """
+    errors = {}
+    valid = {}
+    for index, row in enumerate(rows):
+        item = UserProvisionItemSerializer(data=row)
+        if item.is_valid():
+            valid[index] = item.validated_data
+        else:
+            errors[index] = item.errors
+
+    # email уникален без учета регистра: повтор в пачке и существующие
+    # пользователи ищутся по индексу UPPER(email).
+    by_email = {}
+    for index, attrs in list(valid.items()):
+        key = attrs['email'].upper()
+        if key in by_email:
+            errors[index] = {'email': ['Duplicate email in this batch.']}
+            del valid[index]
+        else:
+            by_email[key] = index
+    for keys in _chunks(list(by_email), batch_size):
+        existing = (
+            User.objects
+            .annotate(email_upper=Upper('email'))
+            .filter(email_upper__in=keys)
+            .values_list('email_upper', flat=True)
+        )
+        for key in existing:
+            index = by_email[key]
+            errors[index] = {'email': [EMAIL_EXISTS]}
+            del valid[index]
+
+    role_ids = {role for attrs in valid.values() for role in [attrs['role'], *attrs['roles']] if role}
+    known_roles = set(Role.objects.filter(pk__in=role_ids).values_list('pk', flat=True))
+    for index, attrs in list(valid.items()):
+        missing = [role for role in [attrs['role'], *attrs['roles']] if role and role not in known_roles]
+        if missing:
+            errors[index] = {'roles': [f'Role {role} does not exist.' for role in missing]}
+            del valid[index]
+
+    indexes = list(valid)
+    hasher = hasher or provisioning_hasher
+    passwords = hasher.make_passwords(valid[index]['password'] for index in indexes)
+
+    users = []
+    for index, password in zip(indexes, passwords):
+        attrs = valid[index]
+        user = User.objects.build_user(
+            attrs['email'],
+            first_name=attrs['first_name'],
+            last_name=attrs['last_name'],
+            role_id=attrs['role'],
+            is_active=attrs['is_active'],
+        )
+        user.password = password
+        users.append((index, user))
+
+    created = []
+    for chunk in _chunks(users, batch_size):
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([user for _, user in chunk])
+                _add_roles(chunk, valid)
+        except IntegrityError:
+            # Тот же email успели создать параллельно: пачка повторяется
+            # построчно, чтобы отклонить только конфликтующие строки.
+            chunk = _insert_one_by_one(chunk, valid, errors)
+        created.extend({'index': index, 'id': user.pk, 'email': user.email} for index, user in chunk)
+
+    return {
+        'created': created,
+        'errors': [{'index': index, 'errors': errors[index]} for index in sorted(errors)],
+    }
+
+
+def _add_roles(chunk, valid):
+    # bulk_create не отправляет m2m_changed; новые пользователи еще не в
+    # кешах состояния, поэтому инвалидация не нужна.
+    Membership = User.roles.through
+    Membership.objects.bulk_create([
+        Membership(user_id=user.pk, role_id=role)
+        for index, user in chunk
+        for role in dict.fromkeys(valid[index]['roles'])
+    ])
+
+
+def _insert_one_by_one(chunk, valid, errors):
+    inserted = []
+    for index, user in chunk:
+        user.pk = None
+        user._state.adding = True
+        try:
+            with transaction.atomic():
+                user.save()
+                _add_roles([(index, user)], valid)
+        except IntegrityError:
+            errors[index] = {'email': [EMAIL_EXISTS]}
+        else:
+            inserted.append((index, user))
+    return inserted
@@ -0,0 +1,287 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .conf import auth_settings
+from .invalidation import get_notifier, listener_enabled
+from .routers import use_primary
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_CHANNEL = 'core_auth_revocation'
+
+
+class BloomFilter:
+    """
+    Фильтр Блума для строковых ключей: ложноположительные ответы возможны
+    с вероятностью около error_rate, ложноотрицательные — нет.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class DatabaseRevocationBackend:
+    """
+    Проверка отзыва запросом к таблицам token_blacklist (поведение SimpleJWT).
+    """
+
+    def __init__(self, **options):
+        self.options = options
+
+    def is_revoked(self, jti):
+        with use_primary():
+            return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+    def revoke(self, jti, exp):
+        pass
+
+    def load(self):
+        pass
+
+
+class InMemoryRevocationBackend:
+    """
+    Множество отозванных jti в памяти процесса со временем жизни до exp токена.
+
+    Postgres (BlacklistedToken) остается источником истины: множество
+    загружается из него при первом обращении, новые отзывы других воркеров
+    приходят через транспорт уведомлений, а раз в OPTIONS['RESYNC_INTERVAL']
+    секунд дочитываются записи BlacklistedToken с id больше последнего
+    известного. Опционально перед множеством стоит фильтр Блума
+    (OPTIONS['BLOOM_CAPACITY'], OPTIONS['BLOOM_ERROR_RATE']).
+
+    Дочитывание и очистка истекших записей выполняются фоновым потоком
+    процесса. Новые множество и фильтр строятся без блокировки и
+    подменяются целиком, поэтому проверки никогда не ждут ни базы,
+    ни перестроения фильтра.
+    """
+
+    def __init__(self, **options):
+        self.resync_interval = options.get('RESYNC_INTERVAL', 30)
+        self.purge_interval = options.get('PURGE_INTERVAL', 60)
+        self.bloom_capacity = options.get('BLOOM_CAPACITY', 0)
+        self.bloom_error_rate = options.get('BLOOM_ERROR_RATE', 0.001)
+        self._lock = threading.Lock()
+        # Одно перестроение за раз: load() и очистка фонового потока.
+        self._rebuild_lock = threading.Lock()
+        self._revoked = {}
+        self._bloom = None
+        # Отзывы, пришедшие во время перестроения: переносятся в новое множество.
+        self._pending = None
+        self._last_id = 0
+        self._loaded_pid = None
+        self._thread_pid = None
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._synced_at = 0.0
+        self._purged_at = 0.0
+
+    def _new_bloom(self, size):
+        if not self.bloom_capacity:
+            return None
+        return BloomFilter(max(self.bloom_capacity, size * 2), self.bloom_error_rate)
+
+    def _add(self, jti, exp):
+        self._revoked[jti] = exp
+        if self._bloom is not None:
+            self._bloom.add(jti)
+        if self._pending is not None:
+            self._pending.append((jti, exp))
+
+    def _swap(self, revoked):
+        """
+        Строит фильтр для нового множества без блокировки и подменяет
+        множество и фильтр, добавив отзывы, пришедшие за это время.
+        """
+        bloom = self._new_bloom(len(revoked))
+        if bloom is not None:
+            for jti in revoked:
+                bloom.add(jti)
+        with self._lock:
+            for jti, exp in self._pending:
+                revoked[jti] = exp
+                if bloom is not None:
+                    bloom.add(jti)
+            self._pending = None
+            self._revoked, self._bloom = revoked, bloom
+
+    def load(self):
+        """
+        Загружает из базы все действующие отозванные токены.
+        """
+        with self._rebuild_lock:
+            with self._lock:
+                self._pending = []
+            # Сначала фиксируем последний id: строки, добавленные во время
+            # загрузки, дочитает _resync().
+            with use_primary():
+                last_id = BlacklistedToken.objects.order_by('-id').values_list('id', flat=True).first() or 0
+                rows = (
+                    BlacklistedToken.objects
+                    .filter(id__lte=last_id, token__expires_at__gt=timezone.now())
+                    .values_list('token__jti', 'token__expires_at')
+                )
+                revoked = {}
+                for jti, expires_at in rows.iterator(chunk_size=10000):
+                    revoked[jti] = int(expires_at.timestamp())
+            self._swap(revoked)
+            self._last_id = last_id
+            self._synced_at = self._purged_at = time.monotonic()
+        if self._loaded_pid != os.getpid():
+            self._loaded_pid = os.getpid()
+            if listener_enabled():
+                get_notifier().subscribe(REVOCATION_CHANNEL, self._on_message)
+        self._ensure_thread()
+
+    def _resync(self):
+        with use_primary():
+            rows = list(
+                BlacklistedToken.objects
+                .filter(id__gt=self._last_id)
+                .values_list('id', 'token__jti', 'token__expires_at')
+                .order_by('id')
+            )
+        with self._lock:
+            for row_id, jti, expires_at in rows:
+                self._add(jti, int(expires_at.timestamp()))
+                self._last_id = max(self._last_id, row_id)
+        self._synced_at = time.monotonic()
+
+    def _purge(self, now):
+        with self._rebuild_lock:
+            with self._lock:
+                self._pending = []
+                snapshot = self._revoked.copy()
+            self._swap({jti: exp for jti, exp in snapshot.items() if exp > now})
+            self._purged_at = time.monotonic()
+
+    def maintain(self):
+        """
+        Дочитывает базу и удаляет истекшие записи, если подошел срок.
+        """
+        monotonic = time.monotonic()
+        if monotonic - self._synced_at >= self.resync_interval:
+            self._resync()
+        if monotonic - self._purged_at >= self.purge_interval:
+            self._purge(time.time())
+
+    def _ensure_thread(self):
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._run, name='core-auth-revocation', daemon=True).start()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(min(self.resync_interval, self.purge_interval))
+            self._wakeup.clear()
+            if self._closed:
+                break
+            close_old_connections()
+            try:
+                self.maintain()
+            except Exception:
+                logger.exception('Failed to refresh revoked tokens')
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+
+    def _on_message(self, payload):
+        if payload is None:
+            # Уведомления могли потеряться: дочитываем базу сейчас же.
+            self._synced_at = 0.0
+            self._wakeup.set()
+            return
+        jti, exp = payload.split()
+        with self._lock:
+            self._add(jti, int(exp))
+
+    def is_revoked(self, jti):
+        if self._loaded_pid != os.getpid():
+            self.load()
+        bloom = self._bloom
+        if bloom is not None and jti not in bloom:
+            return False
+        exp = self._revoked.get(jti)
+        return exp is not None and exp > time.time()
+
+    def revoke(self, jti, exp):
+        """
+        Отмечает токен отозванным в этом процессе и после коммита рассылает
+        отзыв остальным воркерам. Запись в BlacklistedToken делает вызывающий.
+        """
+        with self._lock:
+            self._add(jti, exp)
+        if listener_enabled():
+            transaction.on_commit(lambda: get_notifier().publish(REVOCATION_CHANNEL, f'{jti} {exp}'))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_revocation_backend():
+    """
+    Возвращает хранилище отзывов из настройки CORE_AUTH['REVOCATION_BACKEND'].
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = auth_settings.REVOCATION_BACKEND
+                _backend = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _backend
+
+
+def _reset_backend(setting, **kwargs):
+    global _backend
+    if setting == 'CORE_AUTH':
+        if hasattr(_backend, 'close'):
+            _backend.close()
+        _backend = None
+
+
+setting_changed.connect(_reset_backend)
+
+
+def warm_up():
+    """
+    Заранее загружает хранилище отзывов, чтобы первый запрос воркера не ждал.
+
+    Вызывается при импорте wsgi/asgi, поэтому недоступная или еще не
+    мигрированная база не должна ронять процесс: ошибка пишется в лог,
+    а загрузку повторит первое обращение к хранилищу.
+    """
+    try:
+        get_revocation_backend().load()
+    except Exception:
+        logger.exception('Revocation store warm-up failed; it will be loaded on first use')
@@ -0,0 +1,81 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .conf import auth_settings
+
+
+class RoutingState:
+    """
+    Маршрутизация текущего запроса: primary — читать с основной базы,
+    wrote — в запросе была запись.
+    """
+    __slots__ = ('primary', 'wrote')
+
+    def __init__(self, primary=False):
+        self.primary = primary
+        self.wrote = False
+
+
+_routing = ContextVar('core_auth_routing', default=None)
+
+
+def current_routing():
+    return _routing.get()
+
+
+@contextmanager
+def routing(state):
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+def use_primary():
+    """
+    Контекст, в котором все чтения идут в основную базу. Используется для
+    данных, которые кешируются в памяти процесса (матрица прав, состояние
+    пользователей, отозванные токены): закешированное отставание реплики
+    пережило бы инвалидацию.
+    """
+    return routing(RoutingState(primary=True))
+
+
+class ReplicaRouter:
+    """
+    Чтение — со случайной реплики из CORE_AUTH['DATABASE_REPLICAS'], запись
+    и чтение внутри транзакции — в основную базу. После первой записи
+    остальные чтения того же запроса тоже идут в основную базу; закрепление
+    между запросами делает ReplicaRoutingMiddleware. Без реплик роутер
+    ничего не меняет.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = auth_settings.DATABASE_REPLICAS
+        if not replicas:
+            return None
+        state = _routing.get()
+        if state is not None and state.primary or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.primary = state.wrote = True
+        return DEFAULT_DB_ALIAS if auth_settings.DATABASE_REPLICAS else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *auth_settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in auth_settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -1,5 +1,16 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as BaseTokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .coalescing import refresh_coalescer
+from .conf import auth_settings
+from .metrics import token_refresh_seconds
 from .models import User, Role, BusinessElement, AccessRule
+from .permission_cache import ACTIONS, PERMISSION_FIELDS
+from .signals import rbac_changed
+from .tokens import RefreshToken, is_token_epoch_current, set_permission_claims, set_user_claims
 from django.contrib.auth.password_validation import validate_password
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -51,4 +62,189 @@ class BusinessElementSerializer(serializers.ModelSerializer):
 class AccessRuleSerializer(serializers.ModelSerializer):
     class Meta:
         model = AccessRule
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+
+class AccessRuleBulkItemSerializer(serializers.Serializer):
+    """
+    Правило для массовой загрузки: id роли и бизнес-элемента без запроса
+    на каждую строку; отсутствующие флаги считаются False.
+    """
+    role = serializers.IntegerField(min_value=1)
+    business_element = serializers.IntegerField(min_value=1)
+    read_permission = serializers.BooleanField(default=False)
+    create_permission = serializers.BooleanField(default=False)
+    update_permission = serializers.BooleanField(default=False)
+    delete_permission = serializers.BooleanField(default=False)
+    read_all_permission = serializers.BooleanField(default=False)
+    update_all_permission = serializers.BooleanField(default=False)
+    delete_all_permission = serializers.BooleanField(default=False)
+
+
+class AccessRuleBulkSerializer(serializers.Serializer):
+    """
+    Массовое создание и обновление правил по паре (role, business_element)
+    одним INSERT ... ON CONFLICT DO UPDATE в одной транзакции.
+    """
+    rules = AccessRuleBulkItemSerializer(many=True, allow_empty=False)
+
+    def to_internal_value(self, data):
+        rules = data.get('rules') if isinstance(data, dict) else None
+        if isinstance(rules, list) and len(rules) > auth_settings.ACCESS_RULE_BULK_LIMIT:
+            raise serializers.ValidationError(
+                {'rules': f'At most {auth_settings.ACCESS_RULE_BULK_LIMIT} rules per request.'}
+            )
+        return super().to_internal_value(data)
+
+    def validate_rules(self, rules):
+        roles = set(Role.objects.filter(pk__in={rule['role'] for rule in rules}).values_list('pk', flat=True))
+        elements = set(
+            BusinessElement.objects
+            .filter(pk__in={rule['business_element'] for rule in rules})
+            .values_list('pk', flat=True)
+        )
+        errors = {}
+        for index, rule in enumerate(rules):
+            if rule['role'] not in roles:
+                errors[index] = {'role': f"Role {rule['role']} does not exist."}
+            elif rule['business_element'] not in elements:
+                errors[index] = {'business_element': f"Business element {rule['business_element']} does not exist."}
+        if errors:
+            raise serializers.ValidationError(errors)
+        # ON CONFLICT не может изменить одну строку дважды: повтор пары
+        # заменяет предыдущее значение.
+        return list({(rule['role'], rule['business_element']): rule for rule in rules}.values())
+
+    def save(self):
+        fields = [field for field, _ in PERMISSION_FIELDS]
+        rules = [
+            AccessRule(
+                role_id=rule['role'],
+                business_element_id=rule['business_element'],
+                **{field: rule[field] for field in fields},
+            )
+            for rule in self.validated_data['rules']
+        ]
+        with transaction.atomic():
+            AccessRule.objects.bulk_create(
+                rules,
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=['role', 'business_element'],
+                update_fields=fields,
+            )
+            # bulk_create не отправляет сигналы: одна инвалидация на всю загрузку.
+            rbac_changed(AccessRule)
+        return len(rules)
+
+
+class UserProvisionItemSerializer(serializers.Serializer):
+    """
+    Строка массового создания пользователей. Без пароля пользователь
+    создается с неиспользуемым паролем и задает его через сброс.
+    Существование ролей проверяется для всей пачки сразу.
+    """
+    email = serializers.EmailField(max_length=254)
+    first_name = serializers.CharField(max_length=150, required=False, allow_blank=True, default='')
+    last_name = serializers.CharField(max_length=150, required=False, allow_blank=True, default='')
+    password = serializers.CharField(required=False, allow_null=True, default=None, trim_whitespace=False)
+    role = serializers.IntegerField(min_value=1, required=False, allow_null=True, default=None)
+    roles = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list)
+    is_active = serializers.BooleanField(default=True)
+
+    def validate(self, attrs):
+        attrs['email'] = User.objects.normalize_email(attrs['email'])
+        if attrs['password'] is not None:
+            user = User.objects.build_user(attrs['email'], first_name=attrs['first_name'], last_name=attrs['last_name'])
+            try:
+                validate_password(attrs['password'], user)
+            except DjangoValidationError as e:
+                raise serializers.ValidationError({'password': list(e.messages)})
+        return attrs
+
+
+class UserProvisioningSerializer(serializers.Serializer):
+    """
+    Пачка пользователей для POST admin/users/bulk/. Строки проверяются
+    по отдельности в core_auth.provisioning, здесь — только размер пачки.
+    """
+    users = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+
+    def validate_users(self, users):
+        if len(users) > auth_settings.USER_PROVISIONING_LIMIT:
+            raise serializers.ValidationError(f'At most {auth_settings.USER_PROVISIONING_LIMIT} users per request.')
+        return users
+
+
+class PermissionCheckItemSerializer(serializers.Serializer):
+    element = serializers.CharField(max_length=100)
+    action = serializers.ChoiceField(choices=list(ACTIONS))
+
+
+class PermissionCheckSerializer(serializers.Serializer):
+    """
+    Список пар (бизнес-элемент, действие) для пакетной проверки прав.
+    """
+    checks = PermissionCheckItemSerializer(many=True, allow_empty=False, max_length=500)
+
+
+class TokenIntrospectionSerializer(serializers.Serializer):
+    """
+    Один токен (token) или пакет токенов (tokens) для интроспекции.
+    """
+    token = serializers.CharField(required=False)
+    tokens = serializers.ListField(child=serializers.CharField(), required=False, allow_empty=False)
+
+    def validate(self, attrs):
+        if ('token' in attrs) == ('tokens' in attrs):
+            raise serializers.ValidationError("Pass either 'token' or 'tokens'.")
+        if len(attrs.get('tokens', ())) > auth_settings.INTROSPECTION_BATCH_LIMIT:
+            raise serializers.ValidationError(
+                {'tokens': f'At most {auth_settings.INTROSPECTION_BATCH_LIMIT} tokens per request.'}
+            )
+        return attrs
+
+
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    """
+    Обновление токенов, которое пересчитывает встроенные поля и права
+    пользователя, чтобы после изменения роли или RBAC новые access-токены
+    несли актуальные значения.
+    """
+    token_class = RefreshToken
+
+    @token_refresh_seconds.time()
+    def validate(self, attrs):
+        return refresh_coalescer.refresh(attrs['refresh'], lambda: self.perform_refresh(attrs['refresh']))
+
+    def perform_refresh(self, raw_token):
+        refresh = self.token_class(raw_token)
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM, None)
+        if user_id:
+            user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+            if not api_settings.USER_AUTHENTICATION_RULE(user):
+                raise AuthenticationFailed(
+                    self.error_messages['no_active_account'],
+                    'no_active_account',
+                )
+            if not is_token_epoch_current(refresh, user.token_epoch):
+                raise AuthenticationFailed('Token has been revoked', 'token_revoked')
+            set_user_claims(refresh, user)
+            if auth_settings.EMBED_PERMISSIONS_IN_TOKEN:
+                set_permission_claims(refresh, user)
+
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+
+            data['refresh'] = str(refresh)
+
+        return data
\ No newline at end of file
@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .invalidation import bump_rbac_generation
+from .models import AccessRule, BusinessElement, Role, User
+from .permission_cache import permission_matrix
+from .user_state import user_state_cache
+
+RBAC_MODELS = (Role, BusinessElement, AccessRule)
+
+
+def rbac_changed(sender, **kwargs):
+    """
+    Сбрасывает матрицу прав после изменения ролей, бизнес-элементов или правил
+    и увеличивает поколение RBAC, чтобы изменение увидели остальные воркеры.
+    Повторный сброс после коммита нужен, чтобы параллельный запрос не закешировал
+    данные, прочитанные до фиксации транзакции.
+    """
+    permission_matrix.invalidate()
+    bump_rbac_generation()
+    transaction.on_commit(permission_matrix.invalidate)
+
+
+for model in RBAC_MODELS:
+    post_save.connect(rbac_changed, sender=model, dispatch_uid=f'rbac_save_{model.__name__}')
+    post_delete.connect(rbac_changed, sender=model, dispatch_uid=f'rbac_delete_{model.__name__}')
+
+
+def role_parents_changed(sender, action, **kwargs):
+    """
+    Изменение иерархии ролей меняет унаследованные права так же, как
+    изменение правил.
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        rbac_changed(sender)
+
+
+m2m_changed.connect(role_parents_changed, sender=Role.parents.through, dispatch_uid='rbac_role_parents')
+
+
+def user_roles_changed(sender, instance, action, **kwargs):
+    """
+    Сбрасывает закешированные наборы ролей пользователей. Токены получают
+    новые роли при следующем token/refresh/, как и при смене role.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, User):
+        instance.__dict__.pop('role_ids', None)
+        user_state_cache.changed(instance.pk)
+    elif kwargs.get('pk_set'):
+        # role.members.add(...): изменились роли пользователей из pk_set.
+        for user_id in kwargs['pk_set']:
+            user_state_cache.changed(user_id)
+    else:
+        user_state_cache.clear()
+
+
+m2m_changed.connect(user_roles_changed, sender=User.roles.through, dispatch_uid='user_roles')
+
+
+def user_changed(sender, instance, **kwargs):
+    """
+    Сбрасывает закешированное состояние пользователя (is_active, token_epoch)
+    в этом процессе и, если включен слушатель уведомлений, в остальных воркерах.
+    Запись только last_login при каждом входе состояние не меняет.
+    """
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    user_state_cache.changed(instance.pk)
+
+
+post_save.connect(user_changed, sender=User, dispatch_uid='user_state_save')
+post_delete.connect(user_changed, sender=User, dispatch_uid='user_state_delete')
@@ -1,7 +1,60 @@
-from rest_framework.test import APITestCase
+import copy
+import glob
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+import jwt
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.contrib.auth.hashers import check_password
+from django.core.management import call_command
+from django.db import connections
+from django.db.utils import ConnectionHandler, OperationalError
+from django.core.management.base import CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from rest_framework.generics import ListAPIView
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework import status
 from django.urls import reverse
+from django.utils import timezone
+from core_auth import serializers
 from core_auth.models import User, Role, BusinessElement, AccessRule
+from core_auth.permission_cache import permission_matrix, rule_to_bits, READ, READ_ALL, UPDATE, UPDATE_ALL
+from core_auth.invalidation import RBAC_CHANNEL, enable_listener, get_notifier, rbac_generation, read_rbac_generation
+from core_auth.notifiers import FileNotifier
+from core_auth.authentication import ClaimsJWTAuthentication, TokenUser
+from core_auth.permissions import HasAccessToBusinessElement, HasTokenAccessToBusinessElement
+from core_auth.serializers import UserProfileSerializer
+from core_auth.views import TestResourceView
+from core_auth.async_views import AsyncUserLoginView, AsyncUserRegistrationView
+from core_auth.coalescing import RefreshCoalescer, refresh_coalescer
+from core_auth.filters import BusinessElementScopeMixin
+from core_auth.hashing import BatchPasswordHasher, PasswordHashingPool, hashing_pool, provisioning_hasher
+from core_auth.introspection import IntrospectionCache, introspect, introspection_cache
+from core_auth.keys import get_key_ring
+from jwt.algorithms import has_crypto
+from core_auth.last_login import last_login_recorder
+from core_auth.metrics import registry
+from core_auth.pagination import EstimatedCountPaginator
+from core_auth.middleware.custom_middleware import PRIMARY_COOKIE, ProfilingMiddleware, ReplicaRoutingMiddleware
+from core_auth.routers import ReplicaRouter, RoutingState, routing, use_primary
+from core_auth.revocation import BloomFilter, get_revocation_backend, warm_up
+from core_auth.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
 
 class AuthAPITests(APITestCase):
     def setUp(self):
@@ -22,6 +75,7 @@ class AuthAPITests(APITestCase):
         self.delete_url = reverse('delete')
         self.test_resource_url = reverse('test-resource')
         self.superuser = User.objects.create_superuser('admin@test.com', 'admin_password')
+        permission_matrix.invalidate()
 
     def _get_auth_token(self, user_data=None):
         if user_data is None:
@@ -162,4 +216,1081 @@ class AuthAPITests(APITestCase):
         response = self.client.post(reverse('access-rule-list'), rule_data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(AccessRule.objects.count(), initial_rule_count + 1)
-        self.assertTrue(AccessRule.objects.get(role=test_role, business_element=test_be).read_permission)
\ No newline at end of file
+        self.assertTrue(AccessRule.objects.get(role=test_role, business_element=test_be).read_permission)
+
+class PermissionMatrixTests(APITestCase):
+    def setUp(self):
+        permission_matrix.invalidate()
+        self.role = Role.objects.create(name='matrix_role')
+        self.element = BusinessElement.objects.create(name='test_resource')
+        self.rule = AccessRule.objects.create(role=self.role, business_element=self.element, read_permission=True)
+        self.user = User.objects.create_user('matrix@example.com', 'password123', role=self.role)
+        self.client.force_authenticate(self.user)
+
+    def test_lookup_uses_compiled_matrix(self):
+        self.assertEqual(permission_matrix.lookup(self.role.id, 'test_resource'), READ)
+        self.assertIsNone(permission_matrix.lookup(self.role.id, 'missing_element'))
+        rebuilds = permission_matrix.stats()['rebuilds']
+        # Первый запрос загружает роли пользователя в user_state_cache.
+        self.client.get(reverse('test-resource'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('test-resource'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(permission_matrix.stats()['rebuilds'], rebuilds)
+
+    def test_admin_viewset_change_invalidates_matrix(self):
+        self.assertEqual(self.client.get(reverse('test-resource')).status_code, status.HTTP_200_OK)
+        self.client.force_authenticate(User.objects.create_superuser('root@example.com', 'admin_password'))
+        response = self.client.patch(
+            reverse('access-rule-detail', args=[self.rule.id]),
+            {'read_permission': False, 'update_permission': True},
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(permission_matrix.lookup(self.role.id, 'test_resource'), UPDATE)
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(reverse('test-resource')).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_delete_element_invalidates_matrix(self):
+        self.assertEqual(permission_matrix.lookup(self.role.id, 'test_resource'), READ)
+        self.element.delete()
+        self.assertIsNone(permission_matrix.lookup(self.role.id, 'test_resource'))
+
+
+LOCMEM_NOTIFIER = {'BACKEND': 'core_auth.notifiers.LocMemNotifier'}
+
+
+@override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'RBAC_GENERATION_CHECK_INTERVAL': 3600})
+class RBACInvalidationTests(APITestCase):
+    def setUp(self):
+        permission_matrix.invalidate()
+        self.role = Role.objects.create(name='bus_role')
+        self.element = BusinessElement.objects.create(name='bus_element')
+        self.rule = AccessRule.objects.create(role=self.role, business_element=self.element, read_permission=True)
+
+    def test_rbac_change_bumps_generation(self):
+        generation = read_rbac_generation()
+        Role.objects.create(name='another_role')
+        self.assertEqual(read_rbac_generation(), generation + 1)
+        self.rule.delete()
+        self.assertEqual(read_rbac_generation(), generation + 2)
+
+    def test_notification_from_other_worker_invalidates_matrix(self):
+        enable_listener()
+        self.addCleanup(enable_listener, False)
+        self.assertEqual(permission_matrix.lookup(self.role.id, 'bus_element'), READ)
+
+        # Изменение "другого воркера": сигналы этого процесса не срабатывают.
+        AccessRule.objects.filter(pk=self.rule.pk).update(read_permission=False)
+        self.assertEqual(permission_matrix.lookup(self.role.id, 'bus_element'), READ)
+
+        get_notifier().publish(RBAC_CHANNEL, str(rbac_generation.value + 1))
+        self.assertEqual(permission_matrix.lookup(self.role.id, 'bus_element'), 0)
+
+    def test_file_notifier_delivers_between_instances(self):
+        path = tempfile.mkdtemp()
+        publisher = FileNotifier(PATH=path, POLL_INTERVAL=3600)
+        subscriber = FileNotifier(PATH=path, POLL_INTERVAL=3600)
+        self.addCleanup(subscriber.close)
+        received = []
+        subscriber.subscribe(RBAC_CHANNEL, received.append)
+        publisher.publish(RBAC_CHANNEL, '7')
+        publisher.publish(RBAC_CHANNEL, '8')
+        subscriber.poll()
+        self.assertEqual(received, ['7', '8'])
+
+
+class ClaimsTestResourceView(TestResourceView):
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated, HasTokenAccessToBusinessElement]
+
+
+class TokenPermissionTestResourceView(TestResourceView):
+    permission_classes = [IsAuthenticated, HasTokenAccessToBusinessElement]
+
+
+@override_settings(CORE_AUTH={
+    'RBAC_NOTIFIER': LOCMEM_NOTIFIER,
+    'RBAC_GENERATION_CHECK_INTERVAL': 3600,
+    'EMBED_PERMISSIONS_IN_TOKEN': True,
+})
+class TokenClaimsTests(APITestCase):
+    def setUp(self):
+        # Поколение в памяти переживает откат транзакции теста.
+        rbac_generation.reset()
+        permission_matrix.invalidate()
+        self.role = Role.objects.create(name='claims_role')
+        self.element = BusinessElement.objects.create(name='test_resource')
+        self.rule = AccessRule.objects.create(role=self.role, business_element=self.element, read_permission=True)
+        self.user = User.objects.create_user('claims@example.com', 'password123', role=self.role)
+        self.factory = APIRequestFactory()
+
+    def _login(self):
+        response = self.client.post(reverse('login'), {'email': 'claims@example.com', 'password': 'password123'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def _get_resource(self, access):
+        request = self.factory.get('/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        return ClaimsTestResourceView.as_view()(request)
+
+    def test_claims_authorize_without_queries(self):
+        tokens = self._login()
+        access = AccessToken(tokens['access'])
+        self.assertEqual(access['role'], self.role.id)
+        self.assertEqual(access['perm'], {'test_resource': READ})
+        with self.assertNumQueries(0):
+            response = self._get_resource(tokens['access'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_rbac_change_forces_token_refresh(self):
+        tokens = self._login()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rule.read_permission = False
+            self.rule.save()
+        self.assertEqual(self._get_resource(tokens['access']).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = self.client.post(reverse('token_refresh'), {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(AccessToken(response.data['access'])['perm'], {})
+        self.assertEqual(self._get_resource(response.data['access']).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_stale_permission_claims_fall_back_to_matrix(self):
+        tokens = self._login()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rule.read_permission = False
+            self.rule.save()
+        request = self.factory.get('/', HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        response = TokenPermissionTestResourceView.as_view()(request)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_superuser_claim_does_not_allow_missing_element(self):
+        User.objects.create_superuser('claims-admin@example.com', 'password123')
+        response = self.client.post(reverse('login'), {'email': 'claims-admin@example.com', 'password': 'password123'}, format='json')
+        request = self.factory.get('/', HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        view = ClaimsTestResourceView.as_view(business_element_name='missing_element')
+        self.assertEqual(view(request).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(TokenPermissionTestResourceView.as_view()(request).status_code, status.HTTP_200_OK)
+
+
+@override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'RBAC_GENERATION_CHECK_INTERVAL': 3600})
+class TokenUserAuthenticationTests(APITestCase):
+    def setUp(self):
+        permission_matrix.invalidate()
+        self.role = Role.objects.create(name='token_user_role')
+        element = BusinessElement.objects.create(name='test_resource')
+        AccessRule.objects.create(role=self.role, business_element=element, read_permission=True)
+        self.user = User.objects.create_user('tokenuser@example.com', 'password123', role=self.role)
+        response = self.client.post(reverse('login'), {'email': 'tokenuser@example.com', 'password': 'password123'}, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    def test_protected_resource_skips_user_query(self):
+        self.assertEqual(self.client.get(reverse('test-resource')).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('test-resource'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(response.wsgi_request.user, TokenUser)
+
+    def test_profile_loads_full_user_once(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('profile'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['email'], 'tokenuser@example.com')
+
+    @override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'RBAC_GENERATION_CHECK_INTERVAL': 3600, 'TOKEN_USER_STATE_TTL': 0})
+    def test_deactivation_in_other_worker_applies_after_ttl(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.get(reverse('test-resource'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_all_revokes_access_and_refresh_tokens(self):
+        refresh = self.client.post(reverse('login'), {'email': 'tokenuser@example.com', 'password': 'password123'}, format='json').data['refresh']
+        response = self.client.post(reverse('logout-all'))
+        self.assertEqual(response.status_code, status.HTTP_205_RESET_CONTENT)
+
+        self.assertEqual(self.client.get(reverse('test-resource')).status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(reverse('token_refresh'), {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials()
+        response = self.client.post(reverse('login'), {'email': 'tokenuser@example.com', 'password': 'password123'}, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(self.client.get(reverse('test-resource')).status_code, status.HTTP_200_OK)
+
+    def test_password_change_revokes_tokens(self):
+        self.user.set_password('newpassword123')
+        self.user.save()
+        self.assertEqual(self.user.token_epoch, 1)
+        self.assertEqual(self.client.get(reverse('test-resource')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'PASSWORD_HASHING_POOL_SIZE': 0, 'PASSWORD_HASHING_QUEUE_DEPTH': 4})
+class AsyncPasswordViewsTests(APITestCase):
+    def _post(self, view, data):
+        request = RequestFactory().post('/', json.dumps(data), content_type='application/json')
+        return async_to_sync(view.as_view())(request)
+
+    def test_register_and_login(self):
+        response = self._post(AsyncUserRegistrationView, {
+            'email': 'async@example.com',
+            'password': 'strongpassword123',
+            'password2': 'strongpassword123',
+            'first_name': 'Async',
+            'last_name': 'User',
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        user = User.objects.get(email='async@example.com')
+        self.assertTrue(user.check_password('strongpassword123'))
+
+        response = self._post(AsyncUserLoginView, {'email': 'async@example.com', 'password': 'strongpassword123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', json.loads(response.content))
+
+        response = self._post(AsyncUserLoginView, {'email': 'async@example.com', 'password': 'wrong'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self._post(AsyncUserLoginView, {'email': 'missing@example.com', 'password': 'wrong'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_saturated_pool_returns_503(self):
+        User.objects.create_user('busy@example.com', 'password123')
+        hashing_pool._in_flight = hashing_pool.capacity
+        self.addCleanup(setattr, hashing_pool, '_in_flight', 0)
+        response = self._post(AsyncUserLoginView, {'email': 'busy@example.com', 'password': 'password123'})
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+
+    @override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'PASSWORD_HASHING_POOL_SIZE': 1})
+    def test_process_pool_hashes_password(self):
+        pool = PasswordHashingPool()
+        self.addCleanup(pool.shutdown)
+        encoded = async_to_sync(pool.make_password)('secret-password')
+        self.assertTrue(check_password('secret-password', encoded))
+        self.assertEqual(async_to_sync(pool.verify_password)('secret-password', encoded), (True, False))
+
+    @override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'PASSWORD_HASHING_POOL_SIZE': 1})
+    def test_process_pool_recovers_after_worker_death(self):
+        pool = PasswordHashingPool()
+        self.addCleanup(pool.shutdown)
+        async_to_sync(pool.make_password)('secret-password')
+        broken = pool._executor
+        for process in list(broken._processes.values()):
+            process.kill()
+            process.join()
+        encoded = async_to_sync(pool.make_password)('secret-password')
+        self.assertTrue(check_password('secret-password', encoded))
+        self.assertIsNot(pool._executor, broken)
+
+
+class PasswordHasherTests(APITestCase):
+    def test_login_rehashes_to_configured_work_factor(self):
+        with override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'PASSWORD_HASHER_PARAMS': {'pbkdf2_iterations': 1000}}):
+            User.objects.create_user('rehash@example.com', 'password123')
+        self.assertTrue(User.objects.get(email='rehash@example.com').password.startswith('pbkdf2_sha256$1000$'))
+
+        with override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'PASSWORD_HASHER_PARAMS': {'pbkdf2_iterations': 2000}}):
+            response = self.client.post(reverse('login'), {'email': 'rehash@example.com', 'password': 'password123'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(User.objects.get(email='rehash@example.com').password.startswith('pbkdf2_sha256$2000$'))
+
+    def test_calibrate_hashers_command(self):
+        out = StringIO()
+        call_command('calibrate_hashers', '--algorithms=pbkdf2_sha256,bcrypt_sha256', '--samples=2', '--target-ms=5', '--json', stdout=out)
+        result = json.loads(out.getvalue())
+        self.assertIn('pbkdf2_iterations', result['params'])
+        self.assertIn('bcrypt_rounds', result['params'])
+
+
+class LastLoginTests(APITestCase):
+    def setUp(self):
+        # Входы других тестов могли остаться в буфере отложенной записи.
+        last_login_recorder.flush()
+        self.user = User.objects.create_user('lastlogin@example.com', 'password123')
+        self.login_data = {'email': 'lastlogin@example.com', 'password': 'password123'}
+
+    @override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'LAST_LOGIN_RECORDER': 'sync'})
+    def test_sync_recorder_updates_last_login(self):
+        response = self.client.post(reverse('login'), self.login_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+    @override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'LAST_LOGIN_RECORDER': 'sync'})
+    def test_last_login_write_keeps_user_state_cached(self):
+        with mock.patch('core_auth.signals.user_state_cache') as cache:
+            self.client.post(reverse('login'), self.login_data, format='json')
+            cache.changed.assert_not_called()
+            self.user.is_active = False
+            self.user.save(update_fields=['is_active'])
+            cache.changed.assert_called_once_with(self.user.pk)
+
+    @override_settings(CORE_AUTH={
+        'RBAC_NOTIFIER': LOCMEM_NOTIFIER,
+        'LAST_LOGIN_RECORDER': 'deferred',
+        'LAST_LOGIN_FLUSH_INTERVAL': 0,
+        'LAST_LOGIN_FLUSH_SIZE': 100,
+    })
+    def test_deferred_recorder_coalesces_writes(self):
+        self.addCleanup(last_login_recorder.flush)
+        for _ in range(2):
+            response = self.client.post(reverse('login'), self.login_data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.last_login)
+        self.assertEqual(last_login_recorder.pending(), 1)
+        newest = last_login_recorder._buffer[self.user.pk]
+
+        with self.assertNumQueries(1):
+            self.assertEqual(last_login_recorder.flush(), 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_login, newest)
+
+
+IN_MEMORY_REVOCATION = {
+    'BACKEND': 'core_auth.revocation.InMemoryRevocationBackend',
+    'OPTIONS': {'RESYNC_INTERVAL': 3600, 'BLOOM_CAPACITY': 1000},
+}
+
+
+@override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'REVOCATION_BACKEND': IN_MEMORY_REVOCATION})
+class RevocationStoreTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('revoke@example.com', 'password123')
+        self.refresh = RefreshToken.for_user(self.user)
+        get_revocation_backend().load()
+
+    def test_blacklisted_token_rejected_without_queries(self):
+        self.refresh.blacklist()
+        with self.assertNumQueries(0):
+            with self.assertRaises(TokenError):
+                RefreshToken(str(self.refresh))
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_revokes_refresh_token(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse('logout'), {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_205_RESET_CONTENT)
+        self.assertTrue(get_revocation_backend().is_revoked(self.refresh['jti']))
+
+    def test_resync_picks_up_revocations_from_other_workers(self):
+        backend = get_revocation_backend()
+        outstanding = OutstandingToken.objects.get(jti=self.refresh['jti'])
+        BlacklistedToken.objects.create(token=outstanding)
+        # Дочитывание выполняет фоновый поток; здесь вызываем его шаг напрямую.
+        backend._synced_at = 0.0
+        backend.maintain()
+        self.assertTrue(backend.is_revoked(self.refresh['jti']))
+
+    def test_purge_rebuilds_filter_without_losing_concurrent_revocations(self):
+        backend = get_revocation_backend()
+        backend.bloom_capacity = 1000
+        backend.revoke('expired-jti', int(time.time()) - 1)
+        backend.revoke('live-jti', int(time.time()) + 60)
+        original = backend._swap
+
+        def swap(revoked):
+            # Отзыв во время перестроения фильтра.
+            backend.revoke('concurrent-jti', int(time.time()) + 60)
+            original(revoked)
+
+        with mock.patch.object(backend, '_swap', swap), self.assertNumQueries(0):
+            backend._purge(time.time())
+        self.assertNotIn('expired-jti', backend._revoked)
+        self.assertTrue(backend.is_revoked('live-jti'))
+        self.assertTrue(backend.is_revoked('concurrent-jti'))
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f'jti-{i}' for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f'other-{i}' in bloom for i in range(1000))
+        self.assertLess(false_positives, 50)
+
+    def test_warm_up_survives_database_errors(self):
+        backend = get_revocation_backend()
+        with mock.patch.object(backend, 'load', side_effect=OperationalError('no such table')):
+            with self.assertLogs('core_auth.revocation', 'ERROR'):
+                warm_up()
+
+
+class PruneTokensTests(APITestCase):
+    def test_deletes_expired_tokens_in_batches(self):
+        user = User.objects.create_user('prune@example.com', 'password123')
+        now = timezone.now()
+        for i in range(5):
+            token = OutstandingToken.objects.create(
+                user=user, jti=f'expired-{i}', token='', expires_at=now - timedelta(days=1),
+            )
+            if i % 2:
+                BlacklistedToken.objects.create(token=token)
+        OutstandingToken.objects.create(user=user, jti='live', token='', expires_at=now + timedelta(days=1))
+
+        out = StringIO()
+        call_command('prune_tokens', '--batch-size=2', stdout=out)
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), ['live'])
+        self.assertFalse(BlacklistedToken.objects.exists())
+        self.assertIn('Deleted 5 expired tokens', out.getvalue())
+        self.assertIn('remaining backlog: 0', out.getvalue())
+
+
+class ProfilingMiddlewareTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('profiled@example.com', 'password123')
+        BusinessElement.objects.create(name='test_resource')
+        self.client.force_authenticate(self.user)
+
+    @override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'PROFILING_SAMPLE_RATE': 1.0, 'PROFILING_OVERHEAD_BUDGET': 1.0})
+    def test_sampled_request_reports_phases(self):
+        with self.assertLogs('core_auth.profiling', 'INFO') as logs:
+            response = self.client.get(reverse('test-resource'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        phases = [item.split(';')[0] for item in response['Server-Timing'].split(', ')]
+        self.assertEqual(phases, ['auth', 'perm', 'view', 'render', 'db', 'total'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], reverse('test-resource'))
+        self.assertGreaterEqual(record['total_ms'], record['view_ms'])
+
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('test-resource'))
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'PROFILING_SAMPLE_RATE': 1.0, 'PROFILING_OVERHEAD_BUDGET': 1.0})
+    def test_async_chain_stays_async(self):
+        async def view(request):
+            return HttpResponse('ok')
+
+        middleware = ProfilingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with self.assertLogs('core_auth.profiling', 'INFO'):
+            response = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    @override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'PROFILING_SAMPLE_RATE': 1.0, 'PROFILING_OVERHEAD_BUDGET': 1.0})
+    def test_asgi_counts_queries_of_sync_view(self):
+        access = str(RefreshToken.for_user(self.user).access_token)
+        with self.assertLogs('core_auth.profiling', 'INFO') as logs:
+            response = async_to_sync(self.async_client.get)(
+                reverse('profile'), headers={'authorization': f'Bearer {access}'},
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(json.loads(logs.records[0].getMessage())['db_queries'], 0)
+
+
+class MetricsTests(APITestCase):
+    def _sample(self, text, line_prefix):
+        for line in text.splitlines():
+            if line.startswith(line_prefix + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0.0
+
+    def test_metrics_endpoint_reports_login_and_permission_checks(self):
+        role = Role.objects.create(name='metrics_role')
+        BusinessElement.objects.create(name='test_resource')
+        User.objects.create_user('metrics@example.com', 'password123', role=role)
+        before = self.client.get(reverse('metrics')).content.decode()
+
+        response = self.client.post(reverse('login'), {'email': 'metrics@example.com', 'password': 'password123'}, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(self.client.get(reverse('test-resource')).status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        after = response.content.decode()
+        for prefix in (
+            'core_auth_login_seconds_count{status="200"}',
+            'core_auth_token_issue_seconds_count',
+            'core_auth_permission_checks_total{element="test_resource",result="deny"}',
+        ):
+            self.assertEqual(self._sample(after, prefix) - self._sample(before, prefix), 1, prefix)
+        self.assertIn('core_auth_password_hash_seconds_count{algorithm="pbkdf2_sha256",operation="verify"}', after)
+
+    def test_file_mode_sums_processes(self):
+        counter = registry.metrics['core_auth_cache_requests_total']
+        counter.labels('test_cache', 'hit').inc(3)
+        with tempfile.TemporaryDirectory() as directory:
+            registry.flush(directory)
+            with open(os.path.join(directory, 'metrics-other.json'), 'w') as f:
+                json.dump({'core_auth_cache_requests_total': [[['test_cache', 'hit'], [2]]]}, f)
+            values = registry.collect_all(directory)
+        self.assertEqual(values['core_auth_cache_requests_total'][('test_cache', 'hit')], [5])
+
+    def test_dead_worker_files_are_archived(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        counter = registry.metrics['core_auth_cache_requests_total']
+        with tempfile.TemporaryDirectory() as directory:
+            before = registry.collect_all(directory)['core_auth_cache_requests_total'].get(('dead_cache', 'hit'), [0])[0]
+            with open(os.path.join(directory, f'metrics-{process.pid}-abc.json'), 'w') as f:
+                json.dump({
+                    'core_auth_cache_requests_total': [[['dead_cache', 'hit'], [4]]],
+                    'core_auth_db_pool_waiting': [[['dead_db'], [7]]],
+                }, f)
+            values = registry.collect_all(directory)
+            # gauge завершившегося процесса не попадает в сумму, счетчик — попадает.
+            self.assertNotIn(('dead_db',), values['core_auth_db_pool_waiting'])
+            self.assertEqual(values['core_auth_cache_requests_total'][('dead_cache', 'hit')], [before + 4])
+
+            registry.mark_process_dead(process.pid, directory)
+            self.assertEqual(len(glob.glob(os.path.join(directory, 'metrics-*.json'))), 1)
+            counter.labels('dead_cache', 'hit').inc()
+            values = registry.collect_all(directory)
+            self.assertEqual(values['core_auth_cache_requests_total'][('dead_cache', 'hit')], [before + 5])
+
+    def test_pool_stats_exported(self):
+        stats = {'pool_size': 3, 'pool_available': 1, 'pool_max': 4, 'requests_waiting': 2, 'requests_wait_ms': 1500}
+        pool = mock.Mock(get_stats=mock.Mock(return_value=stats))
+        with mock.patch.object(type(connections['default']), 'pool', pool, create=True):
+            text = registry.render(registry.collect())
+            stats['requests_wait_ms'] = 2000
+            text_after = registry.render(registry.collect())
+        self.assertIn('# TYPE core_auth_db_pool_connections gauge', text)
+        self.assertEqual(self._sample(text, 'core_auth_db_pool_connections{database="default",state="available"}'), 1)
+        self.assertEqual(self._sample(text, 'core_auth_db_pool_waiting{database="default"}'), 2)
+        wait = 'core_auth_db_pool_wait_seconds_total{database="default"}'
+        self.assertEqual(self._sample(text_after, wait) - self._sample(text, wait), 0.5)
+
+    @skipUnless(importlib.util.find_spec('psycopg_pool'), 'psycopg_pool is not installed')
+    def test_production_settings_build_connection_pool(self):
+        from my_project import settings as base_settings
+
+        with mock.patch.dict(os.environ, {'DATABASE_POOL': '1'}), mock.patch.dict(base_settings.DATABASES):
+            sys.modules.pop('my_project.settings_production', None)
+            production = importlib.import_module('my_project.settings_production')
+            database = copy.deepcopy(production.DATABASES['default'])
+        sys.modules.pop('my_project.settings_production', None)
+
+        # Пул создается без соединения с базой (open=False).
+        connection = ConnectionHandler({'default': database})['default']
+        self.addCleanup(connection.close_pool)
+        self.assertIsNotNone(connection.pool._check)
+        self.assertEqual(connection.pool.max_size, production.DATABASE_POOL_OPTIONS['max_size'])
+
+
+@override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'RBAC_GENERATION_CHECK_INTERVAL': 3600})
+class BenchAuthCommandTests(APITestCase):
+    def test_report_and_baseline_comparison(self):
+        with tempfile.TemporaryDirectory() as directory:
+            report_path = os.path.join(directory, 'report.json')
+            call_command(
+                'bench_auth', '--requests=3', '--concurrency=1', '--warmup=1',
+                '--scenarios=refresh,profile,test-resource', f'--output={report_path}', stdout=StringIO(),
+            )
+            with open(report_path) as f:
+                report = json.load(f)
+            for result in report['scenarios'].values():
+                self.assertEqual(result['requests'], 3)
+                self.assertEqual(result['errors'], 0)
+            self.assertEqual(report['scenarios']['test-resource']['queries_per_request'], 0)
+            self.assertFalse(User.objects.filter(email__startswith='bench-').exists())
+
+            for result in report['scenarios'].values():
+                result['p95_ms'] = 0.001
+            with open(report_path, 'w') as f:
+                json.dump(report, f)
+            with self.assertRaisesMessage(CommandError, 'Regressions'):
+                call_command(
+                    'bench_auth', '--requests=3', '--concurrency=1', '--warmup=0',
+                    '--scenarios=profile', f'--baseline={report_path}', stdout=StringIO(),
+                )
+
+
+class GenerateDatasetTests(APITestCase):
+    def _rules(self, prefix):
+        return sorted(
+            (rule.role.name.split('-')[-1], rule.business_element.name.split('-')[-1], rule_to_bits(rule))
+            for rule in AccessRule.objects.filter(role__name__startswith=f'{prefix}-').select_related('role', 'business_element')
+        )
+
+    def test_generates_reproducible_dataset(self):
+        for prefix in ('a', 'b'):
+            call_command(
+                'generate_dataset', '--users=25', '--roles=3', '--elements=4', '--density=0.5',
+                '--chunk-size=10', '--seed=7', f'--prefix={prefix}', stdout=StringIO(),
+            )
+        self.assertEqual(User.objects.filter(email__startswith='a-').count(), 25)
+        self.assertEqual(self._rules('a'), self._rules('b'))
+        user = User.objects.get(email='a-3@example.com')
+        self.assertTrue(user.check_password('password123'))
+        self.assertIsNotNone(user.role_id)
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', '--users=1', '--prefix=a', stdout=StringIO())
+
+
+@override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'RBAC_GENERATION_CHECK_INTERVAL': 3600})
+class PermissionCheckTests(APITestCase):
+    def setUp(self):
+        permission_matrix.invalidate()
+        role = Role.objects.create(name='checker')
+        code = BusinessElement.objects.create(name='code')
+        BusinessElement.objects.create(name='tests')
+        AccessRule.objects.create(role=role, business_element=code, read_permission=True, update_all_permission=True)
+        self.user = User.objects.create_user('checker@example.com', 'password123', role=role)
+        response = self.client.post(reverse('login'), {'email': 'checker@example.com', 'password': 'password123'}, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.url = reverse('permissions-check')
+
+    def test_batch_check_answers_from_matrix(self):
+        checks = [
+            {'element': 'code', 'action': 'read'},
+            {'element': 'code', 'action': 'delete'},
+            {'element': 'code', 'action': 'update_all'},
+            {'element': 'tests', 'action': 'read'},
+            {'element': 'missing', 'action': 'read'},
+        ]
+        self.client.post(self.url, {'checks': checks}, format='json')
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url, {'checks': checks}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'code': {'read': True, 'delete': False, 'update_all': True},
+            'tests': {'read': False},
+            'missing': {'read': False},
+        })
+
+    def test_unknown_action_rejected(self):
+        response = self.client.post(self.url, {'checks': [{'element': 'code', 'action': 'execute'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'RBAC_GENERATION_CHECK_INTERVAL': 3600})
+class TokenIntrospectionTests(APITestCase):
+    def setUp(self):
+        permission_matrix.invalidate()
+        introspection_cache.clear()
+        role = Role.objects.create(name='introspected')
+        element = BusinessElement.objects.create(name='code')
+        AccessRule.objects.create(role=role, business_element=element, read_permission=True, update_permission=True)
+        self.user = User.objects.create_user('caller@example.com', 'password123', role=role)
+        self.refresh = RefreshToken.for_user(self.user)
+        self.access = str(self.refresh.access_token)
+        service = User.objects.create_user('service@example.com', 'password123', is_staff=True)
+        self.client.force_authenticate(service)
+        self.url = reverse('introspect')
+
+    def test_active_token_served_from_cache(self):
+        response = self.client.post(self.url, {'token': self.access}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['active'])
+        self.assertEqual(response.data['user_id'], self.user.pk)
+        self.assertEqual(response.data['perm'], {'code': READ | UPDATE})
+
+        with self.assertNumQueries(0):
+            introspect(self.access)
+
+    def test_batch_reports_revoked_and_invalid_tokens(self):
+        self.client.post(self.url, {'token': self.access}, format='json')
+        self.user.revoke_tokens()
+        response = self.client.post(self.url, {'tokens': [self.access, 'not-a-token']}, format='json')
+        self.assertEqual(response.data['results'], [{'active': False}, {'active': False}])
+
+    def test_requires_staff(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(self.url, {'token': self.access}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'INTROSPECTION_CACHE_MAX_ENTRIES': 2})
+    def test_recently_read_entry_survives_eviction(self):
+        cache = IntrospectionCache()
+        for jti in ('first', 'second'):
+            cache.put(jti, {'digest': jti, 'cached_at': time.monotonic(), 'exp': time.time() + 60})
+        self.assertIsNotNone(cache.get('first', 'first'))
+        cache.put('third', {'digest': 'third', 'cached_at': time.monotonic(), 'exp': time.time() + 60})
+        self.assertIsNotNone(cache.get('first', 'first'))
+        self.assertIsNone(cache.get('second', 'second'))
+
+
+class SigningKeyTests(APITestCase):
+    def _settings(self, keys):
+        return override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'SIGNING_KEYS': keys})
+
+    def _ec_key(self):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+        key = ec.generate_private_key(ec.SECP256R1())
+        private_pem = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+        ).decode()
+        public_pem = key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+        ).decode()
+        return private_pem, public_pem
+
+    def test_jwks_served_with_etag(self):
+        response = self.client.get(reverse('jwks'))
+        self.assertEqual(response.json(), {'keys': []})
+        response = self.client.get(reverse('jwks'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_signing_keys_require_cryptography(self):
+        with self._settings([{'KID': 'k1', 'ALGORITHM': 'ES256', 'PRIVATE_KEY': 'pem'}]):
+            with mock.patch('core_auth.keys.has_crypto', False), self.assertRaises(ImproperlyConfigured):
+                get_key_ring()
+
+    def test_rotation_with_kid(self):
+        # cryptography ставится из requirements.txt (PyJWT[crypto]): без него
+        # тест должен падать, а не пропускаться.
+        self.assertTrue(has_crypto, 'cryptography is required: pip install -r requirements.txt')
+        new_private, _ = self._ec_key()
+        old_private, old_public = self._ec_key()
+        user = User.objects.create_user('signed@example.com', 'password123')
+        keys = [
+            {'KID': 'new', 'ALGORITHM': 'ES256', 'PRIVATE_KEY': new_private},
+            {'KID': 'old', 'ALGORITHM': 'ES256', 'PUBLIC_KEY': old_public},
+        ]
+        with self._settings(keys):
+            access = str(RefreshToken.for_user(user).access_token)
+            self.assertEqual(jwt.get_unverified_header(access), {'alg': 'ES256', 'kid': 'new', 'typ': 'JWT'})
+            self.assertEqual(AccessToken(access)['user_id'], str(user.pk))
+
+            payload = dict(AccessToken(access).payload)
+            AccessToken(jwt.encode(payload, old_private, algorithm='ES256', headers={'kid': 'old'}))
+            with self.assertRaises(TokenError):
+                AccessToken(jwt.encode(payload, old_private, algorithm='ES256', headers={'kid': 'unknown'}))
+
+            response = self.client.get(reverse('jwks'))
+            self.assertEqual([key['kid'] for key in response.json()['keys']], ['new', 'old'])
+
+
+@override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'REFRESH_COALESCING_WINDOW': 10})
+class RefreshCoalescingTests(APITestCase):
+    def setUp(self):
+        refresh_coalescer.clear()
+        rotation = mock.patch.multiple(
+            serializers.api_settings, ROTATE_REFRESH_TOKENS=True, BLACKLIST_AFTER_ROTATION=True,
+        )
+        rotation.start()
+        self.addCleanup(rotation.stop)
+        self.user = User.objects.create_user('coalesce@example.com', 'password123')
+        self.refresh = str(RefreshToken.for_user(self.user))
+
+    def test_repeated_refresh_within_window_returns_same_pair(self):
+        first = self.client.post(reverse('token_refresh'), {'refresh': self.refresh}, format='json')
+        second = self.client.post(reverse('token_refresh'), {'refresh': self.refresh}, format='json')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(OutstandingToken.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+    def test_concurrent_callers_share_one_refresh(self):
+        calls = []
+
+        def perform():
+            calls.append(1)
+            time.sleep(0.05)
+            return {'access': 'a', 'refresh': 'r'}
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: refresh_coalescer.refresh('token', perform), range(8)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'access': 'a', 'refresh': 'r'}] * 8)
+
+    def test_shared_cache_coalesces_across_processes(self):
+        with override_settings(CORE_AUTH={'REFRESH_COALESCING_WINDOW': 10, 'REFRESH_COALESCING_CACHE': 'default'}):
+            first = RefreshCoalescer().refresh('shared-token', lambda: {'access': 'a'})
+            second = RefreshCoalescer().refresh('shared-token', lambda: {'access': 'b'})
+            caches['default'].clear()
+        self.assertEqual(second, first)
+
+
+@override_settings(CORE_AUTH={'DATABASE_REPLICAS': ['replica'], 'REPLICA_STICKY_CACHE': 'default'})
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        self.addCleanup(caches['default'].clear)
+
+    def handle(self, request):
+        if request.method == 'POST':
+            self.router.db_for_write(User)
+        return HttpResponse(self.router.db_for_read(User))
+
+    def call(self, request):
+        return ReplicaRoutingMiddleware(self.handle)(request)
+
+    def bearer(self, user_id):
+        return {'HTTP_AUTHORIZATION': 'Bearer ' + jwt.encode({'user_id': user_id}, 'k' * 32, algorithm='HS256')}
+
+    def test_reads_go_to_replica_until_write(self):
+        self.assertEqual(self.router.db_for_read(User), 'replica')
+        with routing(RoutingState()):
+            self.router.db_for_write(User)
+            self.assertEqual(self.router.db_for_read(User), 'default')
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(User), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'core_auth'))
+
+    def test_reads_stick_to_primary_after_write(self):
+        self.assertEqual(self.call(self.factory.get('/')).content, b'replica')
+        response = self.call(self.factory.post('/', **self.bearer('7')))
+        self.assertEqual(response.content, b'default')
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+
+        self.factory.cookies[PRIMARY_COOKIE] = '1'
+        self.assertEqual(self.call(self.factory.get('/')).content, b'default')
+        del self.factory.cookies[PRIMARY_COOKIE]
+        self.assertEqual(self.call(self.factory.get('/', **self.bearer('7'))).content, b'default')
+        self.assertEqual(self.call(self.factory.get('/', **self.bearer('8'))).content, b'replica')
+
+    def test_async_requests_stick_to_primary_after_write(self):
+        async def handle(request):
+            return self.handle(request)
+
+        middleware = ReplicaRoutingMiddleware(handle)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(self.factory.post('/', **self.bearer('9')))
+        self.assertEqual(response.content, b'default')
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        response = async_to_sync(middleware)(self.factory.get('/', **self.bearer('9')))
+        self.assertEqual(response.content, b'default')
+
+
+class ScopedUserListView(BusinessElementScopeMixin, ListAPIView):
+    queryset = User.objects.order_by('pk')
+    serializer_class = UserProfileSerializer
+    permission_classes = [IsAuthenticated, HasAccessToBusinessElement]
+    business_element_name = 'users'
+    owner_field = 'pk'
+
+
+@override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER})
+class BusinessElementScopeTests(APITestCase):
+    def setUp(self):
+        self.element = BusinessElement.objects.create(name='users')
+        self.role = Role.objects.create(name='scoped')
+        self.user = User.objects.create_user('scoped@example.com', 'password123', role=self.role)
+        User.objects.create_user('other@example.com', 'password123')
+
+    def _emails(self, token=None, **flags):
+        AccessRule.objects.update_or_create(role=self.role, business_element=self.element, defaults=flags)
+        request = APIRequestFactory().get('/users/')
+        force_authenticate(request, user=self.user, token=token)
+        response = ScopedUserListView.as_view()(request)
+        if response.status_code != status.HTTP_200_OK:
+            return response.status_code
+        return [row['email'] for row in response.data]
+
+    def test_read_returns_only_own_rows(self):
+        self.assertEqual(self._emails(read_permission=True, read_all_permission=False), ['scoped@example.com'])
+
+    def test_read_all_implies_read_and_returns_all_rows(self):
+        self.assertEqual(
+            self._emails(read_permission=False, read_all_permission=True),
+            ['scoped@example.com', 'other@example.com'],
+        )
+        self.assertEqual(rule_to_bits({'update_all_permission': True}), UPDATE | UPDATE_ALL)
+
+    def test_without_rule_access_is_denied(self):
+        self.assertEqual(self._emails(), status.HTTP_403_FORBIDDEN)
+
+    def test_stale_token_claims_fall_back_to_matrix(self):
+        token = AccessToken()
+        token['perm'] = {'users': READ | READ_ALL}
+        token['rv'] = 0
+        self.assertEqual(
+            self._emails(token=token, read_permission=True, read_all_permission=False),
+            ['scoped@example.com'],
+        )
+
+
+@override_settings(CORE_AUTH={'RBAC_NOTIFIER': LOCMEM_NOTIFIER, 'EMBED_PERMISSIONS_IN_TOKEN': True})
+class RoleHierarchyTests(APITestCase):
+    def setUp(self):
+        permission_matrix.invalidate()
+        self.code = BusinessElement.objects.create(name='code')
+        self.tests = BusinessElement.objects.create(name='tests')
+        self.base = Role.objects.create(name='base')
+        self.developer = Role.objects.create(name='developer')
+        self.qa = Role.objects.create(name='qa')
+        AccessRule.objects.create(role=self.base, business_element=self.code, read_permission=True)
+        AccessRule.objects.create(role=self.developer, business_element=self.code, update_permission=True)
+        AccessRule.objects.create(role=self.qa, business_element=self.tests, read_permission=True)
+
+    def test_child_role_inherits_parent_rules(self):
+        self.developer.parents.add(self.base)
+        lead = Role.objects.create(name='lead')
+        lead.parents.add(self.developer)
+        self.assertEqual(permission_matrix.lookup(lead.pk, 'code'), READ | UPDATE)
+        # Цикл в иерархии не зацикливает сборку матрицы.
+        self.base.parents.add(lead)
+        self.assertEqual(permission_matrix.lookup(self.base.pk, 'code'), READ | UPDATE)
+
+    def test_user_with_several_roles_gets_union_of_permissions(self):
+        user = User.objects.create_user('multi@example.com', 'password123', role=self.developer)
+        user.roles.add(self.qa)
+        token = RefreshToken.for_user(user)
+        self.assertEqual(token['roles'], sorted([self.developer.pk, self.qa.pk]))
+        self.assertEqual(token['perm'], {'code': UPDATE, 'tests': READ})
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.access_token}')
+        response = self.client.post(reverse('permissions-check'), {'checks': [
+            {'element': 'code', 'action': 'update'},
+            {'element': 'tests', 'action': 'read'},
+            {'element': 'code', 'action': 'read'},
+        ]}, format='json')
+        self.assertEqual(response.json(), {'code': {'update': True, 'read': False}, 'tests': {'read': True}})
+
+    def test_role_membership_change_applies_to_session_user(self):
+        user = User.objects.create_user('session@example.com', 'password123', role=self.developer)
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get(reverse('mock-tests')).status_code, status.HTTP_403_FORBIDDEN)
+        self.qa.members.add(user)
+        self.assertEqual(self.client.get(reverse('mock-tests')).status_code, status.HTTP_200_OK)
+
+
+class AccessRuleBulkTests(APITestCase):
+    def setUp(self):
+        permission_matrix.invalidate()
+        self.client.force_authenticate(User.objects.create_superuser('bulk@example.com', 'admin_password'))
+        self.role = Role.objects.create(name='bulk_role')
+        self.code = BusinessElement.objects.create(name='code')
+        self.tests = BusinessElement.objects.create(name='tests')
+        AccessRule.objects.create(role=self.role, business_element=self.code, read_permission=True)
+
+    def test_bulk_upsert_creates_and_updates_in_one_invalidation(self):
+        self.assertEqual(permission_matrix.lookup(self.role.pk, 'code'), READ)
+        generation = read_rbac_generation()
+        response = self.client.post(reverse('access-rule-bulk'), {'rules': [
+            {'role': self.role.pk, 'business_element': self.code.pk, 'update_permission': True},
+            {'role': self.role.pk, 'business_element': self.tests.pk, 'read_permission': True},
+            # Повтор пары: действует последнее значение.
+            {'role': self.role.pk, 'business_element': self.tests.pk, 'read_permission': True, 'update_all_permission': True},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {'upserted': 2})
+        self.assertEqual(AccessRule.objects.count(), 2)
+        self.assertEqual(read_rbac_generation(), generation + 1)
+        self.assertEqual(permission_matrix.lookup(self.role.pk, 'code'), UPDATE)
+        self.assertEqual(permission_matrix.lookup(self.role.pk, 'tests'), READ | UPDATE | UPDATE_ALL)
+
+    def test_bulk_reports_row_errors_without_writing(self):
+        response = self.client.post(reverse('access-rule-bulk'), {'rules': [
+            {'role': self.role.pk, 'business_element': self.tests.pk, 'read_permission': True},
+            {'role': self.role.pk + 100, 'business_element': self.tests.pk},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('1', response.json()['rules'])
+        self.assertEqual(AccessRule.objects.count(), 1)
+
+        with override_settings(CORE_AUTH={'ACCESS_RULE_BULK_LIMIT': 1}):
+            response = self.client.post(reverse('access-rule-bulk'), {'rules': [{}, {}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_csv_export_round_trips_through_bulk_import(self):
+        response = self.client.get(reverse('access-rule-export', args=['csv']))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        exported = b''.join(response.streaming_content).decode()
+        AccessRule.objects.all().delete()
+
+        response = self.client.generic('POST', reverse('access-rule-bulk'), exported, content_type='text/csv')
+        self.assertEqual(response.json(), {'upserted': 1})
+        rule = AccessRule.objects.get()
+        self.assertEqual((rule.role_id, rule.business_element_id, rule.read_permission), (self.role.pk, self.code.pk, True))
+
+        response = self.client.get(reverse('access-rule-export', args=['ndjson']))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([(row['role_name'], row['business_element_name']) for row in rows], [('bulk_role', 'code')])
+
+
+class AdminListTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('lists@example.com', 'admin_password')
+        self.client.force_authenticate(self.admin)
+        self.elements = [BusinessElement.objects.create(name=f'element-{i}') for i in range(5)]
+        role = Role.objects.create(name='lists_role')
+        for element in self.elements:
+            AccessRule.objects.create(role=role, business_element=element, read_permission=True)
+
+    def test_access_rules_are_cursor_paginated(self):
+        url = reverse('access-rule-list')
+        response = self.client.get(url, {'page_size': 2})
+        ids = [rule['id'] for rule in response.json()['results']]
+        while response.json()['next']:
+            response = self.client.get(response.json()['next'])
+            ids += [rule['id'] for rule in response.json()['results']]
+        self.assertEqual(ids, sorted(AccessRule.objects.values_list('pk', flat=True)))
+
+        with override_settings(CORE_AUTH={'ADMIN_MAX_PAGE_SIZE': 3}):
+            self.assertEqual(len(self.client.get(url, {'page_size': 100}).json()['results']), 3)
+
+    def test_estimated_count_only_for_unfiltered_large_tables(self):
+        with mock.patch.object(EstimatedCountPaginator, '_estimate', return_value=2_000_000):
+            self.assertEqual(EstimatedCountPaginator(User.objects.order_by('pk'), 100).count, 2_000_000)
+            filtered = User.objects.filter(email__iexact='LISTS@example.com').order_by('pk')
+            self.assertEqual(EstimatedCountPaginator(filtered, 100).count, 1)
+        with mock.patch.object(EstimatedCountPaginator, '_estimate', return_value=10):
+            self.assertEqual(EstimatedCountPaginator(User.objects.order_by('pk'), 100).count, 1)
+        # Без Postgres статистики нет: точный COUNT(*).
+        self.assertEqual(EstimatedCountPaginator(BusinessElement.objects.order_by('pk'), 100).count, 5)
+
+        self.client.force_login(self.admin)
+        response = self.client.get('/admin/core_auth/user/', {'q': 'LISTS@EXAMPLE.COM'})
+        self.assertContains(response, 'lists@example.com')
+
+
+class UserProvisioningTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_superuser('provisioner@example.com', 'admin_password'))
+        self.developer = Role.objects.create(name='developer')
+        self.qa = Role.objects.create(name='qa')
+
+    def test_bulk_creates_valid_rows_and_reports_the_rest(self):
+        response = self.client.post(reverse('user-provisioning'), {'users': [
+            {'email': 'alice@Example.com', 'password': 'Str0ng-passw0rd', 'role': self.developer.pk, 'roles': [self.qa.pk]},
+            {'email': 'not-an-email'},
+            {'email': 'bob@example.com', 'first_name': 'Bob'},
+            {'email': 'ALICE@example.com'},
+            {'email': 'Provisioner@example.com'},
+            {'email': 'carol@example.com', 'roles': [self.qa.pk + 100]},
+            {'email': 'dave@example.com', 'password': '123'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.json()
+        self.assertEqual([row['email'] for row in body['created']], ['alice@example.com', 'bob@example.com'])
+        self.assertEqual([error['index'] for error in body['errors']], [1, 3, 4, 5, 6])
+
+        alice = User.objects.get(email='alice@example.com')
+        self.assertTrue(alice.check_password('Str0ng-passw0rd'))
+        self.assertEqual(alice.role_ids, (self.developer.pk, self.qa.pk))
+        self.assertFalse(User.objects.get(email='bob@example.com').has_usable_password())
+
+    def test_concurrent_batch_and_oversized_batch_are_rejected(self):
+        url = reverse('user-provisioning')
+        # Пул процесса занят другой пачкой: 503 без записи в базу.
+        provisioning_hasher._busy.acquire()
+        try:
+            response = self.client.post(url, {'users': [{'email': 'eve@example.com', 'password': 'Str0ng-passw0rd'}]}, format='json')
+        finally:
+            provisioning_hasher._busy.release()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', response)
+        self.assertFalse(User.objects.filter(email='eve@example.com').exists())
+
+        with override_settings(CORE_AUTH={'USER_PROVISIONING_LIMIT': 1}):
+            response = self.client.post(url, {'users': [{'email': 'a@example.com'}, {'email': 'b@example.com'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_command_provisions_csv_with_process_pool(self):
+        path = os.path.join(tempfile.mkdtemp(), 'users.csv')
+        with open(path, 'w') as f:
+            f.write('email,password,roles\n')
+            for i in range(4):
+                f.write(f'pooled-{i}@example.com,Str0ng-passw0rd-{i},{self.developer.pk};{self.qa.pk}\n')
+            f.write('pooled-0@example.com,,\n')
+        out, err = StringIO(), StringIO()
+        with override_settings(CORE_AUTH={'PROVISIONING_POOL_MIN_BATCH': 1}):
+            call_command('provision_users', path, '--workers', '2', stdout=out, stderr=err)
+        self.assertIn('Created 4 users, 1 rows failed', out.getvalue())
+        self.assertIn('row 5:', err.getvalue())
+        user = User.objects.get(email='pooled-3@example.com')
+        self.assertTrue(user.check_password('Str0ng-passw0rd-3'))
+        self.assertEqual(user.role_ids, (self.developer.pk, self.qa.pk))
+
+    def test_batch_hasher_keeps_order_and_unusable_passwords(self):
+        with BatchPasswordHasher(workers=1) as hasher:
+            hashed = hasher.make_passwords(['first-password', None, 'second-password'])
+        self.assertTrue(check_password('first-password', hashed[0]))
+        self.assertFalse(User(password=hashed[1]).has_usable_password())
+        self.assertTrue(check_password('second-password', hashed[2]))
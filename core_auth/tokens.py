@@ -0,0 +1,97 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from .conf import auth_settings
+from .invalidation import rbac_generation
+from .metrics import token_issue_seconds
+from .permission_cache import permission_matrix
+from .revocation import get_revocation_backend
+from .user_state import user_state_cache
+
+ROLE_CLAIM = 'role'
+ROLES_CLAIM = 'roles'
+SUPERUSER_CLAIM = 'is_superuser'
+STAFF_CLAIM = 'is_staff'
+PERMISSIONS_CLAIM = 'perm'
+ROLE_VERSION_CLAIM = 'rv'
+TOKEN_EPOCH_CLAIM = 'tep'
+
+USER_CLAIMS = (ROLE_CLAIM, SUPERUSER_CLAIM, STAFF_CLAIM)
+
+
+def set_user_claims(token, user):
+    """
+    Записывает в токен поля пользователя, которых хватает большинству
+    представлений: основную роль и все роли, признаки суперпользователя
+    и персонала, а также эпоху токенов пользователя.
+    """
+    token[ROLE_CLAIM] = user.role_id
+    token[ROLES_CLAIM] = list(user.role_ids)
+    token[SUPERUSER_CLAIM] = user.is_superuser
+    token[STAFF_CLAIM] = user.is_staff
+    token[TOKEN_EPOCH_CLAIM] = user.token_epoch
+
+
+def is_token_epoch_current(token, token_epoch):
+    """
+    Проверяет, что токен выпущен не раньше последнего отзыва токенов
+    пользователя. Токены без эпохи считаются выпущенными в эпоху 0.
+    """
+    return token.get(TOKEN_EPOCH_CLAIM, 0) >= token_epoch
+
+
+def token_permissions(token):
+    """
+    Битовые маски прав из claims токена, если они получены из текущего
+    поколения RBAC. None, если токен прав не несет или они устарели: тогда
+    права берутся из матрицы permission_matrix.
+    """
+    if token is None or PERMISSIONS_CLAIM not in token:
+        return None
+    version = token.get(ROLE_VERSION_CLAIM)
+    if version is None or version < rbac_generation.current():
+        return None
+    return token[PERMISSIONS_CLAIM]
+
+
+def set_permission_claims(token, user):
+    """
+    Записывает в токен битовые маски прав по бизнес-элементам и поколение RBAC,
+    из которого они получены. Суперпользователю маски не нужны: проверка
+    пропускает его по признаку.
+    """
+    generation, permissions = permission_matrix.role_permissions(user.role_ids)
+    if user.is_superuser:
+        permissions = {}
+    token[PERMISSIONS_CLAIM] = permissions
+    token[ROLE_VERSION_CLAIM] = generation
+
+
+class RefreshToken(tokens.RefreshToken):
+    """
+    Refresh-токен с полями пользователя, а при
+    CORE_AUTH['EMBED_PERMISSIONS_IN_TOKEN'] — и с правами; access-токен
+    копирует их из refresh-токена. Отзыв проверяется через хранилище
+    CORE_AUTH['REVOCATION_BACKEND'].
+    """
+
+    def check_blacklist(self):
+        if get_revocation_backend().is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        result = super().blacklist()
+        get_revocation_backend().revoke(self.payload[api_settings.JTI_CLAIM], self.payload['exp'])
+        return result
+
+    @classmethod
+    @token_issue_seconds.time()
+    def for_user(cls, user):
+        token = super().for_user(user)
+        set_user_claims(token, user)
+        if auth_settings.EMBED_PERMISSIONS_IN_TOKEN:
+            set_permission_claims(token, user)
+        user_state_cache.remember(user)
+        return token
@@ -1,12 +1,18 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .async_views import AsyncUserLoginView, AsyncUserRegistrationView
+from .conf import auth_settings
 from .views import (
     UserRegistrationView, 
     UserLoginView,
     UserLogoutView,
+    UserLogoutAllView,
     UserProfileView, 
     UserSoftDeleteView, 
     TestResourceView,
+    PermissionCheckView,
+    TokenIntrospectionView,
+    UserProvisioningView,
     RoleViewSet,
     BusinessElementViewSet,
     AccessRuleViewSet,
@@ -19,16 +25,25 @@ router.register(r'roles', RoleViewSet, basename='role')
 router.register(r'business-elements', BusinessElementViewSet, basename='business-element')
 router.register(r'access-rules', AccessRuleViewSet, basename='access-rule')
 
+if auth_settings.ASYNC_PASSWORD_VIEWS:
+    registration_view, login_view = AsyncUserRegistrationView, AsyncUserLoginView
+else:
+    registration_view, login_view = UserRegistrationView, UserLoginView
+
 urlpatterns = [
-    path('register/', UserRegistrationView.as_view(), name='register'),
-    path('login/', UserLoginView.as_view(), name='login'),
+    path('register/', registration_view.as_view(), name='register'),
+    path('login/', login_view.as_view(), name='login'),
     path('logout/', UserLogoutView.as_view(), name='logout'),
+    path('logout-all/', UserLogoutAllView.as_view(), name='logout-all'),
     path('profile/', UserProfileView.as_view(), name='profile'),
     path('delete/', UserSoftDeleteView.as_view(), name='delete'),
     path('test-resource/', TestResourceView.as_view(), name='test-resource'),
+    path('permissions/check/', PermissionCheckView.as_view(), name='permissions-check'),
+    path('introspect/', TokenIntrospectionView.as_view(), name='introspect'),
 
     path('mock/code/', MockCodeView.as_view(), name='mock-code'),
     path('mock/tests/', MockTestsView.as_view(), name='mock-tests'),
 
+    path('admin/users/bulk/', UserProvisioningView.as_view(), name='user-provisioning'),
     path('admin/', include(router.urls)),
 ]
\ No newline at end of file
@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.db import transaction
+
+from .conf import auth_settings
+from .invalidation import get_notifier, listener_enabled
+from .metrics import cache_requests
+from .models import User
+from .routers import use_primary
+
+USER_STATE_CHANNEL = 'core_auth_user_state'
+
+_hits = cache_requests.labels('user_state', 'hit')
+_misses = cache_requests.labels('user_state', 'miss')
+
+
+class UserStateCache:
+    """
+    Кеш состояния пользователей (is_active, token_epoch) и наборов их ролей
+    в памяти процесса.
+
+    Аутентификация по claims не загружает пользователя, поэтому состояние
+    сверяется с базой не чаще раза в TOKEN_USER_STATE_TTL секунд на
+    пользователя: деактивация и отзыв токенов вступают в силу не позже чем
+    через TTL. Изменения пользователя сбрасывают запись сразу в этом процессе
+    и, если включен слушатель уведомлений, во всех остальных воркерах.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._roles = OrderedDict()
+        self._subscribed_pid = None
+
+    def _store(self, user_id, state, entries=None):
+        entries = self._entries if entries is None else entries
+        with self._lock:
+            entries[user_id] = (state, time.monotonic())
+            entries.move_to_end(user_id)
+            while len(entries) > auth_settings.TOKEN_USER_STATE_MAX_ENTRIES:
+                entries.popitem(last=False)
+
+    def _subscribe(self):
+        self._subscribed_pid = os.getpid()
+        get_notifier().subscribe(USER_STATE_CHANNEL, self._on_message)
+
+    def _on_message(self, payload):
+        if payload is None:
+            self.clear()
+        else:
+            self.discard(User._meta.pk.to_python(payload))
+
+    def remember(self, user):
+        self._store(user.pk, (user.is_active, user.token_epoch))
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._roles.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._roles.clear()
+
+    def changed(self, user_id):
+        """
+        Сбрасывает запись пользователя здесь и после коммита — в остальных воркерах.
+        """
+        self.discard(user_id)
+        if listener_enabled():
+            transaction.on_commit(lambda: get_notifier().publish(USER_STATE_CHANNEL, str(user_id)))
+
+    def get(self, user_id):
+        """
+        Возвращает пару (is_active, token_epoch) или None, если пользователя нет.
+        """
+        if listener_enabled() and self._subscribed_pid != os.getpid():
+            self._subscribe()
+        entry = self._entries.get(user_id)
+        if entry is not None and time.monotonic() - entry[1] < auth_settings.TOKEN_USER_STATE_TTL:
+            _hits.inc()
+            return entry[0]
+        _misses.inc()
+        with use_primary():
+            state = User.objects.filter(pk=user_id).values_list('is_active', 'token_epoch').first()
+        if state is None:
+            self.discard(user_id)
+        else:
+            self._store(user_id, state)
+        return state
+
+    def role_ids(self, user):
+        """
+        Возвращает User.get_role_ids() с кешированием на TOKEN_USER_STATE_TTL
+        секунд: проверка прав пользователя из сессии не запрашивает его
+        дополнительные роли на каждый запрос.
+        """
+        if listener_enabled() and self._subscribed_pid != os.getpid():
+            self._subscribe()
+        entry = self._roles.get(user.pk)
+        if entry is not None and time.monotonic() - entry[1] < auth_settings.TOKEN_USER_STATE_TTL:
+            _hits.inc()
+            return entry[0]
+        _misses.inc()
+        with use_primary():
+            role_ids = user.get_role_ids()
+        self._store(user.pk, role_ids, self._roles)
+        return role_ids
+
+
+user_state_cache = UserStateCache()
@@ -1,16 +1,30 @@
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserProfileSerializer, RoleSerializer, BusinessElementSerializer, AccessRuleSerializer
-from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
+import csv
+import io
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import action
+from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserProfileSerializer, RoleSerializer, BusinessElementSerializer, AccessRuleSerializer, AccessRuleBulkSerializer, PermissionCheckSerializer, TokenIntrospectionSerializer, UserProvisioningSerializer
 from django.contrib.auth import authenticate, login
-from rest_framework_simplejwt.tokens import RefreshToken
+from .tokens import RefreshToken
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
+from .introspection import introspect
 from .permissions import HasAccessToBusinessElement
+from .permission_cache import ACTIONS, PERMISSION_FIELDS, permission_matrix, user_roles
+from .last_login import record_login
+from .metrics import login_seconds, timed_response
+from .middleware.custom_middleware import ProfilingMixin
+from .pagination import IdCursorPagination
+from .conf import auth_settings
+from .hashing import PoolSaturated
+from .provisioning import provision_users
 from rest_framework import viewsets
 from .models import Role, BusinessElement, AccessRule
 
-class UserRegistrationView(APIView):
+class UserRegistrationView(ProfilingMixin, APIView):
     """Представление для регистрации пользователя."""
     permission_classes = [AllowAny]
 
@@ -28,11 +42,12 @@ class UserRegistrationView(APIView):
             }, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class UserLoginView(APIView):
+class UserLoginView(ProfilingMixin, APIView):
     """Представление для входа пользователя."""
     permission_classes = [AllowAny]
     serializer_class = UserLoginSerializer
 
+    @timed_response(login_seconds)
     def post(self, request):
         serializer = UserLoginSerializer(data=request.data)
         if serializer.is_valid():
@@ -42,6 +57,7 @@ class UserLoginView(APIView):
             if user is not None:
                 if not user.is_active:
                     return Response({"error": "User is deactivated"}, status=status.HTTP_401_UNAUTHORIZED)
+                record_login(user)
                 refresh = RefreshToken.for_user(user)
                 return Response({"refresh": str(refresh), "access": str(refresh.access_token)})
             
@@ -49,7 +65,7 @@ class UserLoginView(APIView):
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class UserLogoutView(APIView):
+class UserLogoutView(ProfilingMixin, APIView):
     """
     Выход пользователя из системы.
     Принимает refresh-токен и добавляет его в черный список.
@@ -65,7 +81,17 @@ class UserLogoutView(APIView):
         except Exception as e:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-class UserProfileView(APIView):
+class UserLogoutAllView(ProfilingMixin, APIView):
+    """
+    Выход со всех устройств: отзывает все выданные пользователю токены.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        request.user.revoke_tokens()
+        return Response(status=status.HTTP_205_RESET_CONTENT)
+
+class UserProfileView(ProfilingMixin, APIView):
     """
     Представление для просмотра и обновления профиля текущего пользователя.
     """
@@ -83,7 +109,7 @@ class UserProfileView(APIView):
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class UserSoftDeleteView(APIView):
+class UserSoftDeleteView(ProfilingMixin, APIView):
     """
     Представление для "мягкого" удаления аккаунта.
     """
@@ -92,13 +118,11 @@ class UserSoftDeleteView(APIView):
     def delete(self, request):
         user = request.user
         user.is_active = False
-        user.save()
-
-        OutstandingToken.objects.filter(user=user).delete()
+        user.revoke_tokens(update_fields=['is_active'])
         return Response({"detail": "Account deactivated successfully."}, status=status.HTTP_204_NO_CONTENT)
 
 
-class TestResourceView(APIView):
+class TestResourceView(ProfilingMixin, APIView):
     """
     Тестовое представление, защищенное кастомными правами доступа.
     """
@@ -108,32 +132,176 @@ class TestResourceView(APIView):
     def get(self, request):
         return Response({"message": "Доступ к тестовому ресурсу разрешен!"}, status=status.HTTP_200_OK)
 
-class RoleViewSet(viewsets.ModelViewSet):
+class PermissionCheckView(ProfilingMixin, APIView):
+    """
+    Пакетная проверка прав текущего пользователя: принимает список пар
+    {"element", "action"} и возвращает {element: {action: bool}}.
+    Все ответы берутся из одного снимка матрицы прав, без запросов к базе.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = PermissionCheckSerializer
+
+    def post(self, request):
+        serializer = PermissionCheckSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        roles = user_roles(request.user)
+        rules, elements = permission_matrix.role_rules(roles)
+        results = {}
+        for check in serializer.validated_data['checks']:
+            element = check['element']
+            if element not in elements:
+                allowed = False
+            elif request.user.is_superuser:
+                allowed = True
+            else:
+                allowed = bool(roles and rules.get(element, 0) & ACTIONS[check['action']])
+            results.setdefault(element, {})[check['action']] = allowed
+        return Response(results, status=status.HTTP_200_OK)
+
+class TokenIntrospectionView(ProfilingMixin, APIView):
+    """
+    Интроспекция токенов для других сервисов (RFC 7662): по "token"
+    возвращает один ответ, по "tokens" — {"results": [...]} в том же порядке.
+    Доступна только служебным (is_staff) учетным записям.
+    """
+    permission_classes = [IsAdminUser]
+    serializer_class = TokenIntrospectionSerializer
+
+    def post(self, request):
+        serializer = TokenIntrospectionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if 'token' in serializer.validated_data:
+            return Response(introspect(serializer.validated_data['token']), status=status.HTTP_200_OK)
+        results = [introspect(token) for token in serializer.validated_data['tokens']]
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+class UserProvisioningView(ProfilingMixin, APIView):
+    """
+    Массовое создание пользователей (в духе SCIM bulk): {"users": [...]} →
+    {"created": [...], "errors": [{"index", "errors"}]}. Ошибочные строки
+    не прерывают создание остальных; токены не выдаются. Пачка ограничена
+    USER_PROVISIONING_LIMIT, чтобы уложиться в таймаут воркера; большие
+    импорты — командой provision_users.
+    """
+    permission_classes = [IsAdminUser]
+    serializer_class = UserProvisioningSerializer
+
+    def post(self, request):
+        serializer = UserProvisioningSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = provision_users(serializer.validated_data['users'])
+        except PoolSaturated:
+            return Response(
+                {"error": "Another provisioning batch is being hashed, retry later"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(auth_settings.PASSWORD_HASHING_RETRY_AFTER)},
+            )
+        return Response(result, status=status.HTTP_200_OK)
+
+class RoleViewSet(ProfilingMixin, viewsets.ModelViewSet):
     """API для управления ролями."""
     queryset = Role.objects.all()
     serializer_class = RoleSerializer
     permission_classes = [IsAdminUser]
+    pagination_class = IdCursorPagination
 
-class BusinessElementViewSet(viewsets.ModelViewSet):
+class BusinessElementViewSet(ProfilingMixin, viewsets.ModelViewSet):
     """API для управления бизнес-элементами."""
     queryset = BusinessElement.objects.all()
     serializer_class = BusinessElementSerializer
     permission_classes = [IsAdminUser]
+    pagination_class = IdCursorPagination
+
+EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('role', 'role_id'),
+    ('role_name', 'role__name'),
+    ('business_element', 'business_element_id'),
+    ('business_element_name', 'business_element__name'),
+    *((field, field) for field, _ in PERMISSION_FIELDS),
+)
+EXPORT_CHUNK_SIZE = 2000
+
 
-class AccessRuleViewSet(viewsets.ModelViewSet):
+class _Echo:
+    """Буфер для csv.writer, возвращающий строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def _export_lines(rows, kind):
+    names = [name for name, _ in EXPORT_COLUMNS]
+    if kind == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(names)
+        encode = writer.writerow
+    else:
+        def encode(row):
+            return json.dumps(dict(zip(names, row))) + '\n'
+    # Строки отдаются пачками: отдельный chunk на строку дороже самой строки.
+    batch = []
+    for row in rows:
+        batch.append(encode(row))
+        if len(batch) == EXPORT_CHUNK_SIZE:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+class AccessRuleViewSet(ProfilingMixin, viewsets.ModelViewSet):
     """API для управления правилами доступа."""
-    queryset = AccessRule.objects.all()
+    queryset = AccessRule.objects.select_related('role', 'business_element')
     serializer_class = AccessRuleSerializer
     permission_classes = [IsAdminUser]
+    pagination_class = IdCursorPagination
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Массовое создание и обновление правил: JSON {"rules": [...]} или CSV
+        с колонками role, business_element и флагами прав (формат экспорта).
+        """
+        if request.content_type.startswith('text/csv'):
+            data = {'rules': list(csv.DictReader(io.StringIO(request.body.decode('utf-8-sig'))))}
+        else:
+            data = request.data
+        serializer = AccessRuleBulkSerializer(data=data)
+        if serializer.is_valid():
+            return Response({'upserted': serializer.save()}, status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'], url_path=r'export/(?P<kind>ndjson|csv)')
+    def export(self, request, kind):
+        """
+        Потоковая выгрузка всех правил в NDJSON или CSV без загрузки таблицы
+        в память.
+        """
+        rows = (
+            AccessRule.objects
+            .order_by('pk')
+            .values_list(*(column for _, column in EXPORT_COLUMNS))
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+        content_type = 'text/csv' if kind == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(_export_lines(rows, kind), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="access_rules.{kind}"'
+        return response
 
-class MockCodeView(APIView):
+class MockCodeView(ProfilingMixin, APIView):
     permission_classes = [IsAuthenticated, HasAccessToBusinessElement]
     business_element_name = 'code'
 
     def get(self, request):
         return Response({"message": "Доступ к коду разрешен."}, status=status.HTTP_200_OK)
 
-class MockTestsView(APIView):
+class MockTestsView(ProfilingMixin, APIView):
     permission_classes = [IsAuthenticated, HasAccessToBusinessElement]
     business_element_name = 'tests'
 
@@ -0,0 +1,50 @@
+"""
+Конфигурация gunicorn для production:
+
+    gunicorn -c gunicorn.conf.py my_project.wsgi
+    GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker gunicorn -c gunicorn.conf.py my_project.asgi
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_project.settings_production')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = 5
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+# Приложение загружается в каждом воркере после fork: пулы соединений,
+# подписки на уведомления и фоновые потоки не должны наследоваться
+# от мастер-процесса.
+preload_app = False
+
+
+def post_worker_init(worker):
+    """
+    Открывает пулы соединений сразу после загрузки приложения, чтобы
+    первые запросы воркера не ждали установки соединений.
+    """
+    from django.db import connections
+
+    for connection in connections.all():
+        pool = getattr(connection, 'pool', None)
+        if pool is not None:
+            pool.open()
+
+
+def child_exit(server, worker):
+    """
+    Переносит метрики завершившегося воркера в архив каталога метрик:
+    max_requests постоянно заменяет воркеры, и без этого файлы мертвых
+    процессов копились бы, а их gauge оставались бы в суммах.
+    """
+    directory = os.environ.get('CORE_AUTH_METRICS_DIR')
+    if directory:
+        from core_auth.metrics import registry
+
+        registry.mark_process_dead(worker.pid, directory)
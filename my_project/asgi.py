@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_project.settings')
+os.environ.setdefault('CORE_AUTH_ASYNC_PASSWORD_VIEWS', '1')
 
 application = get_asgi_application()
+
+from core_auth.invalidation import enable_listener  # noqa: E402
+from core_auth.revocation import warm_up  # noqa: E402
+
+enable_listener()
+warm_up()
@@ -25,6 +25,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core_auth.middleware.custom_middleware.ProfilingMiddleware',
+    'core_auth.middleware.custom_middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,6 +66,14 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения: POSTGRES_REPLICA_HOSTS=replica1,replica2.
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica{index}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{index}')
+
+DATABASE_ROUTERS = ['core_auth.routers.ReplicaRouter']
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -79,6 +89,16 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Первый хешер — основной. Параметры задаются в CORE_AUTH['PASSWORD_HASHER_PARAMS']
+# (см. manage.py calibrate_hashers); устаревшие хеши пересчитываются при входе.
+PASSWORD_HASHERS = [
+    'core_auth.hashers.PBKDF2PasswordHasher',
+    'core_auth.hashers.BCryptSHA256PasswordHasher',
+    'core_auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
 LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
@@ -96,11 +116,72 @@ AUTH_USER_MODEL = 'core_auth.User'
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core_auth.authentication.TokenUserJWTAuthentication',
     )
 }
 
 SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': False,
     'UPDATE_LAST_LOGIN': True,
-}
\ No newline at end of file
+    'TOKEN_REFRESH_SERIALIZER': 'core_auth.serializers.TokenRefreshSerializer',
+}
+
+CORE_AUTH = {
+    'RBAC_NOTIFIER': {
+        'BACKEND': 'core_auth.notifiers.PostgresNotifier',
+        'OPTIONS': {'DATABASE': 'default'},
+    },
+    'EMBED_PERMISSIONS_IN_TOKEN': False,
+    'TOKEN_USER_STATE_TTL': 30,
+    # Включается в my_project/asgi.py: под ASGI login/ и register/ хешируют
+    # пароли в пуле процессов.
+    'ASYNC_PASSWORD_VIEWS': os.environ.get('CORE_AUTH_ASYNC_PASSWORD_VIEWS') == '1',
+    'PASSWORD_HASHING_POOL_SIZE': int(os.environ.get('PASSWORD_HASHING_POOL_SIZE', 2)),
+    'PASSWORD_HASHING_QUEUE_DEPTH': int(os.environ.get('PASSWORD_HASHING_QUEUE_DEPTH', 32)),
+    'PASSWORD_HASHING_RETRY_AFTER': 1,
+    'PASSWORD_HASHER_PARAMS': {
+        'pbkdf2_iterations': None,
+        'bcrypt_rounds': None,
+        'argon2_time_cost': None,
+        'argon2_memory_cost': None,
+        'argon2_parallelism': None,
+    },
+    'LAST_LOGIN_RECORDER': os.environ.get('LAST_LOGIN_RECORDER', 'deferred'),
+    'LAST_LOGIN_FLUSH_INTERVAL': 5,
+    'LAST_LOGIN_FLUSH_SIZE': 500,
+    'REVOCATION_BACKEND': {
+        'BACKEND': 'core_auth.revocation.InMemoryRevocationBackend',
+        'OPTIONS': {
+            'RESYNC_INTERVAL': 30,
+            'BLOOM_CAPACITY': 1_000_000,
+            'BLOOM_ERROR_RATE': 0.001,
+        },
+    },
+    'PROFILING_SAMPLE_RATE': float(os.environ.get('CORE_AUTH_PROFILING_SAMPLE_RATE', 0)),
+    'PROFILING_OVERHEAD_BUDGET': 0.02,
+    'PROFILING_SERVER_TIMING': True,
+    'METRICS_DIR': os.environ.get('CORE_AUTH_METRICS_DIR'),
+    'METRICS_FLUSH_INTERVAL': 5,
+    'INTROSPECTION_CACHE_TTL': 60,
+    'INTROSPECTION_CACHE_MAX_ENTRIES': 100000,
+    'INTROSPECTION_BATCH_LIMIT': 100,
+    # Например: [{'KID': '2026-10', 'ALGORITHM': 'ES256', 'PRIVATE_KEY_FILE': '/run/secrets/jwt-2026-10.pem'},
+    #            {'KID': '2026-07', 'ALGORITHM': 'ES256', 'PUBLIC_KEY_FILE': '/run/secrets/jwt-2026-07.pub'}]
+    'SIGNING_KEYS': [],
+    'JWKS_MAX_AGE': 300,
+    # Параллельные 401 фронтенда отправляют несколько token/refresh/ с одним
+    # токеном; CACHES не настроен, поэтому объединение — внутри процесса.
+    'REFRESH_COALESCING_WINDOW': 10,
+    'REFRESH_COALESCING_CACHE': None,
+    'DATABASE_REPLICAS': DATABASE_REPLICAS,
+    # Верхняя граница отставания реплик.
+    'REPLICA_STICKY_SECONDS': 5,
+    'REPLICA_STICKY_CACHE': None,
+    'ACCESS_RULE_BULK_LIMIT': 10000,
+    'ADMIN_PAGE_SIZE': 100,
+    'ADMIN_MAX_PAGE_SIZE': 1000,
+    'ESTIMATED_COUNT_THRESHOLD': 100000,
+    'USER_PROVISIONING_LIMIT': 100,
+    'PROVISIONING_HASHING_WORKERS': int(os.environ.get('PROVISIONING_HASHING_WORKERS', 2)),
+    'PROVISIONING_POOL_MIN_BATCH': 16,
+}
@@ -0,0 +1,44 @@
+"""
+Production-настройки: DJANGO_SETTINGS_MODULE=my_project.settings_production
+(задается в gunicorn.conf.py).
+
+Соединения с Postgres берутся из пула psycopg 3 (requirements-production.txt)
+с проверкой соединения при выдаче и пересозданием по max_lifetime.
+DATABASE_POOL=0 — постоянные соединения без пула (CONN_MAX_AGE и
+CONN_HEALTH_CHECKS), например для psycopg2.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+DEBUG = False
+
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', 'localhost').split(',')
+
+if os.environ.get('DATABASE_POOL', '1') == '1':
+    # Пул на каждый процесс-воркер: соединений с одной базой не больше
+    # workers * DATABASE_POOL_MAX_SIZE.
+    DATABASE_POOL_OPTIONS = {
+        'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 1)),
+        'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 4)),
+        'max_lifetime': float(os.environ.get('DATABASE_POOL_MAX_LIFETIME', 1800)),
+        'max_idle': float(os.environ.get('DATABASE_POOL_MAX_IDLE', 600)),
+        'timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', 5)),
+    }
+    for alias, database in DATABASES.items():
+        DATABASES[alias] = {
+            **database,
+            'CONN_MAX_AGE': 0,
+            # Django передает пулу check=ConnectionPool.check_connection сам,
+            # по CONN_HEALTH_CHECKS; ключ check в OPTIONS['pool'] недопустим.
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {**database.get('OPTIONS', {}), 'pool': DATABASE_POOL_OPTIONS},
+        }
+else:
+    for alias, database in DATABASES.items():
+        DATABASES[alias] = {
+            **database,
+            'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+        }
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_project.settings')
 
 application = get_wsgi_application()
+
+from core_auth.invalidation import enable_listener  # noqa: E402
+from core_auth.revocation import warm_up  # noqa: E402
+
+enable_listener()
+warm_up()